@@ -10,6 +10,8 @@ __version__     = "0.0.2"
 
 import txConfig
 import txDevMCP
+import txBase
+import txTimer
 
 import time, datetime
 import threading
@@ -31,6 +33,16 @@ import traceback
 
 DEVICES = []
 
+# Routing table: which devices to offer data read from a device to (built by
+# build_routes), and the same for commands, filled on first use of each
+# command
+ROUTES_DATA = {}
+ROUTES_CMD = {}
+ROUTES_CMD_MAX = 1024   # limit cache size; dial commands contain the number
+
+# Interval in s to poll devices which don't signal new data (see txBase)
+POLL_INTERVAL = 0.005
+
 # Path where this file is stored
 try:
     OUR_PATH = os.path.dirname(os.path.realpath(__file__))
@@ -280,6 +292,47 @@ def init():
 
 # =====
 
+def build_routes():
+    """
+    Precompute for each device which other devices are interested in its data
+    (see TelexBase.consumes_data and ignores_data_from). The order of DEVICES
+    is kept, so discarding data still works as before.
+    """
+    ROUTES_DATA.clear()
+    ROUTES_CMD.clear()
+
+    for in_device in DEVICES:
+        ROUTES_DATA[in_device] = [
+            out_device for out_device in DEVICES
+            if out_device is not in_device
+            and out_device.consumes_data
+            and in_device.id not in out_device.ignores_data_from
+        ]
+        skipped = [out_device.id for out_device in DEVICES if out_device is not in_device and out_device not in ROUTES_DATA[in_device]]
+        if skipped:
+            l.debug("Data from {!r} not routed to {!r}".format(in_device.id, skipped))
+
+
+def command_route(in_device, cmd:str) -> list:
+    """
+    Return the devices interested in command cmd read from in_device (see
+    TelexBase.consumes_commands).
+    """
+    key = (in_device, cmd)
+    route = ROUTES_CMD.get(key)
+    if route is None:
+        route = [
+            out_device for out_device in DEVICES
+            if out_device is not in_device
+            and (out_device.consumes_commands is None
+                 or cmd.startswith(out_device.consumes_commands))
+        ]
+        if len(ROUTES_CMD) < ROUTES_CMD_MAX:
+            ROUTES_CMD[key] = route
+    return route
+
+# =====
+
 def exit():
     global DEVICES
 
@@ -290,6 +343,8 @@ def exit():
         except Exception as e:
             pass
     DEVICES = []
+    ROUTES_DATA.clear()
+    ROUTES_CMD.clear()
     logging.shutdown()
     return
     # Comment out the return above to view non-terminating threads
@@ -304,35 +359,56 @@ def exit():
 def process_data():
     new_data = False
 
+    # Checked once per pass instead of formatting debug messages for every
+    # item only to have them thrown away (isEnabledFor is cached by logging
+    # and follows level changes)
+    debug = l.isEnabledFor(logging.DEBUG)
+
     for in_device in DEVICES:
         try:
-            c = in_device.read()
+            items = in_device.read_batch()
         except (KeyboardInterrupt, SystemExit):
             raise
         except Exception as e:
             l.warning("Uncaught Exception in {}.read(): {!r}".format(in_device.id, e))
-        if c:
+            continue
+        if items:
             new_data = True
-            l.debug("read {!r} from {!r}".format(c, in_device))
-            for out_device in DEVICES:
-                if out_device != in_device:
-                    l.debug("writing {!r} to {!r}".format(c, out_device))
-                    try:
-                        ret = out_device.write(c, in_device.id)
-                    except (KeyboardInterrupt, SystemExit):
-                        raise
-                    except Exception as e:
-                        l.warning("Uncaught Exception in {}.write({!r}), {!r}: {!r}".format(out_device.id, c, in_device.id, e))
-                    if ret:
-                        l.debug("writing returned {!r}".format(ret))
-                        break   # stop writing to other devices (discard data)
+            if debug:
+                l.debug("read %r from %r", items, in_device)
+            if len(items[0]) == 1:
+                route = ROUTES_DATA[in_device]
+            else:
+                route = command_route(in_device, items[0])
+            for out_device in route:
+                if debug:
+                    l.debug("writing %r to %r", items, out_device)
+                try:
+                    items = out_device.write_batch(items, in_device.id)
+                except (KeyboardInterrupt, SystemExit):
+                    raise
+                except Exception as e:
+                    l.warning("Uncaught Exception in {}.write({!r}), {!r}: {!r}".format(out_device.id, items, in_device.id, e))
+                if not items:
+                    if debug:
+                        l.debug("writing to %r discarded all data", out_device)
+                    break   # stop writing to other devices (discard data)
 
     return new_data
 
 # -----
 
-def process_idle():
-    for device in DEVICES:
+def devices_implementing(method:str) -> list:
+    """
+    Return all devices overriding the given idle method of txBase.TelexBase.
+    """
+    base_method = getattr(txBase.TelexBase, method)
+    return [device for device in DEVICES if getattr(type(device), method, base_method) is not base_method]
+
+# -----
+
+def process_idle(devices:list):
+    for device in devices:
         try:
             device.idle()
         except (KeyboardInterrupt, SystemExit):
@@ -342,8 +418,8 @@ def process_idle():
 
 # -----
 
-def process_idle20Hz():
-    for device in DEVICES:
+def process_idle20Hz(devices:list):
+    for device in devices:
         try:
             device.idle20Hz()
         except (KeyboardInterrupt, SystemExit):
@@ -353,8 +429,8 @@ def process_idle20Hz():
 
 # -----
 
-def process_idle2Hz():
-    for device in DEVICES:
+def process_idle2Hz(devices:list):
+    for device in devices:
         try:
             device.idle2Hz()
         except (KeyboardInterrupt, SystemExit):
@@ -383,37 +459,52 @@ def main():
 
     #test()   # for debug only
     init()
+    build_routes()
 
     print(f'\n\033[0;30;47m -= TELEX (Rev. {ReleaseInfo.get_release_info()}) =-\033[0m\n')
 
-    time_2Hz = time.monotonic()
-    time_20Hz = time.monotonic()
-    time_200Hz = time.monotonic()
-    sleep_time = 0.001
+    # Periodic idle ticks. Only install the ones at least one device actually
+    # implements, and call only those devices, so an idle piTelex doesn't wake
+    # up 200 times a second for nothing. The 200 Hz tick is only active while
+    # one of its devices has work to do (see txBase.TelexBase.needs_idle).
+    timers = txTimer.TimerQueue()
+    idle_devices = devices_implementing('idle')
+    if idle_devices:
+        timers.add(0.005, lambda: process_idle(idle_devices),
+            active=lambda: any(device.needs_idle() for device in idle_devices))
+    idle20Hz_devices = devices_implementing('idle20Hz')
+    if idle20Hz_devices:
+        timers.add(0.050, lambda: process_idle20Hz(idle20Hz_devices))
+    idle2Hz_devices = devices_implementing('idle2Hz')
+    if idle2Hz_devices:
+        timers.add(0.500, lambda: process_idle2Hz(idle2Hz_devices))
+
+    # Devices not signalling new data by txBase.notify_data_ready() are polled
+    # at the rate of the former idle loop. None of the bundled devices need
+    # this any more; it's kept for third-party devices.
+    polled_devices = [device.id for device in DEVICES if device.needs_polling]
+    if polled_devices:
+        l.debug("Polling devices: {!r}".format(polled_devices))
 
     try:
         while True:
-            time_act = int(time.monotonic() * 1000)   # time in ms
+            # Clear before reading: data queued while we're busy routing will
+            # set the event again and keep us from blocking below.
+            txBase.data_ready.clear()
 
             new_data = process_data()
-            if new_data:
-                sleep_time = 0.0001
-
-            if (time_act - time_200Hz) >= 5:
-                time_200Hz = time_act
-                process_idle()
 
-                if (time_act - time_20Hz) >= 50:
-                    time_20Hz = time_act
-                    process_idle20Hz()
+            # Idle handlers may queue new data (e.g. MCP answers), so check
+            # again right away if any of them have been run.
+            if timers.process() or new_data:
+                continue
 
-                    if (time_act - time_2Hz) >= 500:
-                        time_2Hz = time_act
-                        process_idle2Hz()
+            timeout = timers.time_to_next()
+            if polled_devices and (timeout is None or timeout > POLL_INTERVAL):
+                timeout = POLL_INTERVAL
 
-            time.sleep(sleep_time)   # update with max ??? Hz
-            if sleep_time < 0.010:
-                sleep_time += 0.0001
+            # Block until a device has new data or the next timer is due
+            txBase.data_ready.wait(timeout)
 
     except (KeyboardInterrupt, SystemExit):
         l.info('Exit by Keyboard')
@@ -0,0 +1,292 @@
+#!/usr/bin/python3
+"""
+Telex asyncio Support
+
+One asyncio event loop, running in its own thread, shared by all modules
+handling network connections with asyncio instead of a thread per
+connection. Modules hand coroutines to it by run() and get a
+concurrent.futures.Future back.
+
+For protocol code written for blocking sockets (i-Telex connection_steps),
+StreamSocket provides the socket methods used for sending, and
+drive_connection feeds it with received data.
+
+Periodic background jobs (e.g. i-Telex self-test and TNS update) run on the
+same loop as PeriodicJob, see schedule(), instead of a sleeping thread each.
+"""
+__author__      = "Jochen Krapf"
+__email__       = "jk@nerd2nerd.org"
+__copyright__   = "Copyright 2020, JK"
+__license__     = "GPL3"
+__version__     = "0.0.1"
+
+import asyncio
+import math
+import random
+import socket
+import threading
+import time
+
+import logging
+l = logging.getLogger("piTelex." + __name__)
+
+_loop = None
+_loop_lock = threading.Lock()
+
+#######
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """
+    Return the shared event loop; on first call, create it and start its
+    thread. The thread is a daemon so that it doesn't keep piTelex from
+    quitting.
+    """
+    global _loop
+
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='txAsync', daemon=True).start()
+            l.debug("Event loop started")
+        return _loop
+
+
+def run(coro):
+    """
+    Schedule coroutine coro on the shared event loop (thread-safe). Return a
+    concurrent.futures.Future for its result.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def call_soon(callback, *args):
+    """Call callback(*args) from the shared event loop (thread-safe)."""
+    get_loop().call_soon_threadsafe(callback, *args)
+
+#######
+
+class StreamSocket:
+    """
+    Socket-like wrapper for an asyncio stream, for code which sends by
+    sendall(). Sending never blocks: the data is buffered by the stream's
+    transport, see drive_connection for flow control.
+    """
+    def __init__(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter):
+        self._reader = reader
+        self._writer = writer
+
+
+    def sendall(self, data:bytes):
+        if self._writer.is_closing():
+            raise BrokenPipeError("Stream is closed")
+        self._writer.write(bytes(data))
+
+
+    def getpeername(self):
+        return self._writer.get_extra_info('peername')
+
+
+    def close(self):
+        self._writer.close()
+
+# =====
+
+async def drive_connection(steps, reader:asyncio.StreamReader, writer:asyncio.StreamWriter, tick:float=0.2):
+    """
+    asyncio driver for generators like TelexITelexCommon.connection_steps:
+    read what the generator asks for and send it in, or throw in the error
+    that occurred. If nothing is received for tick seconds, socket.timeout is
+    thrown in, as with a blocking socket with timeout.
+    """
+    try:
+        size = next(steps)
+        while True:
+            try:
+                data = await asyncio.wait_for(reader.read(size), tick)
+            except asyncio.TimeoutError:
+                size = steps.throw(socket.timeout("timed out"))
+            except Exception as e:
+                size = steps.throw(e)
+            else:
+                size = steps.send(data)
+
+            # Don't let the send buffer grow without limit if the remote
+            # doesn't keep up. Errors will show up on the next sendall.
+            try:
+                await writer.drain()
+            except Exception:
+                pass
+
+    except StopIteration:
+        pass
+
+#######
+
+# Due times of periodic jobs are rounded up to multiples of this (s), so that
+# jobs falling due at about the same time wake the loop only once
+COALESCE = 1.0
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+class PeriodicJob:
+    """
+    Coroutine function run periodically on the shared event loop; see
+    schedule().
+
+    The interval is varied randomly by +-jitter (fraction), so that many
+    piTelex stations don't all contact a server at the same moment. The
+    result of the last run (or the exception raised) is kept, with the time
+    it was obtained, and handed to all listeners, which are called from the
+    event loop thread and must not block.
+
+    trigger() runs the job as soon as possible; triggering it while it runs
+    makes it run once more afterwards, not once per trigger.
+    """
+    def __init__(self, key, func, interval:float, jitter:float=0.1):
+        self.key = key
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        # Result of the last run and its time.time()
+        self.result = None
+        self.result_time = None
+        self.runs = 0
+        self._listeners = []
+        self._handle = None
+        self._running = False
+        self._again = False
+        self._cancelled = False
+
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+
+    def remove_listener(self, callback) -> int:
+        """Remove callback; return number of listeners left."""
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+        return len(self._listeners)
+
+
+    def trigger(self):
+        """Run job now (thread-safe)."""
+        call_soon(self._trigger)
+
+
+    def cancel(self):
+        """Stop running the job (thread-safe)."""
+        call_soon(self._cancel)
+
+
+    def status(self) -> dict:
+        """Return last result, its time and the number of runs so far."""
+        return {'result': self.result, 'time': self.result_time, 'runs': self.runs}
+
+    # =====
+
+    def _schedule(self, delay:float):
+        loop = get_loop()
+        due = math.ceil((loop.time() + delay) / COALESCE) * COALESCE
+        self._handle = loop.call_at(due, self._start)
+
+
+    def _next_delay(self) -> float:
+        return self.interval * (1 + self.jitter * (2 * random.random() - 1))
+
+
+    def _trigger(self):
+        if self._cancelled:
+            return
+        if self._running:
+            self._again = True
+            return
+        if self._handle:
+            self._handle.cancel()
+        self._start()
+
+
+    def _cancel(self):
+        self._cancelled = True
+        if self._handle:
+            self._handle.cancel()
+
+
+    def _start(self):
+        self._handle = None
+        self._running = True
+        get_loop().create_task(self._run())
+
+
+    async def _run(self):
+        # Clear _running also if the task is cancelled (CancelledError isn't
+        # an Exception), or trigger() would do nothing from then on
+        try:
+            try:
+                result = await self.func()
+            except Exception as e:
+                l.debug("Periodic job {!r} failed: {!r}".format(self.key, e))
+                result = e
+            self.result = result
+            self.result_time = time.time()
+            self.runs += 1
+            for callback in list(self._listeners):
+                try:
+                    callback(result)
+                except Exception as e:
+                    l.warning("Periodic job {!r}: listener failed: {!r}".format(self.key, e))
+        finally:
+            self._running = False
+        if self._cancelled:
+            return
+        if self._again:
+            self._again = False
+            self._start()
+        else:
+            self._schedule(self._next_delay())
+
+
+def schedule(key, func, interval:float, first:float=None, jitter:float=0.1, listener=None) -> PeriodicJob:
+    """
+    Run coroutine function func every interval seconds (first run after
+    first seconds, default: one interval) on the shared event loop; return
+    its PeriodicJob. listener, if given, is called with every result.
+
+    Jobs are identified by key: if a job with the same key is scheduled
+    already (e.g. by another module instance for the same purpose), that one
+    is returned and listener is added to it instead of running the same job
+    twice. As the job keeps running func of the instance which scheduled it
+    first, func must not depend on that instance: if it is a method bound to
+    an object, the object becomes part of the key, so that only callers
+    with the same object share the job (a classmethod or a
+    functools.partial of a plain function is shared by all).
+    """
+    owner = getattr(func, '__self__', None)
+    if owner is not None:
+        key = (key, id(owner))
+    with _jobs_lock:
+        job = _jobs.get(key)
+        if job is None:
+            job = _jobs[key] = PeriodicJob(key, func, interval, jitter)
+            if first is None:
+                first = job._next_delay()
+            call_soon(job._schedule, first)
+        if listener:
+            job.add_listener(listener)
+    return job
+
+
+def unschedule(job:PeriodicJob, listener=None):
+    """
+    Remove listener from job; stop the job when it has no listeners left (or
+    if none has been given).
+    """
+    with _jobs_lock:
+        if listener and job.remove_listener(listener):
+            return
+        if _jobs.get(job.key) is job:
+            del _jobs[job.key]
+    job.cancel()
+
+#######
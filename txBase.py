@@ -8,7 +8,46 @@ __copyright__   = "Copyright 2018, JK"
 __license__     = "GPL3"
 __version__     = "0.0.1"
 
+import threading
+
 import txCode
+import txBuffer
+
+#######
+
+# Set by any device that has queued new data for the main loop. The main loop
+# blocks on this event while idle (see telex.main), so devices filling their
+# read buffer from a thread of their own should call notify_data_ready() to
+# get their data routed immediately.
+data_ready = threading.Event()
+
+def notify_data_ready():
+    data_ready.set()
+
+# Maximum number of characters moved by the main loop in one batch
+BATCH_SIZE = txBuffer.BATCH_SIZE
+
+def pop_batch(buffer:list, limit:int=BATCH_SIZE) -> list:
+    """
+    Pop the next batch from the front of a device's read buffer (a list or
+    txBuffer.Buffer of single characters and commands). A batch is either a
+    run of up to limit data characters or a single command (any item not of
+    length 1), so that commands keep their position relative to the data
+    around them.
+    """
+    if isinstance(buffer, txBuffer.Buffer):
+        return buffer.pop_batch(limit)
+    if not buffer:
+        return []
+    if len(buffer[0]) != 1:
+        return [buffer.pop(0)]
+    n = 1
+    end = min(len(buffer), limit)
+    while n < end and len(buffer[n]) == 1:
+        n += 1
+    items = buffer[:n]
+    del buffer[:n]
+    return items
 
 #######
 
@@ -17,6 +56,23 @@ class TelexBase:
         self.id = '???'
         self.loopback = True
 
+        # True if read() has to be polled regularly because the device doesn't
+        # call notify_data_ready() when it has new data (e.g. reading from a
+        # serial port or the keyboard inside of read()).
+        self.needs_polling = True
+
+        # What write() is interested in; telex.py builds its routing table
+        # from this once at startup and doesn't offer anything else:
+        # - consumes_data: False if write() ignores all data characters
+        # - consumes_commands: None for all commands, otherwise a tuple of
+        #   command prefixes write() reacts to (empty tuple: no commands)
+        # - ignores_data_from: ids of devices whose data write() ignores
+        # A device must never discard (return True) anything it declares not
+        # to consume.
+        self.consumes_data = True
+        self.consumes_commands = None
+        self.ignores_data_from = ()
+
 
     def __del__(self):
         #print('__del__ in TelexSerial')
@@ -30,9 +86,40 @@ class TelexBase:
     def write(self, a:str, source:str):
         pass
 
+
+    def read_batch(self) -> list:
+        """
+        Return the next batch of items to be routed by the main loop (see
+        pop_batch for what makes up a batch). Devices producing a lot of data
+        should override this; the default returns a single read() item.
+        """
+        a = self.read()
+        return [a] if a else []
+
+
+    def write_batch(self, items:list, source:str) -> list:
+        """
+        Write a batch of items from device source. Return the items to be
+        passed on to the following devices; items for which write() returned
+        True are discarded, just like in the per-item case.
+        """
+        passed = []
+        for a in items:
+            if not self.write(a, source):
+                passed.append(a)
+        return passed
+
     def idle(self):
         pass
 
+    def needs_idle(self) -> bool:
+        """
+        Return True if idle() has work to do. The main loop runs the 200 Hz
+        idle tick only while a device implementing idle() returns True, so
+        devices that only need it while e.g. sending should override this.
+        """
+        return True
+
     def idle20Hz(self):
         pass
 
@@ -42,5 +129,8 @@ class TelexBase:
     def exit(self):
         pass
 
+    def notify_data_ready(self):
+        notify_data_ready()
+
 #######
 
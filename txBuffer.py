@@ -0,0 +1,197 @@
+#!/usr/bin/python3
+"""
+Telex Buffer - queue of characters and commands for the devices' rx and tx
+buffers
+"""
+__author__      = "Jochen Krapf"
+__email__       = "jk@nerd2nerd.org"
+__copyright__   = "Copyright 2020, JK"
+__license__     = "GPL3"
+__version__     = "0.0.1"
+
+from collections import deque
+
+import logging
+l = logging.getLogger("piTelex." + __name__)
+
+# Maximum number of characters moved by the main loop in one batch
+BATCH_SIZE = 256
+
+#######
+
+class Buffer(deque):
+    """
+    FIFO of items (single characters and commands) between a device and the
+    main loop or a device's worker thread.
+
+    Based on collections.deque: appending and popping at either end is O(1)
+    and thread-safe without a lock (single operations only; use a lock if
+    several operations have to be consistent, like the i-Telex rx buffer
+    does). len() is O(1).
+
+    Besides the deque methods, pop(index) works like list.pop, so that code
+    written for lists keeps working, and there are methods for popping many
+    items at once.
+    """
+
+    def pop(self, index:int=-1):
+        """Remove and return item at index (default last), like list.pop."""
+        if index == 0:
+            return super().popleft()
+        if index == -1:
+            return super().pop()
+        item = self[index]
+        super().__delitem__(index)
+        return item
+
+
+    def push(self, item):
+        """Append a single item."""
+        self.append(item)
+
+
+    def push_many(self, items):
+        """Append all items of an iterable (e.g. the characters of a str)."""
+        self.extend(items)
+
+
+    def pop_many(self, count:int) -> list:
+        """Remove and return up to count items from the front."""
+        popleft = super().popleft
+        return [popleft() for _ in range(min(count, len(self)))]
+
+
+    def pop_all(self) -> list:
+        """Remove and return all items."""
+        return self.pop_many(len(self))
+
+
+    def pop_batch(self, limit:int=BATCH_SIZE) -> list:
+        """
+        Remove and return the next batch for the main loop: either a run of
+        up to limit data characters or a single command (any item not of
+        length 1), so that commands keep their position relative to the data
+        around them.
+        """
+        if not self:
+            return []
+        popleft = super().popleft
+        if len(self[0]) != 1:
+            return [popleft()]
+        items = [popleft()]
+        while self and len(items) < limit and len(self[0]) == 1:
+            items.append(popleft())
+        return items
+
+#######
+
+class CountingBuffer(Buffer):
+    """
+    Buffer which keeps count of the data items in it, i.e. all items except
+    commands (starting with ESC), so that data_len() is O(1) instead of a
+    scan of the whole buffer.
+
+    The count is updated by every method adding or removing items. Its
+    update isn't atomic with the deque operation: if several threads modify
+    the buffer, they have to hold a common lock (like the i-Telex rx buffer
+    with its _rx_lock).
+    """
+
+    def __init__(self, iterable=(), maxlen=None):
+        if maxlen is not None:
+            # Items dropped at the other end wouldn't be counted
+            raise ValueError("CountingBuffer can't have a maxlen")
+        super().__init__(iterable)
+        self._data_len = self._count(self)
+
+
+    @staticmethod
+    def _count(items) -> int:
+        return sum(1 for i in items if not i.startswith('\x1b'))
+
+
+    def data_len(self) -> int:
+        """Return number of data items (non-commands) in the buffer."""
+        return self._data_len
+
+    # -----
+
+    def append(self, item):
+        super().append(item)
+        if not item.startswith('\x1b'):
+            self._data_len += 1
+
+
+    def appendleft(self, item):
+        super().appendleft(item)
+        if not item.startswith('\x1b'):
+            self._data_len += 1
+
+
+    def extend(self, items):
+        if isinstance(items, str):
+            # Characters of a text are data items
+            super().extend(items)
+            self._data_len += len(items)
+        else:
+            items = list(items)
+            super().extend(items)
+            self._data_len += self._count(items)
+
+
+    def extendleft(self, items):
+        items = list(items)
+        super().extendleft(items)
+        self._data_len += self._count(items)
+
+
+    def insert(self, index:int, item):
+        super().insert(index, item)
+        if not item.startswith('\x1b'):
+            self._data_len += 1
+
+
+    def popleft(self):
+        item = super().popleft()
+        if not item.startswith('\x1b'):
+            self._data_len -= 1
+        return item
+
+
+    def pop(self, index:int=-1):
+        item = super().pop(index)
+        if not item.startswith('\x1b'):
+            self._data_len -= 1
+        return item
+
+
+    def __delitem__(self, index:int):
+        item = self[index]
+        super().__delitem__(index)
+        if not item.startswith('\x1b'):
+            self._data_len -= 1
+
+
+    def remove(self, item):
+        super().remove(item)
+        if not item.startswith('\x1b'):
+            self._data_len -= 1
+
+
+    def clear(self):
+        super().clear()
+        self._data_len = 0
+
+
+    def pop_many(self, count:int) -> list:
+        items = super().pop_many(count)
+        self._data_len -= self._count(items)
+        return items
+
+
+    def pop_batch(self, limit:int=BATCH_SIZE) -> list:
+        items = super().pop_batch(limit)
+        self._data_len -= self._count(items)
+        return items
+
+#######
@@ -18,6 +18,12 @@ l = logging.getLogger("piTelex." + __name__)
 
 #######
 
+# Bit flipping: reverse the order of the 5 data bits, e.g. 0b00011 -> 0b11000.
+# Covers all byte values; bits above the 5 data bits are dropped.
+_FLIP_TABLE = bytes(int('{:05b}'.format(b & 0x1F)[::-1], 2) for b in range(256))
+
+#######
+
 class BaudotMurrayCode:
     # Baudot-Murray-Code to ASCII table
     _LUT_BM2A_ITA2 = (
@@ -91,6 +97,15 @@ class BaudotMurrayCode:
     CODING_MKT2 = 2
     CODING_ZUSE = 3
 
+    # Encoding tables per (LUT, flip_bits), built on first use by
+    # _get_encode_table
+    _encode_tables = {}
+
+    # Translation table for ascii_to_tty_text (code point -> replacement) and
+    # the characters it already contains; both grow as new characters appear
+    _tty_text_table = {}
+    _tty_text_known = set()
+
     # =====
 
     @staticmethod
@@ -106,50 +121,96 @@ class BaudotMurrayCode:
 
         Ensure that text is an iterable containing already-decoded Python
         strings, not bytes.
-        """
-        ret = ''
 
+        Characters are converted by str.translate; the translation table is
+        extended by the characters of text not seen before.
+        """
         text = text.upper()
 
-        for a in text:
-            try:
-                if a not in BaudotMurrayCode._valid_ASCII_convert_chars:
-                    if a in BaudotMurrayCode._LUT_convert_chars:
-                        a = BaudotMurrayCode._LUT_convert_chars.get(a, '?')
-                    else:
-                        nkfd_norm = unicodedata.normalize('NFKD', a)
-                        a =  u"".join([c for c in nkfd_norm if not unicodedata.combining(c)])
-                        #a = unicodedata.normalize('NFD', a).encode('ascii', 'ignore')
-                        #a = unidecode(a)
-                        if a not in BaudotMurrayCode._valid_ASCII_convert_chars:
-                            a = '?'
-                ret += a
-            except:
-                pass
+        table = BaudotMurrayCode._tty_text_table
+        for a in set(text).difference(BaudotMurrayCode._tty_text_known):
+            b = BaudotMurrayCode._tty_text_char(a)
+            if b != a:
+                # Characters left as they are don't need an entry
+                table[ord(a)] = b
+            BaudotMurrayCode._tty_text_known.add(a)
 
-        return ret
+        return text.translate(table)
+
+    # -----
+
+    @staticmethod
+    def _tty_text_char(a:str) -> str:
+        ''' return teleprinter replacement for a single (upper case) character '''
+        if a not in BaudotMurrayCode._valid_ASCII_convert_chars:
+            if a in BaudotMurrayCode._LUT_convert_chars:
+                a = BaudotMurrayCode._LUT_convert_chars.get(a, '?')
+            else:
+                nkfd_norm = unicodedata.normalize('NFKD', a)
+                a =  u"".join([c for c in nkfd_norm if not unicodedata.combining(c)])
+                #a = unicodedata.normalize('NFD', a).encode('ascii', 'ignore')
+                #a = unidecode(a)
+                if a not in BaudotMurrayCode._valid_ASCII_convert_chars:
+                    a = '?'
+        return a
 
     # -----
 
     @staticmethod
     def do_flip_bits(code: bytes) -> bytes:
-        ret = bytearray()
+        ''' reverse the order of the 5 data bits of each code (upper bits are dropped) '''
+        try:
+            return bytearray(code).translate(_FLIP_TABLE)
+        except (TypeError, ValueError):
+            # Not a sequence of byte values, e.g. list containing ints > 255
+            return bytearray(_FLIP_TABLE[b & 0x1F] for b in code)
 
-        for b in code:
-            rb = 0
-            if b & 1:
-                rb |= 16
-            if b & 2:
-                rb |= 8
-            if b & 4:
-                rb |= 4
-            if b & 8:
-                rb |= 2
-            if b & 16:
-                rb |= 1
-            ret.append(rb)
+    # -----
 
-        return ret
+    @classmethod
+    def _get_encode_table(cls, LUT_BM2A:tuple, LUT_BMsw:tuple, flip_bits:bool) -> tuple:
+        """
+        Return the encoding table for the given coding: for each mode (layer)
+        a dict mapping every encodable character to a tuple (bytes to send,
+        mode afterwards).
+
+        The table reproduces the former search on the LUT strings: first the
+        current layer (first occurrence; if the code found is a switch code,
+        e.g. for '<' and '>', the mode changes accordingly), then the other
+        layers in ascending order (modulo number of layers), prepending the
+        switch code of the layer found.
+        """
+        key = (LUT_BM2A, flip_bits)
+        table = cls._encode_tables.get(key)
+        if table is not None:
+            return table
+
+        layers = len(LUT_BM2A)
+        chars = set(''.join(LUT_BM2A))
+        table = []
+        for mode in range(layers):
+            codes = {}
+            for a in chars:
+                if a in LUT_BM2A[mode]:
+                    b = LUT_BM2A[mode].index(a)
+                    bb = bytes([b])
+                    new_mode = LUT_BMsw.index(b) if b in LUT_BMsw else mode
+                else:
+                    for nm in ((mode + 1) % layers, (mode + 2) % layers):
+                        if a in LUT_BM2A[nm]:
+                            bb = bytes([LUT_BMsw[nm], LUT_BM2A[nm].index(a)])
+                            new_mode = nm
+                            break
+                    else:   # symbol not found -> ignore
+                        continue
+                if flip_bits:
+                    bb = bytes(cls.do_flip_bits(bb))
+                codes[a] = (bb, new_mode)
+            table.append(codes)
+
+        table = tuple(table)
+        cls._encode_tables[key] = table
+        return table
 
     # =====
 
@@ -173,6 +234,9 @@ class BaudotMurrayCode:
         else:
             self._LUT_BM2A = self._LUT_BM2A_ITA2
             self._LUT_BMsw = self._LUT_BMsw_ITA2
+        self._encode_table = self._get_encode_table(self._LUT_BM2A, self._LUT_BMsw, flip_bits)
+        # Switch code -> mode, for decoding
+        self._decode_switch = {b: mode for mode, b in enumerate(self._LUT_BMsw)}
 
     # -----
 
@@ -183,6 +247,40 @@ class BaudotMurrayCode:
 
     def encodeA2BM(self, ascii:str) -> bytes:
         ''' convert an ASCII string to a list of baudot-murray-coded bytes '''
+        ret, _ = self._encode(ascii)
+        self._loop_back_add(len(ret))
+        return ret
+
+    # -----
+
+    def encode_many(self, texts) -> list:
+        '''
+        convert a sequence of ASCII strings (e.g. the lines of a file) to a
+        list of baudot-murray-coded bytearrays, one per string; same result as
+        calling encodeA2BM for each of them
+        '''
+        ret = [self._encode(ascii)[0] for ascii in texts]
+        self._loop_back_add(sum(len(bb) for bb in ret))
+        return ret
+
+    # -----
+
+    def encode_limited(self, ascii:str, limit:int) -> tuple:
+        '''
+        convert the beginning of an ASCII string to at most limit
+        baudot-murray-coded bytes (mode switches included; the first
+        character is always converted, even if its mode switch exceeds the
+        limit); return the bytes and the number of characters converted, so
+        that the caller can keep the rest for later
+        '''
+        ret, used = self._encode(ascii, limit)
+        self._loop_back_add(len(ret))
+        return ret, used
+
+    # -----
+
+    def _encode(self, ascii:str, limit:int=None) -> tuple:
+        ''' return (bytes, characters converted), see encode_limited '''
         ret = bytearray()
 
         if not isinstance(ascii, str):
@@ -190,62 +288,93 @@ class BaudotMurrayCode:
 
         ascii = ascii.upper()
 
-        if self._mode is None:
+        if self._mode is None and (limit is None or limit > 0):
             self._mode = 0  # letters
             ret.append(self._LUT_BMsw[self._mode])
+            if self._flip_bits:
+                ret = self.do_flip_bits(ret)
+
+        # One lookup per character; mode switches (and bit flipping) are
+        # already contained in the table entries, unknown symbols are ignored
+        table = self._encode_table
+        mode = self._mode
+        codes = []
+        used = len(ascii)
+        if limit is None:
+            # Bulk conversion: no size check in the loop
+            for a in ascii:
+                entry = table[mode].get(a)
+                if entry:
+                    codes.append(entry[0])
+                    mode = entry[1]
+        else:
+            size = len(ret)
+            for n, a in enumerate(ascii):
+                entry = table[mode].get(a)
+                if entry:
+                    size += len(entry[0])
+                    if size > limit and n:
+                        used = n
+                        break
+                    codes.append(entry[0])
+                    mode = entry[1]
+        self._mode = mode
+        ret += b''.join(codes)
+
+        return ret, used
 
-        for a in ascii:
-            try:  # symbol in current layer?
-                nm = self._mode
-                b = self._LUT_BM2A[nm].index(a)
-                ret.append(b)
-                if b in self._LUT_BMsw:  # explicit Bu or Zi
-                    self._mode = self._LUT_BMsw.index(b)
-            except ValueError:
-                try:  # symbol in other layer?
-                    nm += 1
-                    if nm >= len(self._LUT_BM2A):
-                        nm = 0
-                    b = self._LUT_BM2A[nm].index(a)
-                    ret.append(self._LUT_BMsw[nm])
-                    ret.append(b)
-                    self._mode = nm
-                except ValueError:
-                    try:  # symbol in other layer?
-                        nm += 1
-                        if nm >= len(self._LUT_BM2A):
-                            nm = 0
-                        b = self._LUT_BM2A[nm].index(a)
-                        ret.append(self._LUT_BMsw[nm])
-                        ret.append(b)
-                        self._mode = nm
-                    except:  # symbol not found -> ignore
-                        pass
-            except:  # unknown -> ignore
-                pass
-
-        if ret and self._flip_bits:
-            ret = self.do_flip_bits(ret)
+    # -----
 
+    def _loop_back_add(self, length:int):
+        ''' account for length bytes sent, which will be echoed back '''
         if self._loop_back:
-            length  = len(ret)
             self._loop_back_eat_bytes += length
             time_act = time.monotonic()
             if self._loop_back_expire_time < time_act:
                 self._loop_back_expire_time = time_act
             self._loop_back_expire_time += length * self._character_duration
 
-        return ret
-
     # -----
 
     def decodeBM2A(self, code:bytes) -> str:
         ''' convert a list/bytearray of baudot-murray-coded bytes to an ASCII string '''
-        ret = ''
-
         if self._flip_bits:
             code = self.do_flip_bits(code)
 
+        return self._decode(code)
+
+    # -----
+
+    def decode_many(self, codes) -> list:
+        '''
+        convert a sequence of baudot-murray-coded byte strings (e.g. received
+        packets or the blocks of a punch tape file) to a list of ASCII
+        strings, one per byte string; same result as calling decodeBM2A for
+        each of them
+        '''
+        if self._flip_bits:
+            # Flip all at once, then cut into the original pieces again
+            codes = [bytes(code) for code in codes]
+            flipped = self.do_flip_bits(b''.join(codes))
+            pieces = []
+            start = 0
+            for code in codes:
+                pieces.append(flipped[start:start + len(code)])
+                start += len(code)
+            codes = pieces
+
+        return [self._decode(code) for code in codes]
+
+    # -----
+
+    def _decode(self, code:bytes) -> str:
+        ret = []
+
+        LUT_BM2A = self._LUT_BM2A
+        decode_switch = self._decode_switch
+        show_BuZi = self._show_BuZi
+        mode = self._mode
+
         for b in code:
             if self._loop_back and self._loop_back_eat_bytes:
                 if time.monotonic()-self._loop_back_expire_time > 6:   # about 40 characters
@@ -257,27 +386,25 @@ class BaudotMurrayCode:
                     continue
 
             try:
-                if b in self._LUT_BMsw:
-                    mode = self._LUT_BMsw.index(b)
-                    if self._mode != mode:
-                        self._mode = mode
-                        if self._show_BuZi == 0: # no BuZi
+                if b in decode_switch:
+                    new_mode = decode_switch[b]
+                    if mode != new_mode:
+                        mode = new_mode
+                        if show_BuZi == 0: # no BuZi
                             continue
-                    if self._show_BuZi <= 1: # explicit BuZi
+                    if show_BuZi <= 1: # explicit BuZi
                         continue
 
                 if b >= 0x20:
-                    ret += '{?#' + hex(b)[2:] + '}'
-                elif self._mode is None:
-                    ret += '{?'
-                    ret += self._LUT_BM2A[0][b]
-                    ret += self._LUT_BM2A[1][b]
-                    ret += '}'
+                    ret.append('{?#' + hex(b)[2:] + '}')
+                elif mode is None:
+                    ret.append('{?' + LUT_BM2A[0][b] + LUT_BM2A[1][b] + '}')
                 else:
-                    ret += self._LUT_BM2A[self._mode][b]
+                    ret.append(LUT_BM2A[mode][b])
             except:
-                ret += '{!}'  # debug
+                ret.append('{!}')  # debug
 
-        return ret
+        self._mode = mode
+        return ''.join(ret)
 
 #######
@@ -31,6 +31,9 @@ class TelexArchive(txBase.TelexBase):
 
         self.id = 'Arc'
         self.params = params
+        self.needs_polling = False
+        # Don't archive Babelfish translations (see write)
+        self.ignores_data_from = ('Baf',)
 
         self._current_msg = []
         # Internal states:
@@ -20,6 +20,7 @@ import openai
 import txConfig
 import txCode
 import txBase
+import txBuffer
 
 l = logging.getLogger("piTelex." + __name__)
 
@@ -36,6 +37,7 @@ class TelexBabelfish(txBase.TelexBase):
         self.coding = txConfig.CFG.get('coding', 0)
         super().__init__()
         self.id = params.get('id', 'Baf')
+        self.needs_polling = False
         self.target_lang = params.get('Zielsprache', 'Deutsch')
         if (key := params.get('openai_api_key')):
             openai.api_key = key
@@ -45,13 +47,13 @@ class TelexBabelfish(txBase.TelexBase):
         self._translation = None
         self._out_buffer = []
         self._state_counter = 1
-        self._rx_buffer = []
+        self._rx_buffer = txBuffer.Buffer()
         self._last_pit_load = 0
         self._session_open = False
         l.info(f"{self.id} initialized with model: {OPENAI_MODEL}")
 
     def read(self) -> str:
-        return self._rx_buffer.pop(0) if self._rx_buffer else ''
+        return self._rx_buffer.popleft() if self._rx_buffer else ''
 
     def write(self, data: str, source: str):
         if source == 'iTs':
@@ -13,6 +13,7 @@ __license__     = "GPL3"
 __version__     = "0.0.2"
 
 import serial
+from threading import Thread, Lock
 import time
 
 import logging
@@ -20,6 +21,7 @@ l = logging.getLogger("piTelex." + __name__)
 
 import txCode
 import txBase
+import txBuffer
 
 #def LOG(text:str, level:int=3):
 #    #log.LOG('\033[30;43m<'+text+'>\033[0m', level)
@@ -32,6 +34,7 @@ class TelexCH340TTY(txBase.TelexBase):
 
         self.id = 'chT'
         self.params = params
+        self.needs_polling = False
 
         portname = params.get('portname', '/dev/ttyUSB0')
         baudrate = params.get('baudrate', 50)
@@ -42,12 +45,13 @@ class TelexCH340TTY(txBase.TelexBase):
         inverse_dtr = params.get('inverse_dtr', False)
         self._local_echo = params.get('loc_echo', False)
 
-        self._rx_buffer = []
-        self._tx_buffer = []
+        self._rx_buffer = txBuffer.Buffer()
+        self._tx_buffer = txBuffer.Buffer()
         self._counter_LTRS = 0
         self._counter_FIGS = 0
         self._counter_dial = 0
         self._time_last_dial = 0
+        self._dial_lock = Lock()   # dial pulses are counted by the rx thread
         self._cts_stable = True   # rxd=Low
         self._cts_counter = 0
         self._time_squelch = 0
@@ -87,6 +91,13 @@ class TelexCH340TTY(txBase.TelexBase):
         self._set_enable(False)
         self._set_online(False)
 
+        # Received characters are read by a thread of its own, which wakes up
+        # the main loop, instead of polling the port in read()
+        self._tty.timeout = 0.5
+        self._run = True
+        self._rx_thread = Thread(target=self.thread_rx, name='CH340rx')
+        self._rx_thread.start()
+
     # -----
 
     def _set_mode(self, mode:str):
@@ -133,6 +144,8 @@ class TelexCH340TTY(txBase.TelexBase):
     # -----
 
     def exit(self):
+        self._run = False
+        self._rx_thread.join()
         self._tty.close()
 
     # -----
@@ -143,39 +156,8 @@ class TelexCH340TTY(txBase.TelexBase):
     # =====
 
     def read(self) -> str:
-        if self._tty.in_waiting:
-            a = ''
-
-            bb = self._tty.read(1)
-
-            if bb and (not self._use_squelch or time.monotonic() >= self._time_squelch):
-                if self._is_enabled or self._use_dedicated_line:
-                    if self._local_echo:
-                        self._tty.write(bb)
-                    
-                    a = self._mc.decodeBM2A(bb)
-
-                    if a:
-                        self._check_special_sequences(a)
-
-                elif self._is_online and self._use_pulse_dial:
-                    b = bb[0]
-
-                    if b == 0:   # break or idle mode
-                        pass
-                    elif (b & 0x13) == 0x10:   # valid dial pulse - min 3 bits = 40ms, max 5 bits = 66ms
-                        self._counter_dial += 1
-                        self._time_last_dial = time.monotonic()
-
-                self._cts_counter = 0
-
-                if a:
-                    self._rx_buffer.append(a)
-                    #if self._local_echo:
-                    #    self._tx_buffer.append(a)
-
         if self._rx_buffer:
-            ret = self._rx_buffer.pop(0)
+            ret = self._rx_buffer.popleft()
             return ret
 
     # -----
@@ -194,13 +176,17 @@ class TelexCH340TTY(txBase.TelexBase):
 
     # =====
 
+    def needs_idle(self) -> bool:
+        # idle() only sends the tx buffer
+        return bool(self._tx_buffer)
+
     def idle(self):
         if (not self._use_squelch) or time.monotonic() >= max(self._time_squelch, self._time_tx_lock):
             if self._tx_buffer:
                 aa = []
                 a = None
                 while a != '@' and self._tx_buffer:
-                    a = self._tx_buffer.pop(0)
+                    a = self._tx_buffer.popleft()
                     aa.append(a)
                     if a == '@':
                         # WRU received: lock sending until after 21 character's
@@ -209,7 +195,7 @@ class TelexCH340TTY(txBase.TelexBase):
                         self._time_tx_lock = time.monotonic() + 7.5*21/self._baudrate
 
                 aa = ''.join(aa)
-                self._tx_buffer = []
+                self._tx_buffer.clear()
                 bb = self._mc.encodeA2BM(aa)
                 if bb:
                     self._rx_buffer.append('\x1b~' + str(self._tty.out_waiting + len(bb)))
@@ -222,13 +208,14 @@ class TelexCH340TTY(txBase.TelexBase):
     def idle20Hz(self):
         time_act = time.monotonic()
 
-        if self._use_pulse_dial and self._counter_dial and (time_act - self._time_last_dial) > 0.2:
-            if self._counter_dial >= 10:
+        with self._dial_lock:
+            if self._use_pulse_dial and self._counter_dial and (time_act - self._time_last_dial) > 0.2:
+                if self._counter_dial >= 10:
+                    self._counter_dial = 0
+                a = str(self._counter_dial)
+                self._rx_buffer.append(a)
+                self._time_last_dial = time_act
                 self._counter_dial = 0
-            a = str(self._counter_dial)
-            self._rx_buffer.append(a)
-            self._time_last_dial = time_act
-            self._counter_dial = 0
 
         if self._use_cts:
             cts = not self._tty.cts != self._inverse_cts   # logical xor
@@ -257,6 +244,46 @@ class TelexCH340TTY(txBase.TelexBase):
 
     # -----
 
+    def thread_rx(self):
+        while self._run:
+            try:
+                bb = self._tty.read(1)   # blocks until timeout
+            except serial.SerialException as e:
+                l.warning("CH340TTY: read error: {!r}".format(e))
+                break
+
+            if not bb or (self._use_squelch and time.monotonic() < self._time_squelch):
+                continue
+
+            a = ''
+            if self._is_enabled or self._use_dedicated_line:
+                if self._local_echo:
+                    self._tty.write(bb)
+
+                a = self._mc.decodeBM2A(bb)
+
+                if a:
+                    self._check_special_sequences(a)
+
+            elif self._is_online and self._use_pulse_dial:
+                b = bb[0]
+
+                if b == 0:   # break or idle mode
+                    pass
+                elif (b & 0x13) == 0x10:   # valid dial pulse - min 3 bits = 40ms, max 5 bits = 66ms
+                    with self._dial_lock:
+                        self._counter_dial += 1
+                        self._time_last_dial = time.monotonic()
+
+            self._cts_counter = 0
+
+            if a:
+                self._rx_buffer.append(a)
+            if self._rx_buffer:
+                self.notify_data_ready()
+
+    # -----
+
     def _set_online(self, online:bool):
         self._is_online = online
         self._tty.rts = online != self._inverse_rts    # RTS
@@ -324,7 +351,7 @@ class TelexCH340TTY(txBase.TelexBase):
             enable = True
 
         if a in ('Z', 'ZZ'):
-            self._tx_buffer = []    # empty write buffer...
+            self._tx_buffer.clear()    # empty write buffer...
             self._set_pulse_dial(False)
             self._set_online(False)
             enable = False   #self._use_dedicated_line
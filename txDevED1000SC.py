@@ -20,8 +20,6 @@ __version__     = "0.0.1"
 from threading import Thread, Event
 import time
 import pyaudio
-import math
-import struct
 #import scipy.signal.signaltools as sigtool
 from scipy import signal
 import numpy as np
@@ -33,8 +31,10 @@ l = logging.getLogger("piTelex." + __name__)
 
 import txCode
 import txBase
+import txBuffer
+import txFSK
 
-sample_f = 48000       # sampling rate, Hz, must be integer
+sample_f = txFSK.sample_f       # sampling rate, Hz, must be integer
 
 # Set to plot receive filters' spectra
 plot_spectrum = False
@@ -72,9 +72,10 @@ class TelexED1000SC(txBase.TelexBase):
 
         self.id = 'edS'
         self.params = params
+        self.needs_polling = False
 
-        self._tx_buffer = []
-        self._rx_buffer = []
+        self._tx_buffer = txBuffer.Buffer()
+        self._rx_buffer = txBuffer.Buffer()
         self._is_online = Event()
         self._ST_pressed = False
         # State of rx thread, governs most of the module operation (see class
@@ -93,7 +94,16 @@ class TelexED1000SC(txBase.TelexBase):
         recv_f0 = self.params.get('recv_f0', 2250)
         recv_f1 = self.params.get('recv_f1', 3150)
         recv_f = [recv_f0, recv_f1]
-        self._recv_decode_init(recv_f)
+        self.recv_detector = self.params.get('recv_detector', 'iir')
+        if self.recv_detector not in txFSK.DEMODULATORS:
+            l.warning("Invalid recv_detector, ignored: " + repr(self.recv_detector))
+            self.recv_detector = 'iir'
+        self._recv_decode_init(recv_f, self.params.get('baudrate', 50))
+
+        # Character recognition by software UART on every sample (see
+        # txFSK.SoftUART); false: former recognition by counting slices
+        self.recv_uart = self.params.get('recv_uart', False)
+        self._uart = txFSK.SoftUART(self.params.get('baudrate', 50), sample_f) if self.recv_uart else None
 
         # Save how many characters have been printed per session
         self.printed_chars = 0
@@ -120,14 +130,14 @@ class TelexED1000SC(txBase.TelexBase):
 
     def read(self) -> str:
         if self._rx_buffer:
-            a = self._rx_buffer.pop(0)
-            l.debug("read: {!r}".format(a))
+            a = self._rx_buffer.popleft()
+            l.debug("read: %r", a)
             return a
 
     # -----
 
     def write(self, a:str, source:str):
-        l.debug("write from {!r}: {!r}".format(source, a))
+        l.debug("write from %r: %r", source, a)
         if len(a) != 1:
             self._check_commands(a)
             return
@@ -182,19 +192,14 @@ class TelexED1000SC(txBase.TelexBase):
         send_f = [send_f0, send_f1, (send_f0+send_f1)/2]
         zcarrier = self.params.get('zcarrier', False)
 
-        Fpb = int(sample_f / baudrate + 0.5)   # Frames per bit
-        Fpw = int(Fpb * 7.5 + 0.5)   # Frames per wave
-
         time.sleep(0.5)
 
-        waves = []
-        for i in range(3):
-            samples=[]
-            for n in range(Fpb):
-                t = n / sample_f
-                s = math.sin(t * 2 * math.pi * send_f[i])
-                samples.append(int(s*32000))   # 16 bit
-            waves.append(struct.pack('%sh' % Fpb, *samples))   # 16 bit
+        # Waveforms of all characters and idle levels rendered once per
+        # start phase, with continuous phase; the audio callback streams
+        # them from the ring buffer without gaps
+        cache = txFSK.WaveformCache(send_f, baudrate, sample_f)
+        Fpb = cache.Fpb   # Frames per bit
+        ring = self._tx_ring = txFSK.SampleRing(cache.Fpw + Fpb)
 
         audio = pyaudio.PyAudio()
         try:
@@ -203,36 +208,37 @@ class TelexED1000SC(txBase.TelexBase):
             # No separate in/out devices, assume them being the same
             devindex_out = devindex
 
-        stream = audio.open(format=pyaudio.paInt16, channels=1, rate=sample_f, output=True, input=False, output_device_index=devindex_out)
+        stream = audio.open(format=pyaudio.paInt16, channels=1, rate=sample_f, output=True, input=False,
+            output_device_index=devindex_out, frames_per_buffer=Fpb // 4, stream_callback=self._tx_callback)
+        stream.start_stream()
 
-        #a = stream.get_write_available()
         try:
             while self._run:
                 # Going online: send Z
                 if self._rx_state == ST.ONLINE_REQ:
                     l.debug("[tx] Sending Z level")
-                    stream.write(waves[1], Fpb)   # blocking
+                    ring.write(cache.idle(1))   # blocking
                 # Process buffer if we're online or going offline with nonempty
                 # buffer. Critical for ASCII services that send faster than 50
                 # Bd.
                 elif ST.ONLINE <= self._rx_state <= ST.OFFLINE_REQ:
                     if self._tx_buffer:
-                        a = self._tx_buffer.pop(0)
+                        a = self._tx_buffer.popleft()
                         if len(a) == 1:
                             self.printed_chars += 1
-                        l.debug("[tx] Sending {!r} (buffer length {})".format(a, len(self._tx_buffer)))
+                        l.debug("[tx] Sending %r (buffer length %d)", a, len(self._tx_buffer))
                         if a == '§W':   # signal WB (ready for dial)
-                            bb = (0xF9FFFFFF,)   # 40ms pulse after 500ms pause, may be interpreted as 'V'
-                            nbit = 32
+                            # 40ms pulse after 500ms pause, may be interpreted as 'V'
+                            ring.write(cache.bits(0xF9FFFFFF, 32))   # blocking
                         elif a == '§A':   # signal A (online)
-                            bb = (0xFFC0,)   # 140ms pulse
-                            nbit = 16
+                            # 140ms pulse
+                            ring.write(cache.bits(0xFFC0, 16))   # blocking
                         elif a == '§L':   # transmit lock, to wait for WRU printing
                             # Send idle frequency for 20 characters, plus 1 for
                             # good measure: 7.5 bits * 21 = 157.5
                             # So wait for 158 bits.
                             nbit = 158
-                            bb = ((2**nbit)-1,)
+                            ring.write(cache.bits((2**nbit)-1, nbit))   # blocking
                         else:   # normal ANSI character
                             if a == '@':
                                 # Teleprinter's WRU unit will trigger after
@@ -242,45 +248,30 @@ class TelexED1000SC(txBase.TelexBase):
                             bb = self._mc.encodeA2BM(a)
                             if not bb:
                                 continue
-                            nbit = 5
-
-                        for b in bb:
-                            mask = 1
-                            wavecomp = bytearray()
-                            for i in range(nbit):
-                                bit = 1 if (b & mask) else 0
-                                mask <<= 1
-                                wavecomp.extend(waves[bit])   # data bit
-
-                            if nbit == 5:
-                                # Single Baudot character: add start and stop bits
-                                wavecomp[0:0] = waves[0]   # start bit
-                                wavecomp.extend(waves[1])
-                                wavecomp.extend(waves[1])
-                                # Limit send length (only 1.5 stop bits)
-                                frames = Fpw   # 7.5 bits
-                            else:
-                                frames = len(wavecomp) // 2   # 16 bit words
-                            stream.write(bytes(wavecomp), frames)   # blocking
+                            # Single Baudot characters with start bit and
+                            # 1.5 stop bits, back to back
+                            for b in bb:
+                                ring.write(cache.code(b))   # blocking
 
                     else:   # nothing to send
                         l.debug("[tx] Online with empty tx buffer")
-                        stream.write(waves[1], Fpb)   # blocking
+                        ring.write(cache.idle(1))   # blocking
 
                 else:   # offline
                     if self._rx_state == ST.OFFLINE_DELAY:
                         l.debug("[tx] Going offline shortly")
                         # Wait out offline delay; write Z until then
-                        while self._rx_state == ST.OFFLINE_DELAY:
-                            stream.write(waves[1], Fpb)   # blocking
+                        while self._rx_state == ST.OFFLINE_DELAY and self._run:
+                            ring.write(cache.idle(1))   # blocking
 
                     if zcarrier:
                         l.debug("[tx] Offline, sending A level")
-                        stream.write(waves[0], Fpb)   # blocking
+                        ring.write(cache.idle(0))   # blocking
                     else:
                         l.debug("[tx] Offline, waiting")
                         # If there's absolutely nothing to do, block until
                         # we're going online again
+                        ring.flush()
                         self._is_online.wait()
 
                 time.sleep(0.001)
@@ -289,8 +280,16 @@ class TelexED1000SC(txBase.TelexBase):
             print(e)
 
         finally:
+            ring.close()
             stream.stop_stream()
             stream.close()
+            if ring.underruns:
+                l.warning("[tx] Audio output ran dry {} times".format(ring.underruns))
+
+
+    def _tx_callback(self, in_data, frame_count, time_info, status):
+        """Audio output callback: stream samples from the tx ring buffer."""
+        return (self._tx_ring.read(frame_count).tobytes(), pyaudio.paContinue)
 
     # =====
 
@@ -343,21 +342,28 @@ class TelexED1000SC(txBase.TelexBase):
             # - We read an A: go back to slow scan
             #
             # The responsiveness delay is about 2x scan interval. (The receive
-            # IIR filter also seems to introduce a delay. In trials under
-            # optimal circumstances, after pressing AT on the teleprinter,
-            # it took the filter two cycles to recognise the change.)
+            # IIR filter also introduces a delay. Formerly, the filters were
+            # restarted from zero on every block; in trials, after pressing AT
+            # on the teleprinter, it took two cycles to recognise the change.
+            # Now the filter state is carried over from block to block, see
+            # txFSK, except across the gaps of slow scan.)
 
             if quick_scanning or self._rx_state > ST.OFFLINE:
                 pass
             else:
                 self._is_online.wait(1)
+                # Don't continue with filter state from before the gap
+                self._demod.reset()
+                if self._uart:
+                    self._uart.reset()
 
             # Read audio input
             bdata = stream.read(FpS, exception_on_overflow=False)   # blocking
+            t_read = time.monotonic()
             data = np.frombuffer(bdata, dtype=np.int16)
 
             # Run FSK demodulation (bit detection)
-            bit = self._recv_decode(data)
+            bit, energy = self._recv_decode(data)
 
             if bit_last != bit and not (ST.ONLINE <= self._rx_state < ST.OFFLINE_DELAY):
                 if bit is None:
@@ -420,6 +426,7 @@ class TelexED1000SC(txBase.TelexBase):
                 if _bit_counter_1 == 20:
                     l.info("[rx] Detected AT press")
                     self._rx_buffer.append('\x1bAT')
+                    self.notify_data_ready()
                     # Don't send printer start confirmation since AT was
                     # pressed.
             elif self._rx_state == ST.ONLINE_REQ: # ====================
@@ -451,7 +458,7 @@ class TelexED1000SC(txBase.TelexBase):
                     if self._tx_buffer:
                         l.warning("[rx] Discarding tx buffer due to unresponsive teleprinter ({} characters)".format(len(self._tx_buffer)))
                         l.debug("[rx] tx buffer contents: {!r}".format(self._tx_buffer))
-                        self._tx_buffer = []
+                        self._tx_buffer.clear()
             elif self._rx_state == ST.ONLINE: # ====================
                 # Go offline on ESC-Z
                 if not self._is_online.is_set():
@@ -463,17 +470,19 @@ class TelexED1000SC(txBase.TelexBase):
                 if _bit_counter_0 == 100:
                     l.info("[rx] Detected ST press")
                     self._rx_buffer.append('\x1bST')
+                    self.notify_data_ready()
                     self._ST_pressed = True
                     if self._tx_buffer:
                         l.warning("[rx] Discarding tx buffer due to ST press ({} characters)".format(len(self._tx_buffer)))
                         l.debug("[rx] tx buffer contents: {!r}".format(self._tx_buffer))
-                        self._tx_buffer = []
+                        self._tx_buffer.clear()
             elif self._rx_state == ST.OFFLINE_REQ: # ====================
                 # Write out tx buffer
                 if not self._tx_buffer:
                     l.info("[rx] tx buffer empty, printed characters: {}".format(self.printed_chars))
                     # Ensure that everyone knows our buffer is empty
                     self._rx_buffer.append('\x1b~0')
+                    self.notify_data_ready()
                     self._rx_state = ST.OFFLINE_DELAY
                 # ... but break on ST (if the operator wishes to go offline
                 # immediately).
@@ -485,13 +494,14 @@ class TelexED1000SC(txBase.TelexBase):
                     # Sending ST now probably won't be needed since _is_online
                     # has already been cleared.
                     self._rx_buffer.append('\x1bST')
+                    self.notify_data_ready()
                     self._ST_pressed = True
                     # Don't advance state since emptying the buffer now will
                     # trigger state ST.OFFLINE_DELAY on next loop (see above).
                     if self._tx_buffer:
                         l.warning("[rx] Discarding tx buffer due to ST press ({} characters)".format(len(self._tx_buffer)))
                         l.debug("[rx] tx buffer contents: {!r}".format(self._tx_buffer))
-                        self._tx_buffer = []
+                        self._tx_buffer.clear()
             elif self._rx_state == ST.OFFLINE_DELAY: # ====================
                 if self._ST_pressed:
                     # Skip delay if ST was pressed to improve responsiveness
@@ -548,9 +558,24 @@ class TelexED1000SC(txBase.TelexBase):
             # because the other endpoint is already disconnected; received data
             # would be useless. But ST operation always works independently.
             if not self._rx_state == ST.ONLINE: # online
+                if self._uart:
+                    self._uart.reset()
+                continue
+
+            if self._uart:
+                # Character recognition by software UART: start bit edge and
+                # bit middles to the sample, independent of slices
+                for symbol, t_start in self._uart.process(energy[1] - energy[0],
+                        energy.sum(axis=0) >= self.recv_squelch, t_read):
+                    l.debug("[rx] Received code {} (start bit {:.1f} ms ago)".format(
+                        symbol, (time.monotonic() - t_start) * 1000))
+                    a = self._mc.decodeBM2A([symbol])
+                    if a:
+                        self._rx_buffer.append(a)
+                        self.notify_data_ready()
                 continue
 
-            # Character recognition
+            # Character recognition (former, by slices)
             if slice_counter == 0:
                 if not bit:   # found start step
                     symbol = 0
@@ -584,6 +609,7 @@ class TelexED1000SC(txBase.TelexBase):
                     a = self._mc.decodeBM2A([symbol])
                     if a:
                         self._rx_buffer.append(a)
+                        self.notify_data_ready()
                     continue
 
                 slice_counter += 1
@@ -596,14 +622,9 @@ class TelexED1000SC(txBase.TelexBase):
 
     # =====
 
-    # IIR-filter
-    def _recv_decode_init(self, recv_f):
-        self._filters = []
-        for i in range(2):
-            f = recv_f[i]
-            filter_bp = signal.iirfilter(4, [f/1.05, f*1.05], rs=40, btype='bandpass',
-                        analog=False, ftype='butter', fs=sample_f, output='sos')
-            self._filters.append(filter_bp)
+    # IIR-filter or sliding DFT, see recv_detector
+    def _recv_decode_init(self, recv_f, baudrate):
+        self._demod = txFSK.DEMODULATORS[self.recv_detector](recv_f, baudrate, sample_f)
 
         if not plot_spectrum:
             return
@@ -617,10 +638,10 @@ class TelexED1000SC(txBase.TelexBase):
         plt.ylabel('Gain (dB)')
         plt.title('{}Hz, {}Hz'.format(recv_f[0], recv_f[1]))
 
+        w, responses = self._demod.frequency_response()
         for i in range(2):
             f = recv_f[i]
-            w, h = signal.sosfreqz(self._filters[i], 2000, fs=sample_f)
-            plt.plot(w, 20*np.log10(np.abs(h)), label=str(f)+'Hz')
+            plt.plot(w, 20*np.log10(np.abs(responses[i])), label=str(f)+'Hz')
             plt.plot((f,f), (10, -100), color='red', linestyle='dashed')
 
         plt.plot((500,500), (10, -100), color='blue', linestyle='dashed')
@@ -629,13 +650,14 @@ class TelexED1000SC(txBase.TelexBase):
 
     # -----
 
-    # IIR-filter
+    # IIR-filter or sliding DFT, see recv_detector
     def _recv_decode(self, data):
-        val = [None, None]
-        for i in range(2):
-            fdata = signal.sosfilt(self._filters[i], data)
-            fdata = np.abs(fdata)   # rectifier - instead of envelope curve
-            val[i] = int(np.average(fdata))   # get energy for each frequency band
+        # Envelope of each frequency band per sample; the filters continue
+        # where the last block ended. Decide on the newest sample, so the
+        # decision doesn't lag behind by half a block. Return the decision
+        # and the envelopes (for the software UART).
+        energy = self._demod.process(data)
+        val = [int(energy[0, -1]), int(energy[1, -1])]
 
         bit = val[0] < val[1]   # compare energy of each frequency band
         if (val[0] + val[1]) < self.recv_squelch:   # no carrier
@@ -646,7 +668,7 @@ class TelexED1000SC(txBase.TelexBase):
                 line = '{},{}\n'.format(val[0], val[1])
                 fp.write(line)
 
-        return bit
+        return bit, energy
 
     # =====
 
@@ -36,6 +36,11 @@ class TelexIRC(txDevITelexCommon.TelexITelexCommon):
         self.directed_only = params.get('directed_only', False)
 
         self.id = 'IRC'
+        self.needs_polling = False
+        self.consumes_commands = ('\x1bA', '\x1bZ', '\x1bWB')
+        # Unlike the i-Telex modules we're derived from, take data from all
+        # sources
+        self.ignores_data_from = ()
         self.running = True
         self.chars_buffer = ''
         self._is_online = False
@@ -56,7 +61,7 @@ class TelexIRC(txDevITelexCommon.TelexITelexCommon):
     def read(self) -> str:
         if self._rx_buffer:
             if self._is_online:
-                return self._rx_buffer.pop(0)
+                return self._rx_buffer.popleft()
             else:
                 self._is_online = True
                 return '\x1bA'
@@ -70,7 +75,7 @@ class TelexIRC(txDevITelexCommon.TelexITelexCommon):
                 self._is_online = False
             if a == '\x1bWB':
                 self._is_online = True
-                self._rx_buffer.append('\x1bA')
+                with self._rx_lock: self._rx_buffer.append('\x1bA')
             return
 
         if a not in "[]":
@@ -119,11 +124,12 @@ class TelexIRC(txDevITelexCommon.TelexITelexCommon):
                             last_date = time.gmtime(data["timestamp"]).tm_yday
                         text = txCode.BaudotMurrayCode.ascii_to_tty_text(msg)
                         # TODO: insert linebreak after 65 characters
-                        for a in text:
-                            self._rx_buffer.append(a)
+                        with self._rx_lock:
+                            self._rx_buffer.extend(text)
+                        self.notify_data_ready()
 
                 if self._tx_buffer:
-                    a = self._tx_buffer.pop(0)
+                    a = self._tx_buffer.popleft()
                     data = str(a.encode('ASCII'), 'utf8').lower()
                     self.add_chars(data)
 
@@ -8,11 +8,12 @@ __copyright__   = "Copyright 2025, *dg*"
 __license__     = "GPL3"
 __version__     = "0.0.2"
 
-from threading import Thread, Event
+from threading import Thread, Event, Lock
 import socket
 import time
 import sys
 import enum
+import random
 
 import logging
 l = logging.getLogger("piTelex." + __name__)
@@ -49,6 +50,31 @@ class CTX_ST(enum.IntEnum):
     RECYCLE = 6
 
 
+class Backoff:
+    """
+    Reconnect delays: exponential backoff with jitter
+
+    Each failure doubles the delay, from delay_min up to delay_max. The delay
+    actually waited is randomly shortened by up to jitter (fraction), so that
+    many clients don't reconnect all at once after e.g. a Centralex server
+    restart.
+    """
+    def __init__(self, delay_min:float, delay_max:float, jitter:float=0.5):
+        self.delay_min = delay_min
+        self.delay_max = max(delay_max, delay_min)
+        self.jitter = jitter
+        self.failures = 0
+
+    def next(self) -> float:
+        """Count a failure and return the delay to wait before retrying."""
+        delay = min(self.delay_max, self.delay_min * 2 ** min(self.failures, 30))
+        self.failures += 1
+        return delay * (1 - self.jitter * random.random())
+
+    def reset(self):
+        self.failures = 0
+
+
 class TelexITelexCentralex(txDevITelexCommon.TelexITelexCommon):
     def __init__(self, **params):
         super().__init__()
@@ -57,6 +83,7 @@ class TelexITelexCentralex(txDevITelexCommon.TelexITelexCommon):
         # where the Id is used.
         self.id = 'iTs'
         self.params = params
+        self.needs_polling = False
 
         self._centralex_address = params.get('centralex_srv', 'tlnserv2.teleprinter.net');
         self._centralex_port = params.get('centralex_port', 49491);
@@ -85,12 +112,40 @@ class TelexITelexCentralex(txDevITelexCommon.TelexITelexCommon):
 
         self._block_ascii = params.get('block_ascii', True)
 
+        self._send_window = params.get('send_window', self._send_window)
+
+        # Delays before reconnecting to the Centralex server (s): after an
+        # error, growing from min to max; after a call
+        self._ctx_backoff = Backoff(
+            params.get('centralex_reconnect_min', 2.0),
+            params.get('centralex_reconnect_max', 120.0))
+        self._ctx_reconnect_after_call = params.get('centralex_reconnect_after_call', 0.0)
+
         #self.clients = {}
 
         # self._ctx_recycle = False
         self._ctx_occ_reason = ''
+        self._ctx_st = CTX_ST.OFFLINE
 
-        self.handle_centralex_connection()
+        # Set to wake up the Centralex thread from waiting (outgoing call
+        # started or ended, quitting piTelex)
+        self._ctx_wakeup = Event()
+
+        # Connection statistics, see centralex_stats
+        self._ctx_stats_lock = Lock()
+        self._ctx_stats = {
+            'connects': 0,            # connections authenticated
+            'connect_failures': 0,    # connect or authentication failed
+            'auth_rejects': 0,        # of these: rejected by server
+            'heartbeat_timeouts': 0,
+            'connection_lost': 0,
+            'calls': 0,
+            'reconnect_delay': 0.0,   # last delay waited before reconnecting
+            'last_error': '',
+        }
+        # Time spent per state
+        self._ctx_state_time = {st: 0.0 for st in CTX_ST}
+        self._ctx_state_since = time.monotonic()
 
         # Record number of failed tests and TNS updates
         #self.update_tns_fail = 0
@@ -109,6 +164,13 @@ class TelexITelexCentralex(txDevITelexCommon.TelexITelexCommon):
         # quitting piTelex, to wake up everyone still sleeping.
         self.term = Event()
 
+        # Start last, the thread uses all of the above
+        self.handle_centralex_connection()
+
+    def exit(self):
+        super().exit()
+        self.term.set()
+        self._ctx_wakeup.set()
 
     # =====
 
@@ -117,155 +179,257 @@ class TelexITelexCentralex(txDevITelexCommon.TelexITelexCommon):
 
     # =====
 
+    def centralex_stats(self) -> dict:
+        """
+        Return Centralex connection statistics: counters (see __init__),
+        current state and reconnect failures in a row, time spent per state
+        and the share of time in standby (reachable for calls).
+        """
+        now = time.monotonic()
+        with self._ctx_stats_lock:
+            stats = dict(self._ctx_stats)
+            state_time = dict(self._ctx_state_time)
+            state_time[self._ctx_st] += now - self._ctx_state_since
+        stats['state'] = self._ctx_st.name
+        stats['failures_in_row'] = self._ctx_backoff.failures
+        stats['state_time'] = {st.name: t for st, t in state_time.items()}
+        total = sum(state_time.values())
+        reachable = state_time[CTX_ST.STANDBY] + state_time[CTX_ST.CONNECTED]
+        stats['availability'] = reachable / total if total else 0.0
+        return stats
+
+
+    def centralex_stats_text(self) -> str:
+        stats = self.centralex_stats()
+        return (f"state {stats['state']}, {stats['connects']} connects, "
+            f"{stats['connect_failures']} failures ({stats['auth_rejects']} rejects), "
+            f"{stats['heartbeat_timeouts']} heartbeat timeouts, {stats['connection_lost']} lost, "
+            f"{stats['calls']} calls, available {stats['availability']:.1%}")
+
+
+    def _ctx_set_state(self, st:CTX_ST):
+        now = time.monotonic()
+        with self._ctx_stats_lock:
+            self._ctx_state_time[self._ctx_st] += now - self._ctx_state_since
+            self._ctx_state_since = now
+            self._ctx_st = st
+
+
+    def _ctx_count(self, key:str, error:str=None):
+        with self._ctx_stats_lock:
+            self._ctx_stats[key] += 1
+            if error is not None:
+                self._ctx_stats['last_error'] = error
+
+
+    def _ctx_wait(self, delay:float) -> bool:
+        """
+        Wait delay seconds before reconnecting. Return early if woken up (see
+        _ctx_wakeup); return True if reconnecting is still wanted.
+        """
+        with self._ctx_stats_lock:
+            self._ctx_stats['reconnect_delay'] = delay
+        if delay > 0:
+            l.info(f'Centralex: reconnecting in {delay:.1f} s')
+            self._ctx_wakeup.wait(delay)
+        return self._run and not self._ctx_occ_reason
+
+    # =====
+
     def thread_handle_centralex_connection(self):
-        reconnect_after_error = 15 # wait 15 sec. after error before try to reconnect to centralex server
-        reconnect_after_conn = 2 # wait 2 sec. after connection before reconnect to centralex server
+        """
+        Keep a standby connection to the Centralex server, so that calls can
+        be received through it.
 
-        self._ctx_st = CTX_ST.OFFLINE
-        last_recv_ack = 0.0
+        After an error, the connection is re-established after a delay
+        growing with each failure in a row (see Backoff); after a call, right
+        away. Waiting is interrupted when an outgoing call starts or ends and
+        when piTelex quits.
+        """
+        self._ctx_wakeup.clear()
+        delay = 0.0
+
+        while self._run:
+            if self._ctx_occ_reason:
+                # Outgoing call: Centralex connection has been closed (see
+                # _ctx_standby), wait for the call to end
+                self._ctx_set_state(CTX_ST.BUSY)
+                self._ctx_wakeup.wait()
+                self._ctx_wakeup.clear()
+                if self._ctx_st == CTX_ST.BUSY and not self._ctx_occ_reason:
+                    self._ctx_set_state(CTX_ST.OFFLINE)
+                    delay = 0.0
+                continue
+
+            if delay and not self._ctx_wait(delay):
+                self._ctx_wakeup.clear()
+                continue
+            self._ctx_wakeup.clear()
+
+            s = None
+            try:
+                s = self._ctx_connect()
+                if not self._ctx_check_auth(s):
+                    self._ctx_count('auth_rejects')
+                    delay = self._ctx_backoff.next()
+                    continue
+                self._ctx_backoff.reset()
+                delay = self._ctx_standby(s)
+
+            except Exception as e:
+                l.debug(f'Centralex: error ctx_st={self._ctx_st} e={e!r}')
+                with self._rx_lock: self._rx_buffer.append('\x1bCE')
+                self.notify_data_ready()
+                self._ctx_count('connect_failures', repr(e))
+                delay = self._ctx_backoff.next()
+
+            finally:
+                if s:
+                    s.close()
+                if self._ctx_st != CTX_ST.BUSY:
+                    self._ctx_set_state(CTX_ST.RECYCLE if self._run else CTX_ST.OFFLINE)
+
+        l.info(f'Centralex: stopped, {self.centralex_stats_text()}')
+
+
+    def _ctx_connect(self) -> socket.socket:
+        """Connect to centralex server and send Connect Remote."""
+        self._ctx_set_state(CTX_ST.OFFLINE)
+        l.info(f'Centralex: connecting to server {self._centralex_address}:{self._centralex_port})')
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            address = (self._centralex_address, int(self._centralex_port))
+            s.settimeout(5.0) # Wait at most 5 s during connect
+            s.connect(address)
+            self.send_connect_remote(s, self._number, self._tns_pin)
+        except:
+            s.close()
+            raise
+        self._ctx_set_state(CTX_ST.CHECK_AUTH)
+        return s
+
+
+    def _ctx_check_auth(self, s) -> bool:
+        """
+        Receive the server's answer to Connect Remote. Return True if
+        confirmed, False if rejected; raise on errors.
+        """
+        s.settimeout(1)
+        data = s.recv(1)
+        if not data:
+            raise ConnectionError('connection closed by server')
+        if data[0] == 0x82 or data[0] == 0x04 or data[0] == 0xFF:
+            d = s.recv(1)
+            data += d
+            length = d[0]
+            if length > 0:
+                data += s.recv(length)
+
+            if (data[0] == 0x82):
+                # Remote confirm
+                with self._rx_lock: self._rx_buffer.append('\x1bCC')
+                self.notify_data_ready()
+                l.info('Centralex: socket connected')
+                self._ctx_count('connects')
+                self._ctx_set_state(CTX_ST.STANDBY)
+                return True
+
+            aa = data[2:].decode('ASCII', errors='ignore')
+            aa = aa.rstrip('\x00')
+            if (data[0] == 0x04):
+                # Reject
+                l.warning(f'Centralex: authentication failed reason=\'{aa}\' data={format(display_hex(data))}')
+                error = f'reject {aa}'
+            else:
+                # Error
+                l.warning(f'Centralex: authentication failed error=\'{aa}\' data={format(display_hex(data))}')
+                error = f'error {aa}'
+
+        else:
+            # Error: invalid response (authentication error)
+            l.warning(f'Centralex: authentication failed data={format(display_hex(data))}')
+            error = f'invalid response {display_hex(data)}'
+
+        with self._rx_lock: self._rx_buffer.append('\x1bCE')
+        self.notify_data_ready()
+        self._ctx_count('connect_failures', error)
+        return False
+
+
+    def _ctx_standby(self, s) -> float:
+        """
+        Wait for calls on authenticated connection s, exchanging heartbeats
+        with the server, until a call has been handled, an outgoing call
+        starts or the connection fails. Return the delay before reconnecting.
+        """
+        last_recv_ack = time.monotonic()
         last_send_ack = 0.0
 
-        while True:
+        while self._run:
+            if self._ctx_occ_reason:
+                # Outgoing call: tell the server we're occupied
+                self.send_end_with_reason(s, self._ctx_occ_reason)
+                self._ctx_set_state(CTX_ST.BUSY)
+                return 0.0
+
+            t = time.monotonic()
+            if (t - last_recv_ack > 35):
+                # Error: heartbeat timeout from centralex server
+                l.warning('Centralex: heartbeat timeout: {!s} sec'.format(t - last_recv_ack))
+                self._ctx_count('heartbeat_timeouts', 'heartbeat timeout')
+                return self._ctx_backoff.next()
+            if (t - last_send_ack > 15):
+                self.send_heartbeat(s)
+                last_send_ack = t
+            s.settimeout(0.2)
             try:
-                if not self._run:
-                    s.close()
-                    return
+                data = s.recv(1)
+            except (socket.timeout):
+                continue
 
-                if len(self._ctx_occ_reason) > 0:
-                    self.send_end_with_reason(s, self._ctx_occ_reason);
-                    s.close()
-                    self._ctx_occ_reason = ''
-                    self._ctx_st == CTX_ST.BUSY
-
-                elif self._ctx_st == CTX_ST.BUSY:
-                    time.sleep(0.1)
-
-                elif self._ctx_st == CTX_ST.RECYCLE:
-                    s.close();
-                    self._ctx_st = CTX_ST.OFFLINE
-
-                elif self._ctx_st == CTX_ST.OFFLINE:
-                    # connect to centralex server
-                    l.info(f'Centralex: connecting to server {self._centralex_address}:{self._centralex_port})')
-                    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    address = (self._centralex_address, int(self._centralex_port))
-                    s.settimeout(5.0) # Wait at most 5 s during connect
-                    s.connect(address)
-                    self.send_connect_remote(s, self._number, self._tns_pin)
-                    self._ctx_occ_reason = ''
-                    self._ctx_st = CTX_ST.CHECK_AUTH
-
-                elif self._ctx_st == CTX_ST.CHECK_AUTH:
-                    s.settimeout(1)
-                    data = s.recv(1)
-                    if data[0] == 0x82 or data[0] == 0x04 or data[0] == 0xFF:
-                        d = s.recv(1)
-                        data += d
-                        length = d[0]
-                        if length > 0:
-                            data += s.recv(length)
-
-                        if (data[0] == 0x82):
-                            # Remote confirm
-                            last_recv_ack = time.time()
-                            last_send_ack = 0.0
-                            with self._rx_lock: self._rx_buffer.append('\x1bCC')
-                            l.info('Centralex: socket connected')
-                            self._ctx_st = CTX_ST.STANDBY
-
-                        elif (data[0] == 0x04):
-                            # Reject
-                            aa = data[2:].decode('ASCII', errors='ignore')
-                            aa = aa.rstrip('\x00')
-                            l.warning(f'Centralex: authentication failed reason=\'{aa}\' data={format(display_hex(data))}')
-                            with self._rx_lock: self._rx_buffer.append('\x1bCE')
-                            self._ctx_st = CTX_ST.RECYCLE
-                            time.sleep(reconnect_after_error)
-
-                        elif (data[0] == 0xFF):
-                            # Error
-                            aa = data[2:].decode('ASCII', errors='ignore')
-                            aa = aa.rstrip('\x00')
-                            l.warning(f'Centralex: authentication failed error=\'{aa}\' data={format(display_hex(data))}')
-                            with self._rx_lock: self._rx_buffer.append('\x1bCE')
-                            self._ctx_st = CTX_ST.RECYCLE
-                            time.sleep(reconnect_after_error)
+            if data == None or len(data) == 0:
+                # connection lost
+                l.warning('Centralex: connection lost')
+                self._ctx_count('connection_lost', 'connection lost')
+                return self._ctx_backoff.next()
 
-                    else:
-                        # Error: invalid response (authentication error)
-                        l.warning(f'Centralex: authentication failed data={format(display_hex(data))}')
-                        with self._rx_lock: self._rx_buffer.append('\x1bCE')
-                        self._ctx_st = CTX_ST.RECYCLE
-                        time.sleep(reconnect_after_error)
-
-                elif self._ctx_st == CTX_ST.STANDBY:
-                    t = time.time()
-                    if (t - last_recv_ack > 35):
-                        # Error: heartbeat timeout from centralex server
-                        l.warning('Centralex: heartbeat timeout: {!s} sec'.format(t - last_recv_ack))
-                        self._ctx_st = CTX_ST.RECYCLE
-                        # s.close()
-                        time.sleep(reconnect_after_error)
-                    if (t - last_send_ack > 15):
-                        self.send_heartbeat(s)
-                        last_send_ack = t
-                    s.settimeout(0.2)
-                    try:
-                        data = s.recv(1)
-                    except (socket.timeout):
-                        continue
-
-                    if data == None or len(data) == 0:
-                        # connection lost
-                        self._ctx_st = CTX_ST.RECYCLE
-                        time.sleep(reconnect_after_error)
-                        continue
-
-                    if data[0] != 0x00 and data[0] != 0x83:
-                        l.debug(f'Centralex: ignore invalid data {data[0]}')
-                        continue;
-
-                    try:
-                        d = s.recv(1)
-                    except (socket.timeout):
-                        continue
-
-                    data += d
-
-                    if (data[0] == 0x00 and data[1] == 0x00):
-                        # Heartbeat from centralex server
-                        # l.debug('Heartbeat from centralex')
-                        last_recv_ack = t
-
-                    elif (data[0] == 0x83 and data[1] == 0x00):
-                        # incoming remote call from centralex server
-                        self.send_accept_call_remote(s)
-                        self._ctx_st = CTX_ST.CONNECTED
-                        l.debug(f'before _tx_buffer = {len(self._tx_buffer)}')
-                        l.debug(f'before _rx_buffer = {len(self._rx_buffer)}')
-                        self._tx_buffer = []
-                        self._rx_buffer = []
-                        self.process_connection(s, True, False)
-                        l.debug(f'after _tx_buffer = {len(self._tx_buffer)}')
-                        l.debug(f'after _rx_buffer = {len(self._rx_buffer)}')
-                        self._tx_buffer = []
-                        with self._rx_lock: self._rx_buffer.append('\x1bST') # stop teleprinter
-                        self._printer_running = False
-                        self.send_end_with_reason(s, 'nc')
-                        # s.close()
-                        self._ctx_st = CTX_ST.RECYCLE
-                        time.sleep(reconnect_after_conn)
+            if data[0] != 0x00 and data[0] != 0x83:
+                l.debug(f'Centralex: ignore invalid data {data[0]}')
+                continue;
 
+            try:
+                d = s.recv(1)
             except (socket.timeout):
-                l.debug(f'Centralex: socket timeout ctx_st={self._ctx_st}')
-                with self._rx_lock: self._rx_buffer.append('\x1bCE')
-                self._ctx_st = CTX_ST.RECYCLE
-                time.sleep(reconnect_after_error)
-            except Exception as e:
-                l.debug(f'Centralex: error ctx_st={self._ctx_st} e={e}')
-                with self._rx_lock: self._rx_buffer.append('\x1bCE')
-                self._ctx_st = CTX_ST.RECYCLE
-                time.sleep(reconnect_after_error)
+                continue
+
+            data += d
+
+            if (data[0] == 0x00 and data[1] == 0x00):
+                # Heartbeat from centralex server
+                # l.debug('Heartbeat from centralex')
+                last_recv_ack = t
+
+            elif (data[0] == 0x83 and data[1] == 0x00):
+                # incoming remote call from centralex server
+                self.send_accept_call_remote(s)
+                self._ctx_set_state(CTX_ST.CONNECTED)
+                self._ctx_count('calls')
+                l.debug(f'before _tx_buffer = {len(self._tx_buffer)}')
+                l.debug(f'before _rx_buffer = {len(self._rx_buffer)}')
+                self._tx_buffer.clear()
+                with self._rx_lock: self._rx_buffer.clear()
+                self.process_connection(s, True, False)
+                l.debug(f'after _tx_buffer = {len(self._tx_buffer)}')
+                l.debug(f'after _rx_buffer = {len(self._rx_buffer)}')
+                self._tx_buffer.clear()
+                with self._rx_lock: self._rx_buffer.append('\x1bST') # stop teleprinter
+                self.notify_data_ready()
+                self._printer_running = False
+                self.send_end_with_reason(s, 'nc')
+                l.info(f'Centralex: call ended, {self.centralex_stats_text()}')
+                return self._ctx_reconnect_after_call
+
+        return 0.0
 
     # =====
 
@@ -279,7 +443,18 @@ class TelexITelexCentralex(txDevITelexCommon.TelexITelexCommon):
                         if item.startswith('\x1b'):
                             return self._rx_buffer.pop(nr)
                 else:
-                    return self._rx_buffer.pop(0)
+                    return self._rx_buffer.popleft()
+
+
+    def read_batch(self) -> list:
+        with self._rx_lock:
+            if ST.DISCON < self._connected <= ST.CON_TP_RUN:
+                # Welcome banner hasn't been sent yet (see read)
+                for nr, item in enumerate(self._rx_buffer):
+                    if item.startswith('\x1b'):
+                        return [self._rx_buffer.pop(nr)]
+                return []
+            return self._rx_buffer.pop_batch()
     # =====
 
     def write(self, a:str, source:str):
@@ -310,16 +485,18 @@ class TelexITelexCentralex(txDevITelexCommon.TelexITelexCommon):
                     # can begin.
                     self._connected = ST.CON_FULL
 
-            if self._ctx_st != CTX_ST.BUSY:
-                if a == '\x1bA':
+            if self._connected <= ST.DISCON and self._ctx_st != CTX_ST.CONNECTED:
+                # Outgoing call: close the Centralex connection, so that
+                # callers are told we're occupied, and reconnect when it has
+                # ended (see thread_handle_centralex_connection)
+                if a == '\x1bA' and not self._ctx_occ_reason:
                     # print("busy")
-                    self._ctx_st = CTX_ST.BUSY
                     self._ctx_occ_reason = 'occ'
-
-            else:
-                if a == '\x1bZ':
+                    self._ctx_wakeup.set()
+                elif a == '\x1bZ' and self._ctx_occ_reason:
                     # print("not busy")
-                    self._ctx_st = CTX_ST.OFFLINE
+                    self._ctx_occ_reason = ''
+                    self._ctx_wakeup.set()
 
             return
 
@@ -330,6 +507,15 @@ class TelexITelexCentralex(txDevITelexCommon.TelexITelexCommon):
 
         self._tx_buffer.append(a)
 
+
+    def write_batch(self, items:list, source:str) -> list:
+        if len(items[0]) != 1:
+            # Command: handle like a single write
+            return super().write_batch(items, source)
+        if source not in ['iTc', 'iTs']:
+            self._tx_buffer.extend(items)
+        return items
+
     # =====
 
     def test_connection(self):
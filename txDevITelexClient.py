@@ -16,7 +16,6 @@ __version__     = "0.0.1"
 from threading import Thread
 import socket
 import time
-import csv
 import datetime
 import sys
 
@@ -26,24 +25,42 @@ l = logging.getLogger("piTelex." + __name__)
 import txCode
 import txBase
 import txDevITelexCommon
+import txTNS
+import txUserList
 from txDevITelexCommon import ST
 
 
 class TelexITelexClient(txDevITelexCommon.TelexITelexCommon):
-    USERLIST = []   # cached list of user dicts of file 'userlist.csv'
     _tns_port = 0
     _userlist = ''
+    _userlist_index = None   # txUserList.UserList of file 'userlist.csv'
+    _userlist_abbreviated = False   # dial unique prefixes of local numbers
+    _tns_cache = None   # txTNS.TNSCache of TNS query results
+    _tns_parallel = 1   # number of TNS servers queried at once
+    _tns_timeout = 3.0   # time to wait for TNS answers, s
 
     def __init__(self, **params):
         super().__init__()
 
         self.id = 'iTc'
         self.params = params
+        self.needs_polling = False
 
         TelexITelexClient._tns_addresses = params.get('tns_srv', ['tlnserv.teleprinter.net','tlnserv2.teleprinter.net','tlnserv3.teleprinter.net'])
         # print('TNS: ',TelexITelexClient._tns_addresses)
         TelexITelexClient._tns_port = params.get('tns_port', 11811)
         TelexITelexClient._userlist = params.get('userlist', 'userlist.csv')
+        TelexITelexClient._userlist_index = txUserList.UserList(TelexITelexClient._userlist)
+        TelexITelexClient._userlist_abbreviated = params.get('userlist_abbreviated', False)
+        TelexITelexClient._tns_cache = txTNS.TNSCache(
+            params.get('tns_cache', 'tns_cache.json'),
+            ttl = params.get('tns_cache_ttl', txTNS.CACHE_TTL),
+            stale = params.get('tns_cache_stale', txTNS.CACHE_STALE),
+            negative_ttl = params.get('tns_cache_negative_ttl', txTNS.CACHE_NEGATIVE_TTL))
+        TelexITelexClient._tns_parallel = max(1, params.get('tns_parallel', 1))
+        TelexITelexClient._tns_timeout = params.get('tns_timeout', 3.0)
+
+        self._send_window = params.get('send_window', self._send_window)
 
 
     def exit(self):
@@ -53,14 +70,20 @@ class TelexITelexClient(txDevITelexCommon.TelexITelexCommon):
     # =====
 
     def read(self) -> str:
-        if self._rx_buffer:
-            l.debug("read: {!r}".format(self._rx_buffer[0]))
-            return self._rx_buffer.pop(0)
+        with self._rx_lock:
+            if self._rx_buffer:
+                l.debug("read: %r", self._rx_buffer[0])
+                return self._rx_buffer.popleft()
+
+
+    def read_batch(self) -> list:
+        with self._rx_lock:
+            return self._rx_buffer.pop_batch()
 
 
     def write(self, a:str, source:str):
         super().write(a, source)
-        l.debug("write from {!r}: {!r}".format(source, a))
+        l.debug("write from %r: %r", source, a)
         if len(a) != 1:
             if a == '\x1bZ':   # end session
                 self.disconnect_client()
@@ -81,9 +104,10 @@ class TelexITelexClient(txDevITelexCommon.TelexITelexCommon):
                     if user:
                         self.connect_client(user)
                     else:
-                        self._rx_buffer.append('\x1bA')
-                        self._rx_buffer.extend('bk')
-                        self._rx_buffer.append('\x1bZ')
+                        with self._rx_lock:
+                            self._rx_buffer.append('\x1bA')
+                            self._rx_buffer.extend('bk')
+                            self._rx_buffer.append('\x1bZ')
 
 
             if a[:2] == '\x1b?':   # ask TNS
@@ -101,8 +125,13 @@ class TelexITelexClient(txDevITelexCommon.TelexITelexCommon):
         #return True   #debug
 
 
-    def idle(self):
-        pass
+    def write_batch(self, items:list, source:str) -> list:
+        if len(items[0]) != 1:
+            # Command: handle like a single write
+            return super().write_batch(items, source)
+        if source not in ['iTc', 'iTs'] and self._connected > ST.DISCON:
+            self._tx_buffer.extend(items)
+        return items
 
     # =====
 
@@ -115,32 +144,43 @@ class TelexITelexClient(txDevITelexCommon.TelexITelexCommon):
         try:
             # get IP of given number from Telex-Number-Server (TNS)
 
-            is_ascii = user['Type'] in 'Aa'
-
-            # connect to destination Telex
-            l.info('connecting to {Name} ({Host}:{Port})'.format(**user))
-
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                address = (user['Host'], int(user['Port']))
-                s.settimeout(5.0) # Wait at most 5 s during connect
-                try:
-                    # Catch all errors during connect here to print proper
-                    # error message
-                    s.connect(address)
-                except OSError as e:
-                    # Error during connect: print error and switch off printer
-                    self._rx_buffer.append('\x1bA')
-                    self._rx_buffer.extend('nc')
-                    l.warning("Could not connect: {!s}".format(e))
-                    self.disconnect_client()
-                else:
-                    s.settimeout(None) # Re-enable blocking mode
+            # A cached address may be outdated (dynamic IP): then ask the TNS
+            # and try once more
+            for attempt in range(2):
+                is_ascii = user['Type'] in 'Aa'
+
+                # connect to destination Telex
+                l.info('connecting to {Name} ({Host}:{Port})'.format(**user))
+
+                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+                    address = (user['Host'], int(user['Port']))
+                    s.settimeout(5.0) # Wait at most 5 s during connect
+                    try:
+                        # Catch all errors during connect here to print proper
+                        # error message
+                        s.connect(address)
+                    except OSError as e:
+                        if attempt == 0:
+                            retry = self.requery_cached_user(user)
+                            if retry:
+                                l.info("Could not connect ({!s}), retrying with address from TNS".format(e))
+                                user = retry
+                                continue
+                        # Error during connect: print error and switch off printer
+                        with self._rx_lock:
+                            self._rx_buffer.append('\x1bA')
+                            self._rx_buffer.extend('nc')
+                        l.warning("Could not connect: {!s}".format(e))
+                        self.disconnect_client()
+                    else:
+                        s.settimeout(None) # Re-enable blocking mode
 
-                    if not is_ascii:
-                        self.send_version(s)
-                        self.send_direct_dial(s, user['ENum'])
-                    l.info("connected")
-                    self.process_connection(s, False, is_ascii)
+                        if not is_ascii:
+                            self.send_version(s)
+                            self.send_direct_dial(s, user['ENum'])
+                        l.info("connected")
+                        self.process_connection(s, False, is_ascii)
+                break
 
         except Exception:
             l.error("Exception caught:", exc_info = sys.exc_info())
@@ -149,8 +189,9 @@ class TelexITelexClient(txDevITelexCommon.TelexITelexCommon):
         s.close()
 
 #        self._rx_buffer.append('\x1bZ') # rowo 
-        self._rx_buffer.append('\x1bST') # rowo don't force Z mode (would wake up from ZZ...), but trigger transit to sleep
+        with self._rx_lock: self._rx_buffer.append('\x1bST') # rowo don't force Z mode (would wake up from ZZ...), but trigger transit to sleep
         self._printer_running = False
+        self.notify_data_ready()
 
     # =====
 
@@ -175,11 +216,7 @@ class TelexITelexClient(txDevITelexCommon.TelexITelexCommon):
 
         # With at least 5 digits, also query remotely
         if not user and (len(number) >= 5 or tns_force):
-            user = cls.query_TNS_bin(number)
-
-            # Also accept leading zero for compatibility reasons
-            if not user and number[0] == '0':
-                user = cls.query_TNS_bin(number[1:])
+            user = cls.query_TNS_cached(number, tns_force)
 
         # Direct dial override continued
         if user and ddext:
@@ -194,94 +231,185 @@ class TelexITelexClient(txDevITelexCommon.TelexITelexCommon):
         return user
 
     @classmethod
-    def query_TNS_bin(cls, number):
+    def query_TNS_cached(cls, number:str, tns_force:bool = False):
         """
-        Query TNS for member contact information (hostname/ip address, port) by
-        telex number
-
-        For details, see implementation and i-Telex Communication Specification
-        (r874).
+        Query TNS for number by query_TNS_number, using the TNS cache (see
+        txTNS.TNSCache). A stale cache entry is returned at once and
+        refreshed in background; users from the cache have the number
+        looked up in 'Cached'. tns_force bypasses the cache (but updates
+        it).
         """
-        try:
-            # Sanitise subscriber number so it will fit the Peer_query
-            number = int(number)
-            if number < 0 or number > 0xffffffff:
-                raise ValueError("Invalid subscriber number")
-            number = number.to_bytes(length=4, byteorder="little")
-
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.settimeout(3.0)
-                s.connect((cls.choose_tns_address(), cls._tns_port))
-                # Peer_query packet:
-                #                Code  Len
-                qry = bytearray([0x03, 0x05])
-                # Number
-                qry.extend(number)
-                # Version
-                qry.append(0x01)
-                s.sendall(qry)
-                data = s.recv(1024)
-                s.close()
-            if data[0] == 0x04: # Peer_not_found
-                return None
-            elif data[0] == 0x05: # Peer_reply_v1
-                if not data[1] == 0x64:
-                    raise ValueError("Peer_reply_v1 should have length 0x64, bus has 0x{0:x} instead".format(data[1]))
-                # telex number of entry
-                number_recv = str(int.from_bytes(data[2:6], byteorder="little", signed=False))
-                # name of entry holder
-                name = data[6:46].decode("ISO8859-1").rstrip('\x00')
-                # flags, ignored as per spec
-                flags = data[46:48]
-                # entry type; see below
-                entry_type_raw = data[48]
-                # hostname
-                hostname = data[49:89].decode("ISO8859-1").rstrip('\x00')
-                # IP address
-                ip_address = ".".join([str(i) for i in data[89:93]])
-                # TCP port
-                port = int.from_bytes(data[93:95], byteorder="little", signed=False)
-                # local dialling extension
-                extension = txDevITelexCommon.decode_ext_from_direct_dial(data[95])
-                # PIN: ignored as per spec
-                pin = data[96:98]
-                # last changed date: caution, UTC! ignored as of now.
-                date_secs_since_itx_epoch = int.from_bytes(data[98:], byteorder="little", signed=False)
-                date = cls.itx_epoch + datetime.timedelta(seconds=date_secs_since_itx_epoch)
-
-                if entry_type_raw in [1, 2, 5]:
-                    # Baudot type
-                    entry_type = 'I'
-                elif entry_type_raw in [3, 4]:
-                    # ASCII type
-                    entry_type = 'A'
-                else:
-                    # non-supported type (0: deleted; 6: e-mail)
-                    return None
-
-                if entry_type_raw in [1, 3]:
-                    # fixed hostname given
-                    host = hostname
-                else:
-                    # IP address given
-                    host = ip_address
-
-                user = {
-                    'TNum': number_recv,
-                    'ENum': extension,
-                    'Name': name,
-                    'Type': entry_type,
-                    'Host': host,
-                    'Port': port
-                }
-                l.info('Found user in TNS: '+str(user))
+        cache = cls._tns_cache
+        if cache and not tns_force:
+            state, user = cache.get(number)
+            if state == txTNS.FRESH:
+                l.info('Found user in TNS cache: '+str(user))
+            elif state == txTNS.STALE:
+                l.info('Found user in TNS cache (refreshing): '+str(user))
+                cache.refresh(number, cls.query_TNS_number)
+            if user:
+                # Number as cached, see requery_cached_user
+                user['Cached'] = number
+            if state != txTNS.MISS:
                 return user
 
+        try:
+            user = cls.query_TNS_number(number)
         except Exception:
+            # Don't cache: TNS may be unreachable just now
             l.error("Exception caught:", exc_info = sys.exc_info())
             return None
+        if cache:
+            cache.put(number, user)
+        return user
+
+
+    @classmethod
+    def requery_cached_user(cls, user:dict):
+        """
+        Connecting to user failed. If user came from the TNS cache, drop the
+        entry and ask the TNS again. Return the user if the TNS gave another
+        address, None otherwise.
+        """
+        number = user.get('Cached')
+        if not number or not cls._tns_cache:
+            return None
+        cls._tns_cache.remove(number)
+        new = cls.query_TNS_cached(number, tns_force = True)
+        if not new or (new['Host'], new['Port']) == (user['Host'], user['Port']):
+            return None
+        # Keep direct dial override
+        new['ENum'] = user['ENum']
+        return new
+
+
+    @classmethod
+    def query_TNS_number(cls, number:str):
+        """
+        Query TNS for number as dialled, and also without a leading zero.
+        Return user dict or None if not found; raise exception on errors.
+
+        All queries (number variants, and with tns_parallel > 1 that many
+        TNS servers) are sent at once; the first user found wins. So
+        resolving takes one round trip, also if some server doesn't answer.
+        """
+        numbers = [number]
+        # Also accept leading zero for compatibility reasons
+        if number[0] == '0' and len(number) > 1:
+            numbers.append(number[1:])
+
+        # Query each subscriber number only once (a leading zero doesn't
+        # make a difference in the Peer_query packet)
+        variants = {}
+        for n in numbers:
+            try:
+                variants.setdefault(int(n), n)
+            except ValueError:
+                variants.setdefault(n, n)
+
+        timeout = cls._tns_timeout
+        if cls._tns_parallel > 1:
+            addresses = cls.tns_servers().ranked()[:cls._tns_parallel]
+        else:
+            # Best server, fail over to the next ones (see connect_tns)
+            addresses = [None]
+        queries = []
+        for key, n in variants.items():
+            for address in addresses:
+                queries.append((key, lambda n=n, address=address: cls._query_TNS_bin(n, address, timeout)))
+        return txTNS.first_answer(queries, timeout)
+
+
+    @classmethod
+    def _query_TNS_bin(cls, number, address:str = None, timeout:float = 3.0):
+        """
+        Query TNS for member contact information (hostname/ip address, port) by
+        telex number. Return user dict or None if not found; raise exception
+        on errors, so that "not found" and "couldn't ask" can be told apart.
+        Query TNS server address, or the best one (see connect_tns) if None.
+
+        For details, see implementation and i-Telex Communication Specification
+        (r874).
+        """
+        # Sanitise subscriber number so it will fit the Peer_query
+        number = int(number)
+        if number < 0 or number > 0xffffffff:
+            raise ValueError("Invalid subscriber number")
+        number = number.to_bytes(length=4, byteorder="little")
+
+        if address:
+            s = cls.tns_servers().connect_to(address, timeout)
+        else:
+            s = cls.connect_tns(timeout)
+        with s:
+            # Peer_query packet:
+            #                Code  Len
+            qry = bytearray([0x03, 0x05])
+            # Number
+            qry.extend(number)
+            # Version
+            qry.append(0x01)
+            s.sendall(qry)
+            data = s.recv(1024)
+            s.close()
+        if data[0] == 0x04: # Peer_not_found
+            return None
+        elif data[0] == 0x05: # Peer_reply_v1
+            if not data[1] == 0x64:
+                raise ValueError("Peer_reply_v1 should have length 0x64, bus has 0x{0:x} instead".format(data[1]))
+            # telex number of entry
+            number_recv = str(int.from_bytes(data[2:6], byteorder="little", signed=False))
+            # name of entry holder
+            name = data[6:46].decode("ISO8859-1").rstrip('\x00')
+            # flags, ignored as per spec
+            flags = data[46:48]
+            # entry type; see below
+            entry_type_raw = data[48]
+            # hostname
+            hostname = data[49:89].decode("ISO8859-1").rstrip('\x00')
+            # IP address
+            ip_address = ".".join([str(i) for i in data[89:93]])
+            # TCP port
+            port = int.from_bytes(data[93:95], byteorder="little", signed=False)
+            # local dialling extension
+            extension = txDevITelexCommon.decode_ext_from_direct_dial(data[95])
+            # PIN: ignored as per spec
+            pin = data[96:98]
+            # last changed date: caution, UTC! ignored as of now.
+            date_secs_since_itx_epoch = int.from_bytes(data[98:], byteorder="little", signed=False)
+            date = cls.itx_epoch + datetime.timedelta(seconds=date_secs_since_itx_epoch)
+
+            if entry_type_raw in [1, 2, 5]:
+                # Baudot type
+                entry_type = 'I'
+            elif entry_type_raw in [3, 4]:
+                # ASCII type
+                entry_type = 'A'
+            else:
+                # non-supported type (0: deleted; 6: e-mail)
+                return None
 
-#---rowo commented out: user nowhere :-) replaced by query_TNS_bin
+            if entry_type_raw in [1, 3]:
+                # fixed hostname given
+                host = hostname
+            else:
+                # IP address given
+                host = ip_address
+
+            user = {
+                'TNum': number_recv,
+                'ENum': extension,
+                'Name': name,
+                'Type': entry_type,
+                'Host': host,
+                'Port': port
+            }
+            l.info('Found user in TNS: '+str(user))
+            return user
+        else:
+            raise ValueError("Unexpected TNS reply 0x{0:02x}".format(data[0]))
+
+#---rowo commented out: user nowhere :-) replaced by _query_TNS_bin
 #    @classmethod
 #    def query_TNS(cls, number):
 #        # get IP of given number from Telex-Number-Server (TNS)
@@ -321,27 +449,20 @@ class TelexITelexClient(txDevITelexCommon.TelexITelexCommon):
 
     @classmethod
     def query_userlist(cls, number):
-        # get IP of given number from CSV file
-        # the header items must be: 'nick,tnum,extn,type,host,port,name' (can be in any order)
-        # typical rows in csv-file: 'FABLABWUE, 234200, -, I, fablab.dyn.nerd2nerd.org, 2342, "FabLab, Wuerzburg"'
-        try:
-            if not TelexITelexClient.USERLIST:
-                with open(cls._userlist, 'r') as f:
-                    dialect = csv.Sniffer().sniff(f.read(1024))
-                    f.seek(0)
-                    csv_reader = csv.DictReader(f, dialect=dialect, skipinitialspace=True)
-                    for user in csv_reader:
-                        TelexITelexClient.USERLIST.append(dict(user))
-
-            for user in TelexITelexClient.USERLIST:
-                if number == user['Nick'] or number == user['TNum']:
-                    l.info('Found user in local userlist: '+repr(user))
-                    return user
-
-        except:
-            pass
-
-        return None
+        # get IP of given number from CSV file (see txUserList); the file is
+        # only read again if it has changed
+        if not cls._userlist_index or cls._userlist_index.file_name != cls._userlist:
+            TelexITelexClient._userlist_index = txUserList.UserList(cls._userlist)
+
+        # Abbreviations only for nicks and short numbers, full telex numbers
+        # are left to the TNS
+        if cls._userlist_abbreviated and (len(number) < 5 or not number.isdigit()):
+            user = cls._userlist_index.find_abbreviated(number)
+        else:
+            user = cls._userlist_index.find(number)
+        if user:
+            l.info('Found user in local userlist: '+repr(user))
+        return user
 
 #######
 
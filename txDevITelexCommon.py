@@ -9,8 +9,8 @@ __license__     = "GPL3"
 __version__     = "0.0.1"
 
 from threading import Lock
+from collections import deque
 import socket
-import time
 import datetime
 import sys
 #---rowo
@@ -25,12 +25,28 @@ l = logging.getLogger("piTelex." + __name__)
 
 import txCode
 import txBase
+import txBuffer
+import txITelexPacket
+import txITelexFlow
+import txTNS
 
 # i-Telex allowed package types for Baudot texting mode
 # (everything else triggers ASCII texting mode)
 from itertools import chain
 allowed_types = lambda: chain(range(0x00, 0x09+1), range(0x10, 0x1f+1))
 
+# Maximum number of bytes received at once; packets are split off by
+# txITelexPacket.PacketDecoder
+RECV_SIZE = 4096
+
+# Maximum number of Baudot codes per Baudot Data packet sent
+BAUDOT_PACKET_SIZE = 40
+
+# Maximum number of characters sent at once on ASCII connections, and the
+# characters not sent at all there (Baudot mode switches, bell, no-break)
+ASCII_SEND_SIZE = 250
+ASCII_SEND_DROP = str.maketrans('', '', '<>°%')
+
 #######
 
 # Decoding and encoding of extension numbers (see i-Telex specification, r874)
@@ -97,6 +113,20 @@ def display_hex(data:bytes) -> str:
     """
     return " ".join(hex(i) for i in data)
 
+class LazyHex:
+    """
+    Wrapper for passing data to logging calls as an argument: display_hex is
+    only run if the message is actually emitted, e.g.
+    l.debug('Sending ... (%s)', LazyHex(data))
+    """
+    __slots__ = ('data',)
+
+    def __init__(self, data:bytes):
+        self.data = data
+
+    def __str__(self) -> str:
+        return display_hex(self.data)
+
 
 class ST(enum.IntEnum):
     """
@@ -131,9 +161,14 @@ class TelexITelexCommon(txBase.TelexBase):
         # operating as server. For this reason, the _rx_lock MUST be acquired
         # while accessing it, or calculating anything depending on it.
         # Otherwise, bad stuff™ will ensue! Use "with" to prevent deadlocks.
-        self._rx_buffer = []
+        # It counts the printable characters in it for the Acknowledge
+        # counter (see update_acknowledge_counter).
+        self._rx_buffer = txBuffer.CountingBuffer()
         self._rx_lock = Lock()
-        self._tx_buffer = []
+        # _tx_lock keeps clear() out while send_data_baudot puts characters
+        # back into _tx_buffer; appending needs no lock
+        self._tx_buffer = txBuffer.Buffer()
+        self._tx_lock = Lock()
         self._connected = ST.DISCON
         self._run = True
 
@@ -148,6 +183,15 @@ class TelexITelexCommon(txBase.TelexBase):
         self._last_acknowledge_counter = 0
         self._send_acknowledge_idle = False
 
+        # Target number of characters sent but not yet printed by the remote
+        # (subclasses take it from the "send_window" parameter), and flow
+        # control of the current or last connection
+        self._send_window = txITelexFlow.SEND_WINDOW
+        self.send_flow = None
+
+        # Never send data from one i-Telex connection back to another
+        self.ignores_data_from = ('iTc', 'iTs')
+
     def __del__(self):
         self.exit()
         super().__del__()
@@ -206,7 +250,8 @@ class TelexITelexCommon(txBase.TelexBase):
         l.debug("disconnect_client()")
         if self._tx_buffer:
             l.warning("While disconnecting, transmit buffer not empty, discarded; contents were: {!r}".format(self._tx_buffer))
-        self._tx_buffer = []
+        with self._tx_lock:
+            self._tx_buffer.clear()
         # Set to fully disconnected only if printer buffer is empty. Otherwise,
         # ST.DISCON will be set in write method upon receipt of ESC-~0.
         self._connected = ST.DISCON_TP_WAIT if self._print_buf_len else ST.DISCON
@@ -233,9 +278,12 @@ class TelexITelexCommon(txBase.TelexBase):
 
         The number of printed characters equals the received characters minus
         all characters "on the way", i.e. residing in any buffer.
+
+        rx_buffer_unread is kept up to date by the rx buffer itself as items
+        are added and read, so this is O(1) regardless of the backlog.
         """
         with self._rx_lock:
-            rx_buffer_unread = len([i for i in self._rx_buffer if not i.startswith("\x1b")])
+            rx_buffer_unread = self._rx_buffer.data_len()
             self._acknowledge_counter = self._received_counter - print_buf_len - rx_buffer_unread
             if self._acknowledge_counter < self._last_acknowledge_counter:
                 # New count is smaller than before: reset it to the old value to
@@ -245,7 +293,7 @@ class TelexITelexCommon(txBase.TelexBase):
                 l.info("rx_buffer contents: {!r}".format(self._rx_buffer))
                 self._acknowledge_counter = self._last_acknowledge_counter
             else:
-                l.debug("{}(received_counter) - {}(print_buf_len) - {}(rx_buffer_unread) = {}(acknowledge_counter)".format(self._received_counter, print_buf_len, rx_buffer_unread, self._acknowledge_counter))
+                l.debug("%d(received_counter) - %d(print_buf_len) - %d(rx_buffer_unread) = %d(acknowledge_counter)", self._received_counter, print_buf_len, rx_buffer_unread, self._acknowledge_counter)
                 self._last_acknowledge_counter = self._acknowledge_counter
 
 
@@ -254,15 +302,48 @@ class TelexITelexCommon(txBase.TelexBase):
 
         # print("process_connection")
 
+        # Blocking driver for connection_steps: receive what it asks for and
+        # pass it on, or pass on the exception raised by recv. A timeout
+        # (nothing received within 0.2 s) is its tick for sending.
+        s.settimeout(0.2)
+        steps = self.connection_steps(s, is_server, is_ascii)
+        try:
+            size = next(steps)
+            while True:
+                try:
+                    data = s.recv(size)
+                except Exception as e:
+                    size = steps.throw(e)
+                else:
+                    size = steps.send(data)
+        except StopIteration:
+            pass
+
+
+    def connection_steps(self, s, is_server:bool, is_ascii:bool):
+        """
+        Protocol handling for a client or server connection, independent of
+        how the data is received.
+
+        This is a generator: it yields the number of bytes it wants to
+        receive next (at most), and expects the data received to be sent into
+        it (empty if the remote has closed the connection). The data is split
+        into packets by txITelexPacket.PacketDecoder, so chunks of any size
+        will do. Receive errors,
+        including socket.timeout if nothing has been received for 0.2 s, are
+        to be thrown into it. It ends when the connection has ended.
+
+        s is only used for sending (sendall); see process_connection for the
+        blocking socket driver and txAsync for the asyncio one.
+        """
         bmc = txCode.BaudotMurrayCode(False, False, True)
-        sent_counter = 0
+        decoder = txITelexPacket.PacketDecoder()
+        packets = deque()
+        flow = self.send_flow = txITelexFlow.FlowControl(self._send_window)
         self._received_counter = 0
         timeout_counter = -1
-        time_next_send = None
         error = False
 
-        s.settimeout(0.2)
-
         self._connected = ST.CON_INIT
 
         # Store remote protocol version to control negotiation
@@ -318,6 +399,11 @@ class TelexITelexCommon(txBase.TelexBase):
         # Start with ST.DISCON to trigger log message
         _connected_before = ST.DISCON
         while self._connected > ST.DISCON:
+            # Wake up main loop if the last packet (or state change) queued
+            # anything to be read
+            if self._rx_buffer:
+                self.notify_data_ready()
+
             if _connected_before != self._connected:
                 l.info("State transition: {!s}=>{!s}".format(_connected_before, self._connected))
                 _connected_before = self._connected
@@ -330,20 +416,20 @@ class TelexITelexCommon(txBase.TelexBase):
                         # advance to ST.CON_TP_RUN and do what's in
                         # the following else block)
                         self._connected = ST.CON_TP_REQ
-                        self._rx_buffer.append('\x1bA')
+                        with self._rx_lock: self._rx_buffer.append('\x1bA')
                     else:
                         # Printer already running; welcome banner
                         # will be sent above in next iteration if
                         # we're server
                         self._connected = ST.CON_TP_RUN
-                        self._rx_buffer.append('\x1bA')
+                        with self._rx_lock: self._rx_buffer.append('\x1bA')
                     continue
                 # We just entered ST.CON_TP_RUN (printer running, waiting for
                 # welcome banner)
                 elif self._connected == ST.CON_TP_RUN:
                     if is_server:
                         # Send welcome banner
-                        self._tx_buffer = []
+                        self._tx_buffer.clear()
                         self.send_welcome(s)
                     else:
                         # We're client: skip ST.CON_TP_RUN
@@ -370,38 +456,45 @@ class TelexITelexCommon(txBase.TelexBase):
                         self.send_ack(s, (-24 if is_server else 0)) # fixed length of welcome banner, see txDevMCP
 
             try:
-                data = s.recv(1)
-                
-                # piTelex terminates; close connection
-                if not self._run:
-                    break
+                if not packets:
+                    chunk = yield RECV_SIZE
 
-                # lost connection
-                if not data:
-                    l.warning("Remote has closed connection")
-                    break
+                    # piTelex terminates; close connection
+                    if not self._run:
+                        break
+
+                    # lost connection
+                    if not chunk:
+                        l.warning("Remote has closed connection")
+                        break
+
+                    packets.extend(decoder.feed(chunk))
+                    if not packets:
+                        # Only part of a packet received so far
+                        continue
+
+                # Handle one packet per loop, so that state transitions above
+                # are handled in-between
+                packet = packets.popleft()
+                data = packet.raw
 
                 # Telnet control sequence
-                elif data[0] == 255:
-                    d = s.recv(2)   # skip next 2 bytes from telnet command
+                if isinstance(packet, txITelexPacket.TelnetCommand):
+                    pass   # skip telnet command
 
                 # i-Telex packet
-                elif data[0] in allowed_types():
+                elif not isinstance(packet, txITelexPacket.AsciiData):
                     packet_error = False
 
-                    d = s.recv(1)
-                    data += d
-                    packet_len = d[0]
-                    if packet_len:
-                        data += s.recv(packet_len)
+                    packet_len = len(data) - 2
 
                     # Heartbeat
                     if data[0] == 0 and packet_len == 0:
-                        l.debug('Received i-Telex packet: Heartbeat ({})'.format(display_hex(data)))
+                        l.debug('Received i-Telex packet: Heartbeat (%s)', LazyHex(data))
 
                     # Direct Dial
                     elif data[0] == 1 and packet_len == 1:
-                        l.debug('Received i-Telex packet: Direct dial ({})'.format(display_hex(data)))
+                        l.debug('Received i-Telex packet: Direct dial (%s)', LazyHex(data))
 
                         # Disable emitting "direct dial" command, since it's
                         # currently not acted upon anywhere.
@@ -434,7 +527,7 @@ class TelexITelexCommon(txBase.TelexBase):
 
                     # Baudot Data
                     elif data[0] == 2 and packet_len >= 1 and packet_len <= 50:
-                        l.debug('Received i-Telex packet: Baudot data ({})'.format(display_hex(data)))
+                        l.debug('Received i-Telex packet: Baudot data (%s)', LazyHex(data))
                         aa = bmc.decodeBM2A(data[2:])
                         if self._connected == ST.CON_INIT:
                             if not self._printer_running:
@@ -451,10 +544,7 @@ class TelexITelexCommon(txBase.TelexBase):
                                 self._connected = ST.CON_TP_RUN
                                 with self._rx_lock: self._rx_buffer.append('\x1bA')
                         with self._rx_lock:
-                            for a in aa:
-                                if a == '@':
-                                    a = '#'
-                                self._rx_buffer.append(a)
+                            self._rx_buffer.extend(aa.replace('@', '#'))
                         self._received_counter += len(data[2:])
                         # Send Acknowledge if printer is running and we've got
                         # at least 16 characters left to print
@@ -463,13 +553,13 @@ class TelexITelexCommon(txBase.TelexBase):
 
                     # End
                     elif data[0] == 3 and packet_len == 0:
-                        l.debug('Received i-Telex packet: End ({})'.format(display_hex(data)))
+                        l.debug('Received i-Telex packet: End (%s)', LazyHex(data))
                         l.info('End by remote')
                         break
 
                     # Reject
                     elif data[0] == 4 and packet_len <= 20:
-                        l.debug('Received i-Telex packet: Reject ({})'.format(display_hex(data)))
+                        l.debug('Received i-Telex packet: Reject (%s)', LazyHex(data))
                         aa = data[2:].decode('ASCII', errors='ignore')
                         # i-Telex may pad with \x00 (e.g. "nc\x00"); remove padding
                         aa = aa.rstrip('\x00')
@@ -483,7 +573,7 @@ class TelexITelexCommon(txBase.TelexBase):
 
                     # Acknowledge
                     elif data[0] == 6 and packet_len == 1:
-                        l.debug('Received i-Telex packet: Acknowledge ({})'.format(display_hex(data)))
+                        l.debug('Received i-Telex packet: Acknowledge (%s)', LazyHex(data))
                         if self._connected == ST.CON_INIT:
                             if not self._printer_running:
                                 # Request printer start; confirmation will
@@ -498,19 +588,10 @@ class TelexITelexCommon(txBase.TelexBase):
                                 # we're server
                                 self._connected = ST.CON_TP_RUN
                                 with self._rx_lock: self._rx_buffer.append('\x1bA')
-                        # TODO: Fix calculation and prevent overflows, e.g. if
-                        # the first ACK is sent with a low positive value. This
-                        # might be done by saving the first ACK's absolute
-                        # counter value and only doing difference calculations
-                        # afterwards.
-                        unprinted = (sent_counter - int(data[2])) & 0xFF
-                        #if unprinted < 0:
-                        #    unprinted += 256
-                        l.debug(str(data[2])+'/'+str(sent_counter)+'='+str(unprinted) + " (printed/sent=unprinted)")
-                        if unprinted < 7:   # about 1 sec
-                            time_next_send = None
-                        else:
-                            time_next_send = time.monotonic() + (unprinted-6)*0.15
+                        # Characters in flight; the flow control paces
+                        # sending by it
+                        unprinted = flow.on_ack(data[2])
+                        l.debug("%d/%d=%d (printed/sent=unprinted)", data[2], flow.sent, unprinted)
                         # Send Acknowledge if printer is running and remote end
                         # has printed all sent characters
                         # ! Better not, this will create an Ack flood !
@@ -560,13 +641,13 @@ class TelexITelexCommon(txBase.TelexBase):
 
                     # Self test
                     elif data[0] == 8 and packet_len >= 2:
-                        l.debug('Received i-Telex packet: Self test ({})'.format(display_hex(data)))
+                        l.debug('Received i-Telex packet: Self test (%s)', LazyHex(data))
 
                     # Remote config
                     elif data[0] == 9 and packet_len >= 3:
                         l.info('Received i-Telex packet: Remote config ({})'.format(display_hex(data)))
 
-                    # Wrong packet - will resync at next socket.timeout
+                    # Wrong packet - skipped as a whole
                     else:
                         l.warning('Received invalid i-Telex Packet: {}'.format(display_hex(data)))
                         packet_error = True
@@ -586,7 +667,7 @@ class TelexITelexCommon(txBase.TelexBase):
 
                 # ASCII character(s)
                 else:
-                    l.debug('Received non-i-Telex data: {} ({})'.format(repr(data), display_hex(data)))
+                    l.debug('Received non-i-Telex data: %r (%s)', data, LazyHex(data))
 
                     if is_server and self._block_ascii:
                         l.warning("Incoming ASCII connection blocked")
@@ -645,7 +726,7 @@ class TelexITelexCommon(txBase.TelexBase):
                     if is_ascii:
                         if self._tx_buffer:
                             sent = self.send_data_ascii(s)
-                            sent_counter += sent
+                            flow.on_sent(sent)
 
                     else:   # baudot
                         if (timeout_counter % 5) == 0:   # every 1 sec
@@ -658,14 +739,14 @@ class TelexITelexCommon(txBase.TelexBase):
                                     break
 
                         if self._tx_buffer:
-                            if time_next_send and time.monotonic() < time_next_send:
-                                l.debug('Sending paused for {:.3f} s'.format(time_next_send-time.monotonic()))
-                                pass
+                            # Keep the remote's window filled, but don't
+                            # overrun it
+                            allowed = flow.allowance()
+                            if allowed:
+                                sent = self.send_data_baudot(s, bmc, allowed)
+                                flow.on_sent(sent)
                             else:
-                                sent = self.send_data_baudot(s, bmc)
-                                sent_counter += sent
-                                if sent > 7:
-                                    time_next_send = time.monotonic() + (sent-6)*0.15
+                                l.debug('Sending paused, %.1f characters in flight', flow.in_flight())
 
                         elif (timeout_counter % 15) == 0:   # every 3 sec
                             #self.send_heartbeat(s)
@@ -704,6 +785,8 @@ class TelexITelexCommon(txBase.TelexBase):
             # - Network error: There's no connection to send over anymore.
             if not error:
                 self.send_end(s)
+        if flow.sent:
+            l.info('Send statistics: ' + flow.stats_text())
         l.info('end connection')
         self.disconnect_client()
         if _connected_before != self._connected:
@@ -713,7 +796,7 @@ class TelexITelexCommon(txBase.TelexBase):
     def send_heartbeat(self, s):
         '''Send heartbeat packet (0)'''
         data = bytearray([0, 0])
-        l.debug('Sending i-Telex packet: Heartbeat ({})'.format(display_hex(data)))
+        l.debug('Sending i-Telex packet: Heartbeat (%s)', LazyHex(data))
         s.sendall(data)
 
 
@@ -746,7 +829,7 @@ class TelexITelexCommon(txBase.TelexBase):
         #
         # - After a 1 s sending break (NB we don't fulfil this exactly, but it
         #   should suffice)
-        # - Acknowledge is received and sent_counter equals the packet's data
+        # - Acknowledge is received and flow.sent equals the packet's data
         #   field (i.e. the remote side has printed all sent characters)
         # - Baudot Data is received and self.get_print_buf_len() >= 16
 
@@ -762,7 +845,7 @@ class TelexITelexCommon(txBase.TelexBase):
         # - The command shouldn't be sent multiple times for the same payload
 
         data = bytearray([6, 1, printed & 0xff])
-        l.debug('Sending i-Telex packet: Acknowledge ({})'.format(display_hex(data)))
+        l.debug('Sending i-Telex packet: Acknowledge (%s)', LazyHex(data))
         s.sendall(data)
 
 
@@ -774,7 +857,7 @@ class TelexITelexCommon(txBase.TelexBase):
         if len(version) < 6:
             send.append(0)
         send[1] = len(send) - 2 # length
-        l.debug('Sending i-Telex packet: Version ({})'.format(display_hex(send)))
+        l.debug('Sending i-Telex packet: Version (%s)', LazyHex(send))
         s.sendall(send)
 
 
@@ -784,35 +867,46 @@ class TelexITelexCommon(txBase.TelexBase):
         data = bytearray([1, 1])   # Direct Dial
         ext = encode_ext_for_direct_dial(dial)
         data.append(ext)
-        l.debug('Sending i-Telex packet: Direct dial ({})'.format(display_hex(data)))
+        l.debug('Sending i-Telex packet: Direct dial (%s)', LazyHex(data))
         s.sendall(data)
 
 
     def send_data_ascii(self, s):
         '''Send ASCII data direct'''
-        a = ''
-        while self._tx_buffer and len(a) < 250:
-            b = self._tx_buffer.pop(0)
-            if b not in '<>°%':
-                a += b
-        data = a.encode('ASCII')
-        l.debug('Sending non-i-Telex data: {} ({})'.format(repr(data), display_hex(data)))
-        s.sendall(data)
+        chars = self._tx_buffer.pop_many(ASCII_SEND_SIZE)
+        data = ''.join(chars).translate(ASCII_SEND_DROP).encode('ASCII')
+        if data:
+            l.debug('Sending non-i-Telex data: %r (%s)', data, LazyHex(data))
+            s.sendall(data)
         return len(data)
 
 
-    def send_data_baudot(self, s, bmc):
-        '''Send baudot data packet (2)'''
-        data = bytearray([2, 0])
-        while self._tx_buffer and len(data) < 42:
-            a = self._tx_buffer.pop(0)
-            bb = bmc.encodeA2BM(a)
-            if bb:
-                for b in bb:
-                    data.append(b)
-        length = len(data) - 2
-        data[1] = length
-        l.debug('Sending i-Telex packet: Baudot data ({})'.format(display_hex(data)))
+    def send_data_baudot(self, s, bmc, limit:int=BAUDOT_PACKET_SIZE):
+        '''
+        Send baudot data packets (2), at most about limit codes in all
+
+        The pending characters are encoded in one go, split into packets of
+        at most BAUDOT_PACKET_SIZE codes and sent by a single sendall.
+        Characters beyond limit stay in the buffer for the next call.
+        '''
+        with self._tx_lock:
+            chars = self._tx_buffer.pop_many(limit)
+            codes, used = bmc.encode_limited(''.join(chars), limit)
+            if used < len(chars):
+                # Only this thread pops from the front, so the rest can go
+                # back there while the main loop keeps appending
+                self._tx_buffer.extendleft(reversed(chars[used:]))
+        length = len(codes)
+        if not length:
+            return 0
+
+        data = bytearray()
+        for start in range(0, length, BAUDOT_PACKET_SIZE):
+            packet = codes[start:start + BAUDOT_PACKET_SIZE]
+            data.append(2)
+            data.append(len(packet))
+            data += packet
+        l.debug('Sending i-Telex packet(s): Baudot data (%s)', LazyHex(data))
         s.sendall(data)
         return length
 
@@ -820,7 +914,7 @@ class TelexITelexCommon(txBase.TelexBase):
     def send_end(self, s):
         '''Send end packet (3)'''
         send = bytearray([3, 0])   # End
-        l.debug('Sending i-Telex packet: End ({})'.format(display_hex(send)))
+        l.debug('Sending i-Telex packet: End (%s)', LazyHex(send))
         try:   # socket can possible be closed by other side
             s.sendall(send)
         except:
@@ -848,7 +942,7 @@ class TelexITelexCommon(txBase.TelexBase):
         '''Send reject packet (4)'''
         send = bytearray([4, len(msg)])   # Reject
         send.extend([ord(i) for i in msg])
-        l.debug('Sending i-Telex packet: Reject ({})'.format(display_hex(send)))
+        l.debug('Sending i-Telex packet: Reject (%s)', LazyHex(send))
         l.info('Reject, reason {!r}'.format(msg))
         s.sendall(send)
 
@@ -863,14 +957,14 @@ class TelexITelexCommon(txBase.TelexBase):
         # TNS pin
         tns_pin = self._tns_pin.to_bytes(length=2, byteorder="little")
         send.extend(tns_pin)
-        l.debug('Sending i-Telex packet: Connect Remote ({})'.format(display_hex(send)))
+        l.debug('Sending i-Telex packet: Connect Remote (%s)', LazyHex(send))
         s.sendall(send)
 
 
     def send_accept_call_remote(self, s):
         '''Send accept call remote packet (0x84)'''
         send = bytearray([132, 0])   # 84 Accept call remote
-        l.debug('Sending i-Telex packet: Accept call remote ({})'.format(display_hex(send)))
+        l.debug('Sending i-Telex packet: Accept call remote (%s)', LazyHex(send))
         s.sendall(send)
 
     def send_welcome(self, s):
@@ -922,33 +1016,37 @@ class TelexITelexCommon(txBase.TelexBase):
 
 #######
 
+    @classmethod
+    def tns_servers(cls):
+        """
+        Return the health tracker (txTNS.TNSServers) for the TNS servers
+        configured by "tns_srv" in telex.json (default see above).
+        """
+        return txTNS.get_servers(cls._tns_addresses, cls._tns_port)
+
+
     @classmethod
     def choose_tns_address(cls):
         """
-        Return a valid TNS (Telex number server) address:
-        Servers are tested for connectivity in the order of the given set of servers,
-        default see above. Can be overridden by the value of "tns_srv" in telex.json
-        Assumes that at least one of the servers is functional and responding.
+        Return a valid TNS (Telex number server) address, without blocking:
+        The last one that worked, or else the fastest one found by the
+        background probes (see txTNS.TNSServers).
         """
-        _srvno = 0
-        while _srvno < len(cls._tns_addresses):
-            _srv = (cls._tns_addresses[_srvno])
-            l.info('Trying TNS: '+_srv)
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                try:
-                    s.settimeout(3.0)
-                    s.connect((_srv, cls._tns_port))
-                except (socket.error, ConnectionError) as e:
-                    l.info(e)
-                    _srvno += 1
-                else:
-                    _srvno=len(cls._tns_addresses)
-                finally:
-                    s.close()
+        _srv = cls.tns_servers().best()
         l.info("TNS selected: "+_srv)
         return _srv
 
 
+    @classmethod
+    def connect_tns(cls, timeout:float=3.0) -> socket.socket:
+        """
+        Return socket connected to the best reachable TNS server. If it
+        doesn't answer, the next best ones are tried. Raise OSError if none
+        can be reached.
+        """
+        return cls.tns_servers().connect(timeout)
+
+
 #######
 
 
@@ -8,7 +8,9 @@ __copyright__   = "Copyright 2018, JK"
 __license__     = "GPL3"
 __version__     = "0.0.1"
 
-from threading import Thread, Event
+from threading import Thread
+import asyncio
+import functools
 import socket
 import time
 import sys
@@ -18,12 +20,17 @@ l = logging.getLogger("piTelex." + __name__)
 
 import txCode
 import txBase
+import txAsync
 import txDevITelexCommon
 from txDevITelexCommon import ST
 
 #                        Code  Len   Data ...
 selftest_packet = bytes([0x08, 0x04, 0xDE, 0xCA, 0xFB, 0xAD])
 
+# Intervals of TNS update and connection self-test (s), see on_selftest
+TNS_UPDATE_INTERVAL = 3600
+SELFTEST_INTERVAL = 20
+
 #######
 
 class TelexITelexSrv(txDevITelexCommon.TelexITelexCommon):
@@ -32,6 +39,7 @@ class TelexITelexSrv(txDevITelexCommon.TelexITelexCommon):
 
         self.id = 'iTs'
         self.params = params
+        self.needs_polling = False
 
         port = params.get('port', 0)
         if port > 0:
@@ -65,24 +73,33 @@ class TelexITelexSrv(txDevITelexCommon.TelexITelexCommon):
 
         self._block_ascii = params.get('block_ascii', True)
 
-        self.clients = {}
+        self._send_window = params.get('send_window', self._send_window)
 
-        self.SERVER = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        # Set socket option to bind in spite of TIME_WAIT connections. This is
-        # to facilitate rapid restarting if necessary (rapid meaning < 2*MSL or
-        # < 240 s).
-        # https://stackoverflow.com/questions/5040491/python-socket-doesnt-close-connection-properly
-        self.SERVER.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.SERVER.bind(('', self._local_port))
+        self.clients = {}
 
-        # Set timeout for server socket so that calling accept will not block
-        # indefinitely. Otherwise, the server thread would prevent quitting
-        # piTelex.
-        self.SERVER.settimeout(2.0)
+        # Handle all connections (call, rejected callers, self-tests) on the
+        # shared asyncio event loop instead of a thread per connection
+        self._asyncio = params.get('asyncio', False)
 
-        self.SERVER.listen(2)
-        #print("Waiting for connection...")
-        Thread(target=self.thread_srv_accept_incoming_connections, name='iTelexSrvAC').start()
+        if self._asyncio:
+            self.SERVER = txAsync.run(self.async_srv_start()).result()
+        else:
+            self.SERVER = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            # Set socket option to bind in spite of TIME_WAIT connections. This is
+            # to facilitate rapid restarting if necessary (rapid meaning < 2*MSL or
+            # < 240 s).
+            # https://stackoverflow.com/questions/5040491/python-socket-doesnt-close-connection-properly
+            self.SERVER.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.SERVER.bind(('', self._local_port))
+
+            # Set timeout for server socket so that calling accept will not block
+            # indefinitely. Otherwise, the server thread would prevent quitting
+            # piTelex.
+            self.SERVER.settimeout(2.0)
+
+            self.SERVER.listen(2)
+            #print("Waiting for connection...")
+            Thread(target=self.thread_srv_accept_incoming_connections, name='iTelexSrvAC').start()
 
         # Record number of failed tests and TNS updates
         self.update_tns_fail = 0
@@ -91,8 +108,8 @@ class TelexITelexSrv(txDevITelexCommon.TelexITelexCommon):
         # Own public IP address; updated by TNS queries
         self.ip_address = None
 
-        # Threading event for self-test coordination
-        self.selftest_event = Event()
+        # Future set when our own self-test packet arrives (event loop)
+        self._selftest_waiter = None
 
         # Flag for printer start timeout; terminate connection if it did
         self.printer_start_timed_out = False
@@ -100,20 +117,30 @@ class TelexITelexSrv(txDevITelexCommon.TelexITelexCommon):
         # Flag for blocking inbound connections when an outbound one is active
         self.block_inbound = False
 
-        # Create event just for sleeping. The event is only triggered on
-        # quitting piTelex, to wake up everyone still sleeping.
-        self.term = Event()
+        # Periodic TNS update and self-test jobs on the shared event loop (see
+        # on_selftest)
+        self._tns_job = None
+        self._selftest_job = None
 
         if self._number:
             # Own number given: update own information in TNS (telex number
             # server) if needed
-            Thread(target=self.thread_handle_tns_update, name='iTelexTNSupd').start()
+            self._tns_job = txAsync.schedule(('tns_update', self._number, self._tns_pin, self._public_port),
+                functools.partial(self.async_update_tns_record, self._number, self._tns_pin, self._public_port),
+                TNS_UPDATE_INTERVAL, first=0, listener=self.on_tns_update)
+            self._selftest_job = txAsync.schedule(('selftest', self._public_port),
+                self.async_test_connection, SELFTEST_INTERVAL, listener=self.on_selftest)
 
     def exit(self):
         self._run = False
-        self.term.set()
+        if self._tns_job:
+            txAsync.unschedule(self._tns_job, self.on_tns_update)
+            txAsync.unschedule(self._selftest_job, self.on_selftest)
         self.disconnect_client()
-        self.SERVER.close()
+        if self._asyncio:
+            txAsync.call_soon(self.SERVER.close)
+        else:
+            self.SERVER.close()
 
     # =====
 
@@ -127,7 +154,18 @@ class TelexITelexSrv(txDevITelexCommon.TelexITelexCommon):
                         if item.startswith('\x1b'):
                             return self._rx_buffer.pop(nr)
                 else:
-                    return self._rx_buffer.pop(0)
+                    return self._rx_buffer.popleft()
+
+
+    def read_batch(self) -> list:
+        with self._rx_lock:
+            if ST.DISCON < self._connected <= ST.CON_TP_RUN:
+                # Welcome banner hasn't been sent yet (see read)
+                for nr, item in enumerate(self._rx_buffer):
+                    if item.startswith('\x1b'):
+                        return [self._rx_buffer.pop(nr)]
+                return []
+            return self._rx_buffer.pop_batch()
 
 
     def write(self, a:str, source:str):
@@ -165,6 +203,15 @@ class TelexITelexSrv(txDevITelexCommon.TelexITelexCommon):
 
         self._tx_buffer.append(a)
 
+
+    def write_batch(self, items:list, source:str) -> list:
+        if len(items[0]) != 1:
+            # Command: handle like a single write
+            return super().write_batch(items, source)
+        if source not in ['iTc', 'iTs']:
+            self._tx_buffer.extend(items)
+        return items
+
     # =====
 
     def thread_srv_accept_incoming_connections(self):
@@ -198,27 +245,50 @@ class TelexITelexSrv(txDevITelexCommon.TelexITelexCommon):
             if client_address[0] == self.ip_address:
                 data = client.recv(128)
                 if data == selftest_packet:
-                    # Signal self-test thread that we received the packet
-                    self.selftest_event.set()
+                    # Signal self-test that we received the packet
+                    self.selftest_received()
                     client.close()
                     continue
-            l.info("%s:%s has connected" % client_address)
-            if self.clients or self.block_inbound or self._connected != ST.DISCON:
-                # Our line is occupied (occ), reject client. Little issue here:
-                # ASCII clients get an i-Telex package. But the content should
-                # be readable enough to infer our message.
-                try: # connection can already be closed at this point
-                    self.send_reject(client, "occ")
-                except:
-                    pass
-                l.warning("Rejecting client (occupied)")
-                client.close()
+            if not self.srv_accept_client(client, client_address):
                 continue
-            self.clients[client] = client_address
-            self._tx_buffer = []
             Thread(target=self.thread_srv_handle_client, name='iTelexSrvHC', args=(client,)).start()
 
 
+    def srv_accept_client(self, client, client_address) -> bool:
+        """
+        Register new client if our line is free; reject it otherwise. Return
+        True if the client is to be handled.
+        """
+        l.info("%s:%s has connected" % client_address[:2])
+        if self.clients or self.block_inbound or self._connected != ST.DISCON:
+            # Our line is occupied (occ), reject client. Little issue here:
+            # ASCII clients get an i-Telex package. But the content should
+            # be readable enough to infer our message.
+            try: # connection can already be closed at this point
+                self.send_reject(client, "occ")
+            except:
+                pass
+            l.warning("Rejecting client (occupied)")
+            client.close()
+            return False
+        self.clients[client] = client_address
+        with self._tx_lock:
+            self._tx_buffer.clear()
+        return True
+
+
+    def srv_client_ended(self, s):
+        """Clean up after the connection to client s has ended."""
+        s.close()
+
+# rowo don't force Z mode (would wake up from ZZ...), but trigger transit to sleep
+#        with self._rx_lock: self._rx_buffer.append('\x1bZ')
+        with self._rx_lock: self._rx_buffer.append('\x1bST')
+        self._printer_running = False
+        self.notify_data_ready()
+        del self.clients[s]
+
+
     def thread_srv_handle_client(self, s):  # Takes client socket as argument.
         """Handles a single client connection."""
         try:
@@ -228,17 +298,78 @@ class TelexITelexSrv(txDevITelexCommon.TelexITelexCommon):
             l.error("Exception caught:", exc_info = sys.exc_info())
             self.disconnect_client()
 
-        s.close()
+        self.srv_client_ended(s)
 
-# rowo don't force Z mode (would wake up from ZZ...), but trigger transit to sleep
-#        with self._rx_lock: self._rx_buffer.append('\x1bZ')
-        with self._rx_lock: self._rx_buffer.append('\x1bST')
-        self._printer_running = False
-        del self.clients[s]
+    # -----
+
+    async def async_srv_start(self):
+        """Start listening on the shared event loop (asyncio mode)."""
+        return await asyncio.start_server(self.async_srv_handle_client,
+            host='', port=self._local_port, family=socket.AF_INET,
+            reuse_address=True)
+
+
+    async def async_srv_handle_client(self, reader, writer):
+        """
+        Handles a single client connection in asyncio mode; counterpart of
+        thread_srv_accept_incoming_connections and thread_srv_handle_client.
+        """
+        client = txAsync.StreamSocket(reader, writer)
+        client_address = writer.get_extra_info('peername')
+
+        # Recognise self-tests early and mute them
+        if client_address[0] == self.ip_address:
+            try:
+                data = await asyncio.wait_for(reader.read(128), 3.0)
+            except (asyncio.TimeoutError, OSError):
+                data = b''
+            if data == selftest_packet:
+                # Signal self-test that we received the packet
+                self.selftest_received()
+                client.close()
+                return
+
+        if not self.srv_accept_client(client, client_address):
+            return
+
+        try:
+            await txAsync.drive_connection(self.connection_steps(client, True, None), reader, writer)
+
+        except Exception:
+            l.error("Exception caught:", exc_info = sys.exc_info())
+            self.disconnect_client()
 
-    def thread_handle_tns_update(self):
+        self.srv_client_ended(client)
+
+    def on_tns_update(self, result):
+        """
+        Handle result of a TNS update (see on_selftest): own IP address
+        on success, the exception otherwise. Called on the event loop.
         """
-        Check connection self-test status and act accordingly.
+        if isinstance(result, Exception):
+            self.update_tns_fail += 1
+            l.warning("self-test: TNS update failed {}x ({!s})".format(self.update_tns_fail, result))
+            if not self.ip_address:
+                # Startup: As long as own IP address not known, self-test not
+                # possible.
+                l.error("self-test: IP address unknown, connection test impossible, retrying in 60 min")
+            return
+        self.ip_address = result
+        self.update_tns_fail = 0
+        # If update succeeded, restart self-test
+        if self.test_connection_fail == 666:
+            l.info("self-test: TNS update successful, resuming self-test")
+            self.test_connection_fail = 0
+        else:
+            l.debug("self-test: TNS update successful")
+
+
+    def on_selftest(self, result):
+        """
+        Handle result of a connection self-test: True on success, None if
+        skipped, the exception otherwise. Called on the event loop. Check
+        connection self-test status and act accordingly; see tns_status for
+        the state.
 
         For details, see implementation and i-Telex Communication Specification
         (r874).
@@ -261,8 +392,10 @@ class TelexITelexSrv(txDevITelexCommon.TelexITelexCommon):
 
         Modifications for piTelex, to KISS:
 
-        - Run everything from single thread. Instead of precise timings, use
-          sleep in-between calls.
+        - Run everything as periodic jobs on the shared event loop (see
+          txAsync.schedule), without blocking: no thread of its own, and
+          several i-Telex modules share the loop. Instead of precise timings,
+          intervals vary a bit (jitter) and are rounded to whole seconds.
         - Do self-test every 20 s (no problem as we don't block "real"
           clients), rinse and repeat. Retry up to six times on fail.
         - After first six fails, trigger client_update. Retry self-test another
@@ -274,141 +407,133 @@ class TelexITelexSrv(txDevITelexCommon.TelexITelexCommon):
           problem will be noticed only then.
 
         """
-        while self._run:
-            # Update TNS record on startup to obtain own IP address. After
-            # that, update on hourly schedule (roughly).
-            result = self.update_tns_record()
-            if result is True:
-                self.update_tns_fail = 0
-                # If update succeeded, restart self-test
-                if self.test_connection_fail == 666:
-                    l.info("self-test: TNS update successful, resuming self-test")
-                    self.test_connection_fail = 0
-                else:
-                    l.debug("self-test: TNS update successful")
-            else:
-                self.update_tns_fail += 1
-                l.warning("self-test: TNS update failed {}x ({})".format(self.update_tns_fail, result))
+        if result is None:
+            return
+        if result is True:
+            self.test_connection_fail = 0
+            l.debug("self-test: connection test successful")
+            return
+        self.test_connection_fail += 1
+        l.warning("self-test: connection test failed {}x ({!s})".format(self.test_connection_fail, result))
+        if self.test_connection_fail == 6:
+            # After six failed tries, update TNS immediately.
+            self._tns_job.trigger()
 
-            # Startup: As long as own IP address not known, self-test not
-            # possible. Retry.
-            if not self.ip_address:
-                l.error("self-test: IP address unknown, connection test impossible, retrying in 60 min")
-                # Sleep and break only if application is terminated, carry on otherwise
-                if self.term.wait(3600): break
-                continue
 
-            for _ in range(180):
-                # Self-test every 20 s for about one hour, then exit this loop
-                # and restart while loop, updating TNS record.
-
-                # Sleep and break only if application is terminated, carry on otherwise
-                if self.term.wait(20): break
-
-                # If 2*6 self-tests fail consecutively, cease self-testing and
-                # only retry TNS update hourly.
-                if self.test_connection_fail >= 12:
-                    if self.test_connection_fail == 12:
-                        l.error("self-test: too many connection tests failed, retrying after next TNS update")
-                        # TODO print error with date
-                    # cheap trick to only log and print the error once, and
-                    # allow proper resetting above
-                    self.test_connection_fail = 666
-                    continue
+    def tns_status(self) -> dict:
+        """
+        Return state of TNS update and connection self-test: own IP address,
+        consecutive failures and last result, time and count of each job.
+        """
+        return {
+            'ip_address': self.ip_address,
+            'update_tns_fail': self.update_tns_fail,
+            'test_connection_fail': self.test_connection_fail,
+            'tns_update': self._tns_job.status() if self._tns_job else None,
+            'selftest': self._selftest_job.status() if self._selftest_job else None,
+        }
 
-                # OTOH, if self-test failed six times, but less than 12,
-                # continue self-testing no matter if the TNS update succeeded.
 
-                # Do connection self-test. Count failures, reset on success.
-                test_result = self.test_connection()
-                if test_result is True:
-                    self.test_connection_fail = 0
-                    l.debug("self-test: connection test successful")
-                else:
-                    self.test_connection_fail += 1
-                    l.warning("self-test: connection test failed {}x ({})".format(self.test_connection_fail, test_result))
+    def selftest_received(self):
+        """Our own self-test packet has arrived (thread-safe)."""
+        txAsync.call_soon(self._selftest_done)
+
 
-                if self.test_connection_fail == 6:
-                    # After six failed tries, update TNS immediately.
-                    break
+    def _selftest_done(self):
+        if self._selftest_waiter and not self._selftest_waiter.done():
+            self._selftest_waiter.set_result(True)
 
-    def test_connection(self):
+
+    async def async_test_connection(self):
         """
         Test if we can connect to ourselves. That's as much as we can do to
         check our external reachability. Nonstandard LAN routing setups may
         cause this to fail though, even if we're reachable externally.
 
-        return True on success, an error string otherwise.
+        return True on success, None if the test is skipped; raise an
+        exception on failure.
 
         For details, see implementation and i-Telex Communication Specification
         (r874).
         """
+        if not self.ip_address:
+            return None
+        # If 2*6 self-tests fail consecutively, cease self-testing and only
+        # retry TNS update hourly.
+        if self.test_connection_fail >= 12:
+            if self.test_connection_fail == 12:
+                l.error("self-test: too many connection tests failed, retrying after next TNS update")
+                # TODO print error with date
+            # cheap trick to only log and print the error once, and allow
+            # proper resetting in on_tns_update
+            self.test_connection_fail = 666
+            return None
+
+        # OTOH, if self-test failed six times, but less than 12, continue
+        # self-testing no matter if the TNS update succeeded.
+
+        # Create waiter before sending, so that an early answer isn't lost
+        self._selftest_waiter = asyncio.get_running_loop().create_future()
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.settimeout(3.0)
-                s.connect((self.ip_address, self._public_port))
-                qry = selftest_packet
-                # Reset selftest event before sending in case it was
-                # accidentally triggered before
-                self.selftest_event.clear()
-                s.sendall(qry)
-                s.close()
-                # Wait for confirmation from server thread
-                ret = self.selftest_event.wait(timeout = 1.0)
-                if not ret:
-                    ret = "self-test timeout"
-                self.selftest_event.clear()
-                return ret
-
-        except Exception as e:
-            return str(e)
-
-    def update_tns_record(self):
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.ip_address, self._public_port), 3.0)
+            writer.write(selftest_packet)
+            await writer.drain()
+            writer.close()
+            # Wait for confirmation from server
+            try:
+                await asyncio.wait_for(asyncio.shield(self._selftest_waiter), 1.0)
+            except asyncio.TimeoutError:
+                raise TimeoutError("self-test timeout") from None
+        finally:
+            self._selftest_waiter = None
+        return True
+
+
+    @classmethod
+    async def async_update_tns_record(cls, number:int, tns_pin:int, public_port:int):
         """
         Update own record on TNS server. Primary function: When the own ip
         address changes (e.g. because of a forced internet disconnection),
-        publish the new address with the TNS.
+        publish the new address with the TNS. Doesn't depend on the instance,
+        so that all instances with the same number, pin and port share the
+        job.
 
-        return True on success, an error string otherwise.
+        return own IP address on success; raise an exception otherwise.
 
         For details, see implementation and i-Telex Communication Specification
         (r874).
         """
+        reader, writer = await cls.tns_servers().open_connection(3.0)
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.settimeout(3.0)
-#                self._tns_port = 11811
-                s.connect((self.choose_tns_address(), self._tns_port))
-                # client_update packet:
-                #                Code  Len
-                qry = bytearray([0x01, 0x08])
-                # Number
-                number = self._number.to_bytes(length=4, byteorder="little")
-                qry.extend(number)
-                # TNS pin
-                tns_pin = self._tns_pin.to_bytes(length=2, byteorder="little")
-                qry.extend(tns_pin)
-                # Port
-                port = self._public_port.to_bytes(length=2, byteorder="little")
-                qry.extend(port)
-                s.sendall(qry)
-                data = s.recv(1024)
-                s.close()
-            if data[0] == 0x02: # Address_confirm
-                if not data[1] == 0x4:
-                    raise ValueError("Address_Confirm should have length 0x4, but has 0x{0:x} instead".format(data[1]))
-                # IP address
-                ip_address = ".".join([str(i) for i in data[2:6]])
-                self.ip_address = ip_address
-                return True
-            else: # Different type: dissect and log
-                msg_type = data[0]
-                length = data[1]
-                content = data[2:]
-                raise Exception("Unexpected answer to Address_confirm: type 0x{0:x}, content: ".format(msg_type), repr(content))
-
-        except Exception as e:
-            return str(e)
+            # client_update packet:
+            #                Code  Len
+            qry = bytearray([0x01, 0x08])
+            # Number
+            number = number.to_bytes(length=4, byteorder="little")
+            qry.extend(number)
+            # TNS pin
+            tns_pin = tns_pin.to_bytes(length=2, byteorder="little")
+            qry.extend(tns_pin)
+            # Port
+            port = public_port.to_bytes(length=2, byteorder="little")
+            qry.extend(port)
+            writer.write(qry)
+            await writer.drain()
+            data = await asyncio.wait_for(reader.read(1024), 3.0)
+        finally:
+            writer.close()
+        if not data:
+            raise ConnectionError("TNS closed connection")
+        if data[0] == 0x02: # Address_confirm
+            if not data[1] == 0x4:
+                raise ValueError("Address_Confirm should have length 0x4, but has 0x{0:x} instead".format(data[1]))
+            # IP address
+            return ".".join([str(i) for i in data[2:6]])
+        else: # Different type: dissect and log
+            msg_type = data[0]
+            content = data[2:]
+            raise Exception("Unexpected answer to Address_confirm: type 0x{0:x}, content: {1!r}".format(msg_type, content))
 
 #######
 
@@ -20,6 +20,7 @@ import logging
 l = logging.getLogger("piTelex." + __name__)
 
 import txBase
+import txBuffer
 
 #######
 
@@ -29,8 +30,11 @@ class TelexKeyPad(txBase.TelexBase):
 
         self.id = 'KPd'
         self.params = params
+        self.needs_polling = False
+        self.consumes_data = False
+        self.consumes_commands = ()
 
-        self._rx_buffer = []
+        self._rx_buffer = txBuffer.Buffer()
 
         self._device = None
 
@@ -85,7 +89,7 @@ class TelexKeyPad(txBase.TelexBase):
 
     def read(self) -> str:
         if self._rx_buffer:
-            return self._rx_buffer.pop(0)
+            return self._rx_buffer.popleft()
         else:
             return ''
 
@@ -134,4 +138,6 @@ class TelexKeyPad(txBase.TelexBase):
                     if a:
                         self._rx_buffer.append(a)
 
+                self.notify_data_ready()
+
 #######
\ No newline at end of file
@@ -25,6 +25,7 @@ class TelexLog(txBase.TelexBase):
 
         self.id = 'Log'
         self.params = params
+        self.needs_polling = False
 
         self._filename = params.get('filename', 'log.txt')
 
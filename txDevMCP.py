@@ -18,6 +18,7 @@ l = logging.getLogger("piTelex." + __name__)
 
 import txCode
 import txBase
+import txBuffer
 import txCLI
 from txDevMCP_escape_texts import escape_texts
 from txWatchdog import Watchdog
@@ -54,6 +55,7 @@ class TelexMCP(txBase.TelexBase):
 
         self.id = 'MCP'
         self.params = params
+        self.needs_polling = False
 
         self._WRU_ID = params.get('wru_id', '')
         self._WRU_replace_always = params.get('wru_replace_always', False)
@@ -66,7 +68,7 @@ class TelexMCP(txBase.TelexBase):
         self._power_button_timeout = params.get('power_button_timeout', 5*60)
         self._welcome_msg = params.get('welcome_msg', True)
         
-        self._rx_buffer = []
+        self._rx_buffer = txBuffer.Buffer()
 
         self._state = S_SLEEPING
         self._dial_number = ''
@@ -99,7 +101,7 @@ class TelexMCP(txBase.TelexBase):
 
         self._on_by_PT = False
 
-        self._hand_type_buffer = []
+        self._hand_type_buffer = txBuffer.Buffer()
         self._hand_type_wait = -1
 
         self._last_char_was_cr = False
@@ -115,7 +117,13 @@ class TelexMCP(txBase.TelexBase):
 
     def read(self) -> str:
         if self._rx_buffer:
-            return self._rx_buffer.pop(0)
+            return self._rx_buffer.popleft()
+
+
+    def read_batch(self) -> list:
+        # Texts (read_file, CLI answers, escape texts) are queued as a whole,
+        # so hand them on in batches
+        return self._rx_buffer.pop_batch()
 
 
     def write(self, a:str, source:str):
@@ -203,7 +211,7 @@ class TelexMCP(txBase.TelexBase):
 
             if a == 'DATE':   # current date and time
                 text = time.strftime("%Y-%m-%d  %H:%M", time.localtime()) + '\r\n'
-                self._rx_buffer.extend(list(text))   # send text
+                self._rx_buffer.extend(text)   # send text
                 return True
 
             if a == 'I':   # welcome as server
@@ -215,7 +223,7 @@ class TelexMCP(txBase.TelexBase):
                 #    text += self._WRU_ID   # send back device id
                 #else:
                 #    text += '#'
-                self._rx_buffer.extend(list(text))   # send text
+                self._rx_buffer.extend(text)   # send text
                 if source == 'iTs':
                     # Send command to inform ITelexSrv that the welcome banner has
                     # been queued completely (unlocks non-command reads from
@@ -337,8 +345,8 @@ class TelexMCP(txBase.TelexBase):
         if self._hand_type_wait >= 0:
             if self._hand_type_wait == 0:
                 if not self._hand_type_buffer:
-                    self._hand_type_buffer = list(escape_texts['LOREM'])
-                a = self._hand_type_buffer.pop(0)
+                    self._hand_type_buffer = txBuffer.Buffer(escape_texts['LOREM'])
+                a = self._hand_type_buffer.popleft()
                 self._rx_buffer.append(a)   # send text
                 self._hand_type_wait = int(random.random()**2.0 * 5 + 2)   # emulate human typing waits
                 if a in ('\r', '\n'):
@@ -485,7 +493,7 @@ class TelexMCP(txBase.TelexBase):
                     text = mc.decodeBM2A(bintext)
 
             if text:
-                self._rx_buffer.extend(list(text))
+                self._rx_buffer.extend(text)
                 l.info("Read file: {!r} ({} chars)".format(name, len(text)))
 
         except:
@@ -18,6 +18,7 @@ l = logging.getLogger("piTelex." + __name__)
 
 import txCode
 import txBase
+import txBuffer
 
 #######
 
@@ -68,11 +69,14 @@ class TelexNews(txBase.TelexBase):
 
         self.id = 'Nws'
         self.params = params
+        self.needs_polling = False
+        self.consumes_data = False
+        self.consumes_commands = ('\x1bA', '\x1bZ', '\x1bWB')
 
         self._newspath = params.get('newspath', './news')
         self._print_path = self.params.get('print_path', False)
-        self._rx_buffer = []
-        self._news_buffer = []
+        self._rx_buffer = txBuffer.Buffer()
+        self._news_buffer = txBuffer.Buffer()
         self._state_counter = 1
         l.info('monitoring news directory: ' + self._newspath)
 
@@ -93,7 +97,11 @@ class TelexNews(txBase.TelexBase):
 
     def read(self) -> str:
         if self._rx_buffer:
-            return self._rx_buffer.pop(0)
+            return self._rx_buffer.popleft()
+
+
+    def read_batch(self) -> list:
+        return self._rx_buffer.pop_batch()
 
 
     def write(self, a:str, source:str):
@@ -115,11 +123,10 @@ class TelexNews(txBase.TelexBase):
                 self._rx_buffer.append('\x1bA')
 
             if self._state_counter > 25:
-                text = self._news_buffer.pop(0)
+                text = self._news_buffer.popleft()
                 aa = txCode.BaudotMurrayCode.translate(text)
                 aa = '\r\n' + aa + '\r\n'
-                for a in aa:
-                    self._rx_buffer.append(a)
+                self._rx_buffer.extend(aa)
                 self._rx_buffer.append('\x1bST')
 
 #######
@@ -34,6 +34,9 @@ class TelexREST(txBase.TelexBase):
 
         self.id = 'Rst'
         self.params = params
+        self.needs_polling = False
+        self.consumes_data = False
+        self.consumes_commands = ('\x1bZ',)
 
 
     def exit(self):
@@ -61,10 +64,6 @@ class TelexREST(txBase.TelexBase):
         #self._tx_buffer.append(a)
         #return True   #debug
 
-
-    def idle(self):
-        pass
-
     # =====
 
     def connect_client(self, msg):
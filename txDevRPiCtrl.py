@@ -15,6 +15,7 @@ import pigpio # http://abyz.co.uk/rpi/pigpio/python.html   pip install pigpio
 
 import txCode
 import txBase
+import txBuffer
 import log
 from RPiIO import Button, LED, LED_PWM, NumberSwitch, pi, pi_exit
 from txWatchdog import Watchdog
@@ -33,6 +34,7 @@ class TelexRPiCtrl(txBase.TelexBase):
 
         self.id = 'piC'
         self.params = params
+        self.needs_polling = False
 
         self._pin_number_switch = params.get('pin_number_switch', 0)   # connected to NS
         self._inv_number_switch = params.get('inv_number_switch', True)
@@ -69,7 +71,7 @@ class TelexRPiCtrl(txBase.TelexBase):
         if self._delay_ST:
             self._wd.init(name="DELAY_ST", callback=self._delay_ST_watchdog_callback, time_out_period=self._delay_ST)
 
-        self._rx_buffer = []
+        self._rx_buffer = txBuffer.Buffer()
         self._mode = None
 
         self._status_out = 0
@@ -174,7 +176,7 @@ class TelexRPiCtrl(txBase.TelexBase):
     def read(self) -> str:
         if self._rx_buffer:
             self._set_status('C')
-            return self._rx_buffer.pop(0)
+            return self._rx_buffer.popleft()
 
     # -----
 
@@ -214,11 +216,6 @@ class TelexRPiCtrl(txBase.TelexBase):
                 self._LED_Z.on()
                 self._LED_Z_count = 0    
 
-    # -----
-
-    def idle(self):
-        pass
-
     # =====
 
     def _check_commands(self, a:str):
@@ -289,6 +286,7 @@ class TelexRPiCtrl(txBase.TelexBase):
         if level == 1:
             return
         self._rx_buffer.append('\x1b1T')
+        self.notify_data_ready()
 
     def _callback_button_AT(self, gpio, level, tick):
         if level == 1:
@@ -300,6 +298,7 @@ class TelexRPiCtrl(txBase.TelexBase):
 
     def _delay_AT_watchdog_callback(self, name:str):
         self._rx_buffer.append('\x1bAT')
+        self.notify_data_ready()
 
     def _callback_button_ST(self, gpio, level, tick):
         if level == 1:
@@ -311,45 +310,53 @@ class TelexRPiCtrl(txBase.TelexBase):
 
     def _delay_ST_watchdog_callback(self, name:str):
         self._rx_buffer.append('\x1bST')
+        self.notify_data_ready()
 
     def _callback_button_LT(self, gpio, level, tick):
         if level == 1:
             return
         self._LT_pressed = True
         self._rx_buffer.append('\x1bLT')
+        self.notify_data_ready()
 
     def _callback_button_PT(self, gpio, level, tick):
         if level == 1:
             return
         self._rx_buffer.append('\x1bPT')
+        self.notify_data_ready()
 
     def _callback_button_U1(self, gpio, level, tick):
         if level == 1:
             return
         text = self.params.get('text_button_U1', 'RY')
         self._rx_buffer.extend(list(text))
+        self.notify_data_ready()
 
     def _callback_button_U2(self, gpio, level, tick):
         if level == 1:
             return
         text = self.params.get('text_button_U2', 'RY'*30)
         self._rx_buffer.extend(list(text))
+        self.notify_data_ready()
 
     def _callback_button_U3(self, gpio, level, tick):
         if level == 1:
             return
         text = self.params.get('text_button_U3', '#')
         self._rx_buffer.extend(list(text))
+        self.notify_data_ready()
 
     def _callback_button_U4(self, gpio, level, tick):
         if level == 1:
             return
         text = self.params.get('text_button_U4', '@')
         self._rx_buffer.extend(list(text))
+        self.notify_data_ready()
 
     def _callback_number_switch(self, text:str):
         if text.isnumeric():
             self._rx_buffer.append(text)
+            self.notify_data_ready()
             self._set_status('PE')
         else:
             self._set_status('P')
@@ -23,6 +23,7 @@ l = logging.getLogger("piTelex." + __name__)
 
 import txCode
 import txBase
+import txBuffer
 import log
 from RPiIO import NumberSwitch, Observer, pi, pi_exit
 
@@ -44,6 +45,7 @@ class TelexRPiTTY(txBase.TelexBase):
 
         self.id = 'piT'
         self.params = params
+        self.needs_polling = False
         self._timing_tick = 0
         self._time_EOT = 0
         self._state = None
@@ -51,8 +53,8 @@ class TelexRPiTTY(txBase.TelexBase):
         self._use_squelch = True
         self._keep_alive_counter = 0
 
-        self._tx_buffer = []
-        self._rx_buffer = []
+        self._tx_buffer = txBuffer.Buffer()
+        self._rx_buffer = txBuffer.Buffer()
 
         # get setting params
 
@@ -159,7 +161,7 @@ class TelexRPiTTY(txBase.TelexBase):
     def read(self) -> str:
         ''' called by system to get next input character '''
         if self._rx_buffer:
-            return self._rx_buffer.pop(0)
+            return self._rx_buffer.popleft()
 
     # -----
 
@@ -174,6 +176,10 @@ class TelexRPiTTY(txBase.TelexBase):
 
     # =====
 
+    def needs_idle(self) -> bool:
+        ''' idle() only sends the tx buffer '''
+        return bool(self._tx_buffer)
+
     def idle(self):
         ''' called by system as often as possible to do background stuff '''
         if not self._tx_buffer \
@@ -185,7 +191,7 @@ class TelexRPiTTY(txBase.TelexBase):
         while self._tx_buffer \
             and len(self._tx_buffer[0]) == 1 \
             and len(text) <= 66:
-            text += self._tx_buffer.pop(0)
+            text += self._tx_buffer.popleft()
 
         if text:
             if self._state >= S_ACTIVE_INIT:
@@ -193,7 +199,7 @@ class TelexRPiTTY(txBase.TelexBase):
             self._keep_alive_counter = 0
 
         elif self._tx_buffer and len(self._tx_buffer[0]) > 1:   # control sequence
-            a = self._tx_buffer.pop(0)
+            a = self._tx_buffer.popleft()
             if len(a) > 1 and a[0] == '\x1b':
                 self._check_commands(a[1:])
 
@@ -275,7 +281,7 @@ class TelexRPiTTY(txBase.TelexBase):
 
         elif a == 'Z':
             self._set_state(S_OFFLINE)
-            self._tx_buffer = []    # empty write buffer...
+            self._tx_buffer.clear()    # empty write buffer...
             self._send_control_sequence('~0')
 
         elif a == 'WB':
@@ -464,6 +470,7 @@ class TelexRPiTTY(txBase.TelexBase):
     def _callback_number_switch(self, text:str):
         if text.isnumeric():
             self._rx_buffer.append(text)
+            self.notify_data_ready()
 
    # -----
 
@@ -31,6 +31,7 @@ import queue
 import json
 
 import txBase
+import txBuffer
 import txCode
 
 import log
@@ -103,10 +104,13 @@ class TelexRSS(txBase.TelexBase):
 
         self.id = 'rss'
         self.params = params
+        self.needs_polling = False
+        self.consumes_data = False
+        self.consumes_commands = ()
 
 
-        self._rx_buffer = []
-        self._tx_buffer = []
+        self._rx_buffer = txBuffer.Buffer()
+        self._tx_buffer = txBuffer.Buffer()
 
         # init Client
         self._rss_client = RSS_Client(
@@ -130,11 +134,15 @@ class TelexRSS(txBase.TelexBase):
         ret = ''
 
         if self._rx_buffer:
-            ret = self._rx_buffer.pop(0)
+            ret = self._rx_buffer.popleft()
 
         return ret
 
 
+    def read_batch(self) -> list:
+        return self._rx_buffer.pop_batch()
+
+
     def write(self, a:str, source:str):
         pass
 
@@ -193,8 +201,8 @@ class TelexRSS(txBase.TelexBase):
                     # message is now fomatted, turn on printer
                     self._rx_buffer.append('\x1bA')
                     # insert formatted text into stream
-                    for a in txt_out:
-                        self._rx_buffer.append(a)
+                    self._rx_buffer.extend(txt_out)
+                    self.notify_data_ready()
 
 
                 except Exception as e:
@@ -202,5 +210,6 @@ class TelexRSS(txBase.TelexBase):
 
         # switch off printer
         self._rx_buffer.append('\x1bZ')
+        self.notify_data_ready()
 
         LOG('end rss handler', 2)
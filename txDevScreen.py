@@ -9,11 +9,14 @@ __license__     = "GPL3"
 __version__     = "0.0.1"
 
 import os
+from threading import Thread
+import time
 
 import logging
 l = logging.getLogger("piTelex." + __name__)
 
 import txBase
+import txBuffer
 import txCode
 
 # Windows
@@ -105,8 +108,9 @@ class TelexScreen(txBase.TelexBase):
 
         self.id = 'Scn'
         self.params = params
+        self.needs_polling = False
 
-        self._rx_buffer = []
+        self._rx_buffer = txBuffer.Buffer()
         self._escape = ''
 
         self._show_BuZi = self.params.get('show_BuZi', True)
@@ -133,6 +137,12 @@ class TelexScreen(txBase.TelexBase):
             # Support normal-terminal reset at exit
             atexit.register(self.set_normal_term)
 
+        # Keys are read by a thread of its own, which wakes up the main loop,
+        # instead of polling the keyboard in read()
+        self._run = True
+        self._rx_thread = Thread(target=self.thread_rx, name='Screen')
+        self._rx_thread.start()
+
 
     def __del__(self):
         ''' Resets to normal terminal.  On Windows this is a no-op. '''
@@ -142,6 +152,8 @@ class TelexScreen(txBase.TelexBase):
 
 
     def exit(self):
+        self._run = False
+        self._rx_thread.join()
         if os.name == 'nt':
             pass
 
@@ -163,72 +175,8 @@ class TelexScreen(txBase.TelexBase):
     def read(self) -> str:
         ret = ''
 
-        if self.kbhit():
-            k = self.getch()
-            if k:
-                #print(int(k))
-                if k == b'\xe0':
-                    k = self.getch()
-                    c = self._LUT_replace_windows_ctrl_chars.get(k, '')
-                    if c:
-                        print('\033[1;33;41m{'+c[1:]+'}\033[0m', end='', flush=True)
-                        self._rx_buffer.append(c)
-                    return '' # eat cursor and control keys
-                if k == b'\x1b' or k == '\x1b':
-                    self._escape = '\x1b'
-                    print('\033[0;37;41m{\033[0m', end='', flush=True)
-                    return ''
-
-                if os.name == 'nt':
-                    c = k.decode('cp850', errors='ignore')
-                else:
-                    c = k
-
-                if self._escape:
-                    if c == '\r' or c == '\n':
-                        self._escape = self._escape.upper()
-                        self._rx_buffer.append(self._escape)
-                        print('\033[0;37;41m}\033[0m', end='', flush=True)
-                        self._escape = ''
-                    else:
-                        print('\033[0;37;41m'+c+'\033[0m', end='', flush=True)
-                        self._escape += c
-                        c = self._LUT_replace_linux_escape_seqs.get(self._escape, '')
-                        if c:
-                            self._escape = c
-                            self._rx_buffer.append(self._escape)
-                            print('\033[0;92;41m'+self._escape[1:]+'\033[0m', end='', flush=True)
-                            self._escape = ''
-                else:
-                    if c in self._LUT_typed_special_chars:
-                        c = self._LUT_typed_special_chars.get(c, '?')
-                    else:
-                        c = txCode.BaudotMurrayCode.ascii_to_tty_text(c)
-
-                    if c[0] == '\x1b':
-                        self._rx_buffer.append(c)
-                    else:
-                        for a in c:
-                            self._rx_buffer.append(a)
-
-                            # local echo
-                            if a == '\t':   # tab -> 1T
-                                self._rx_buffer.append('\x1b1T')
-                            if a == '\r' or a == '\n':   # bug in print()
-                                print(a, end='')
-
-                                # Print line ending cue for new lines
-                                if a == '\n':
-                                    print('\033[70G'+'|'+'\033[0G'+'\033[0m', end='', flush=True)
-                            else:
-                                if a in self._LUT_show_special_chars:
-                                    a = self._LUT_show_special_chars[a]
-                                if not self._show_capital:
-                                    a = a.lower()
-                                print('\033[1;31m'+a+'\033[0m', end='', flush=True)
-
         if self._rx_buffer:
-            ret = self._rx_buffer.pop(0)
+            ret = self._rx_buffer.popleft()
 
         return ret
 
@@ -260,6 +208,81 @@ class TelexScreen(txBase.TelexBase):
 
     # =====
 
+    def thread_rx(self):
+        while self._run:
+            if self.kbhit(0.5):
+                k = self.getch()
+                if not k:
+                    break   # end of input, stdin closed
+                self._read_key(k)
+                if self._rx_buffer:
+                    self.notify_data_ready()
+
+
+    def _read_key(self, k):
+        #print(int(k))
+        if k == b'\xe0':
+            k = self.getch()
+            c = self._LUT_replace_windows_ctrl_chars.get(k, '')
+            if c:
+                print('\033[1;33;41m{'+c[1:]+'}\033[0m', end='', flush=True)
+                self._rx_buffer.append(c)
+            return   # eat cursor and control keys
+        if k == b'\x1b' or k == '\x1b':
+            self._escape = '\x1b'
+            print('\033[0;37;41m{\033[0m', end='', flush=True)
+            return
+
+        if os.name == 'nt':
+            c = k.decode('cp850', errors='ignore')
+        else:
+            c = k
+
+        if self._escape:
+            if c == '\r' or c == '\n':
+                self._escape = self._escape.upper()
+                self._rx_buffer.append(self._escape)
+                print('\033[0;37;41m}\033[0m', end='', flush=True)
+                self._escape = ''
+            else:
+                print('\033[0;37;41m'+c+'\033[0m', end='', flush=True)
+                self._escape += c
+                c = self._LUT_replace_linux_escape_seqs.get(self._escape, '')
+                if c:
+                    self._escape = c
+                    self._rx_buffer.append(self._escape)
+                    print('\033[0;92;41m'+self._escape[1:]+'\033[0m', end='', flush=True)
+                    self._escape = ''
+        else:
+            if c in self._LUT_typed_special_chars:
+                c = self._LUT_typed_special_chars.get(c, '?')
+            else:
+                c = txCode.BaudotMurrayCode.ascii_to_tty_text(c)
+
+            if c[0] == '\x1b':
+                self._rx_buffer.append(c)
+            else:
+                for a in c:
+                    self._rx_buffer.append(a)
+
+                    # local echo
+                    if a == '\t':   # tab -> 1T
+                        self._rx_buffer.append('\x1b1T')
+                    if a == '\r' or a == '\n':   # bug in print()
+                        print(a, end='')
+
+                        # Print line ending cue for new lines
+                        if a == '\n':
+                            print('\033[70G'+'|'+'\033[0G'+'\033[0m', end='', flush=True)
+                    else:
+                        if a in self._LUT_show_special_chars:
+                            a = self._LUT_show_special_chars[a]
+                        if not self._show_capital:
+                            a = a.lower()
+                        print('\033[1;31m'+a+'\033[0m', end='', flush=True)
+
+    # =====
+
     def getch(self):
         ''' Returns a keyboard character after kbhit() has been called. '''
 
@@ -273,13 +296,18 @@ class TelexScreen(txBase.TelexBase):
             return sys.stdin.read(1)
 
 
-    def kbhit(self):
-        ''' Returns True if keyboard character was hit, False otherwise. '''
+    def kbhit(self, timeout:float=0):
+        ''' Returns True if keyboard character was hit within timeout (s), False otherwise. '''
         if os.name == 'nt':
-            return msvcrt.kbhit()
+            end = time.monotonic() + timeout
+            while not msvcrt.kbhit():
+                if time.monotonic() >= end:
+                    return False
+                time.sleep(0.01)
+            return True
 
         else:
-            dr, dw, de = select([sys.stdin], [], [], 0)
+            dr, dw, de = select([sys.stdin], [], [], timeout)
 
             #dr, dw, de = select([self.fd], [], [], 0)
 
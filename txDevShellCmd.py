@@ -16,6 +16,7 @@ l = logging.getLogger("piTelex." + __name__)
 
 import txCode
 import txBase
+import txBuffer
 import log
 
 import os
@@ -43,6 +44,8 @@ class TelexShellCmd(txBase.TelexBase):
 
         self.id = 'ShC'
         self.params = params
+        self.needs_polling = False
+        self.consumes_data = False
 
         self._LUT = {}
         lut = params.get('LUT', {})
@@ -51,7 +54,7 @@ class TelexShellCmd(txBase.TelexBase):
             for key in keys:
                 self._LUT[key.upper().strip()] = cmd
 
-        self._rx_buffer = []
+        self._rx_buffer = txBuffer.Buffer()
 
     # -----
 
@@ -67,7 +70,7 @@ class TelexShellCmd(txBase.TelexBase):
 
     def read(self) -> str:
         if self._rx_buffer:
-            ret = self._rx_buffer.pop(0)
+            ret = self._rx_buffer.popleft()
             return ret
 
     # -----
@@ -13,6 +13,7 @@ __version__     = "0.0.2"
 
 import serial
 import serial.rs485
+from threading import Thread
 import time
 
 import logging
@@ -20,6 +21,7 @@ l = logging.getLogger("piTelex." + __name__)
 
 import txCode
 import txBase
+import txBuffer
 import log
 
 #######
@@ -30,6 +32,7 @@ class TelexTerminal(txBase.TelexBase):
 
         self.id = 'Trm'
         self.params = params
+        self.needs_polling = False
 
         portname = params.get('portname', '/dev/ttyUSB0')
         baudrate = params.get('baudrate', 300)
@@ -50,7 +53,7 @@ class TelexTerminal(txBase.TelexBase):
         self._replace_char = self.params.get('replace_char', {})
         self._replace_esc = self.params.get('replace_esc', {})
 
-        self._rx_buffer = []
+        self._rx_buffer = txBuffer.Buffer()
 
         # init serial
         if RS485:
@@ -83,9 +86,21 @@ class TelexTerminal(txBase.TelexBase):
         
         self.char_count = 0
 
+        # Received characters are read by a thread of its own, which wakes up
+        # the main loop, instead of polling the port in read()
+        self._tty.timeout = 0.5
+        self._run = True
+        self._rx_thread = None
+        if not self._send_only:
+            self._rx_thread = Thread(target=self.thread_rx, name='Terminal')
+            self._rx_thread.start()
+
     # -----
 
     def exit(self):
+        self._run = False
+        if self._rx_thread:
+            self._rx_thread.join()
         self._tty.close()
 
     # -----
@@ -96,22 +111,8 @@ class TelexTerminal(txBase.TelexBase):
     # =====
 
     def read(self) -> str:
-        if self._send_only:
-            return
-        if self._tty.in_waiting:
-            b = self._tty.read(1)
-            if b[0] < 0x20:
-                pass
-            else:
-                if self._local_echo:
-                    self._write_raw(b)
-                a = b.decode('ASCII', errors='ignore')
-                if a:
-                    a = a.upper()
-                    self._rx_buffer.append(a)
-
         if self._rx_buffer:
-            ret = self._rx_buffer.pop(0)
+            ret = self._rx_buffer.popleft()
             return ret
 
     # -----
@@ -201,13 +202,22 @@ class TelexTerminal(txBase.TelexBase):
 
     # =====
 
-    def idle20Hz(self):
-        pass
-
-    # -----
-
-    def idle(self):
-        pass
+    def thread_rx(self):
+        while self._run:
+            try:
+                b = self._tty.read(1)   # blocks until timeout
+            except serial.SerialException as e:
+                l.warning("Terminal: read error: {!r}".format(e))
+                break
+            if not b or b[0] < 0x20:
+                continue
+            if self._local_echo:
+                self._write_raw(b)
+            a = b.decode('ASCII', errors='ignore')
+            if a:
+                a = a.upper()
+                self._rx_buffer.append(a)
+                self.notify_data_ready()
 
     # =====
 
@@ -0,0 +1,510 @@
+#!/usr/bin/python3
+"""
+Telex FSK - signal processing for the ED1000 sound card module
+(TelexED1000SC), without audio I/O, so it can be used and checked offline
+(see utils/ED1000)
+
+IIRDemodulator: streaming demodulator. Each tone is band-pass filtered,
+rectified and low-pass filtered to its envelope. The state of all filters is
+carried over from one audio block to the next, so there are no transients at
+block boundaries, and the result is an energy per tone and sample ("soft
+bits"), not one value per block.
+
+DFTDemodulator: the same, but computing only the two tone frequencies by a
+sliding DFT over a window of half a bit, all vectorized. Less CPU time than
+the IIR filters.
+
+DEMODULATORS: demodulator class by name, see "recv_detector" in telex.json.
+
+SoftUART: asynchronous receiver (start bit, 5 data bits, stop bit) on the
+demodulator output, sample by sample: finds the start bit edge, samples each
+bit in its middle and checks the stop bit.
+
+WaveformCache: transmit waveforms (int16) of all 32 Baudot characters and of
+the idle levels, rendered by an NCO with (nearly) continuous phase and kept
+for reuse.
+
+SampleRing: ring buffer of int16 samples between the tx thread, which fills
+it, and the audio callback, which empties it.
+"""
+__author__      = "Jochen Krapf"
+__email__       = "jk@nerd2nerd.org"
+__copyright__   = "Copyright 2020, JK"
+__license__     = "GPL3"
+__version__     = "0.0.1"
+
+from threading import Condition
+import math
+from scipy import signal
+import numpy as np
+
+import logging
+l = logging.getLogger("piTelex." + __name__)
+
+sample_f = 48000       # sampling rate, Hz, must be integer
+
+# Cut-off frequency of the envelope low-pass, in multiples of the baud rate.
+# Higher: faster reaction to level changes, more ripple.
+ENVELOPE_CUTOFF = 8.0
+
+# Half width of the receive band-passes, relative to the tone frequency.
+# Narrower: less noise, but more delay (group delay of a +-5% band-pass is
+# about 4 ms at 2250 Hz, twice the former decision delay at 2.5 ms blocks).
+RECV_BANDWIDTH = 0.10
+
+# Window of the sliding DFT, in bits. Longer: better selectivity, more delay.
+# It's rounded to a whole number of periods of the tones' difference
+# frequency, so that the two tones don't leak into each other.
+DFT_WINDOW = 0.5
+
+# Part of each bit, around its middle, averaged by SoftUART to decide it
+UART_SAMPLE_WIDTH = 0.5
+
+# Start phases per cycle for which WaveformCache keeps rendered waveforms.
+# The phase at the start of a waveform is rounded to one of them, so the
+# remaining phase jump is at most half a step (here 5.6 degrees). More:
+# smaller jumps, more memory (32 characters * PHASE_STEPS waveforms at
+# most, e.g. 10 MB at 75 Bd; only those used are rendered).
+PHASE_STEPS = 32
+
+#######
+
+class IIRDemodulator:
+    """
+    Streaming FSK demodulator for the two receive tones recv_f (A, Z).
+
+    process() takes audio blocks of any size, one after the other, and
+    returns the envelope of each tone per sample. The values are on the same
+    scale as the former per-block averages of the rectified filter output, so
+    recv_squelch keeps its meaning.
+    """
+    def __init__(self, recv_f:list, baudrate:float=50, fs:int=sample_f):
+        self.recv_f = list(recv_f)
+        self.fs = fs
+        # Band-pass per tone (2nd order Butterworth prototype, +-RECV_BANDWIDTH)
+        w = 1 + RECV_BANDWIDTH
+        self._bp = [signal.iirfilter(2, [f/w, f*w], btype='bandpass',
+                        analog=False, ftype='butter', fs=fs, output='sos')
+                    for f in self.recv_f]
+        # Envelope low-pass, the same for both tones
+        self._lp = signal.butter(2, baudrate * ENVELOPE_CUTOFF, btype='lowpass', fs=fs, output='sos')
+        self.reset()
+
+
+    def reset(self):
+        """Forget filter state, e.g. after a gap in the audio input."""
+        self._bp_zi = [np.zeros((sos.shape[0], 2)) for sos in self._bp]
+        self._lp_zi = np.zeros((self._lp.shape[0], 2, 2))
+
+
+    def process(self, data) -> np.ndarray:
+        """
+        Return energy of both tones for every sample of data, as array of
+        shape (2, len(data)): [0] A, [1] Z.
+        """
+        x = np.asarray(data, dtype=np.float64)
+        rect = np.empty((2, len(x)))
+        for i, sos in enumerate(self._bp):
+            y, self._bp_zi[i] = signal.sosfilt(sos, x, zi=self._bp_zi[i])
+            np.abs(y, out=rect[i])   # rectifier
+        # Both envelopes in one go
+        energy, self._lp_zi = signal.sosfilt(self._lp, rect, axis=1, zi=self._lp_zi)
+        return energy
+
+
+    def frequency_response(self, points:int=2000):
+        """Return (frequencies, [response of each band-pass]) for plotting."""
+        responses = []
+        for sos in self._bp:
+            w, h = signal.sosfreqz(sos, points, fs=self.fs)
+            responses.append(h)
+        return w, responses
+
+# -----
+
+class DFTDemodulator:
+    """
+    Streaming FSK demodulator for the two receive tones recv_f (A, Z), by
+    sliding DFT: each sample is mixed down with both tones (the oscillator
+    phase carries on from block to block), and the result summed over the
+    last window samples. Interface and scale as IIRDemodulator.
+
+    A Goertzel filter would give the same value, but once per window only;
+    the sliding DFT gives one per sample at about the same cost.
+    """
+    def __init__(self, recv_f:list, baudrate:float=50, fs:int=sample_f, window:float=DFT_WINDOW):
+        self.recv_f = list(recv_f)
+        self.fs = fs
+        period = fs / abs(self.recv_f[1] - self.recv_f[0])
+        self.window = int(max(1, round(fs / baudrate * window / period)) * period + 0.5)
+        self._omega = 2 * np.pi * np.array(self.recv_f, dtype=np.float64)[:, None] / fs
+        # Mean of the rectified tone, like IIRDemodulator: |sum| is
+        # amplitude * window / 2, the rectified mean amplitude * 2 / pi
+        self._scale = 4 / (np.pi * self.window)
+        self.reset()
+
+
+    def reset(self):
+        """Forget window contents, e.g. after a gap in the audio input."""
+        self._phasor = np.ones((2, 1), dtype=np.complex128)
+        self._tail = np.zeros((2, self.window), dtype=np.complex128)
+
+
+    def process(self, data) -> np.ndarray:
+        """
+        Return energy of both tones for every sample of data, as array of
+        shape (2, len(data)): [0] A, [1] Z.
+        """
+        x = np.asarray(data, dtype=np.float64)
+        n = len(x)
+        osc = self._phasor * np.exp(-1j * self._omega * np.arange(n))
+        # Next block starts where this one ended; renormalise against drift
+        self._phasor = osc[:, -1:] * np.exp(-1j * self._omega) if n else self._phasor
+        self._phasor /= np.abs(self._phasor)
+
+        mixed = np.concatenate((self._tail, osc * x), axis=1)
+        self._tail = mixed[:, -self.window:]
+        # Sum over the window ending at each new sample
+        cum = np.cumsum(mixed, axis=1)
+        sums = cum[:, self.window:] - cum[:, :n]
+        return np.abs(sums) * self._scale
+
+
+    def frequency_response(self, points:int=2000):
+        """Return (frequencies, [response for each tone]) for plotting."""
+        w = np.linspace(0, self.fs / 2, points)
+        k = np.arange(self.window)
+        responses = [np.exp(2j * np.pi * np.outer(w - f, k) / self.fs).mean(axis=1) for f in self.recv_f]
+        return w, responses
+
+# =====
+
+DEMODULATORS = {
+    'iir': IIRDemodulator,
+    'dft': DFTDemodulator,
+}
+
+#######
+
+class SoftUART:
+    """
+    Asynchronous receiver for Baudot characters on the "soft bits" of a
+    demodulator: Z energy minus A energy per sample, positive for Z (stop
+    bit, idle), negative for A (start bit).
+
+    After the line has been Z, a change to A is taken as start of a
+    character. Each bit is decided by the mean of the soft bits over the
+    middle part of the bit (UART_SAMPLE_WIDTH), counted from the start edge
+    with sample accuracy, so characters don't depend on how the audio is
+    cut into blocks. The start bit must still be A in its middle, the stop
+    bit must be Z, otherwise the character is dropped (framing error) and
+    the next edge is looked for. Samples without carrier (squelch) make the
+    character invalid, too.
+
+    process() takes the soft bits block by block and returns the characters
+    completed in the block, with the time of their start edge.
+    """
+    def __init__(self, baudrate:float=50, fs:int=sample_f):
+        self.fs = fs
+        self.spb = fs / baudrate   # samples per bit
+        # Bit middles (start, 5 data, stop) and averaged width, in samples
+        self._middles = [int((0.5 + i) * self.spb) for i in range(7)]
+        half = max(1, int(self.spb * UART_SAMPLE_WIDTH / 2))
+        self._ranges = [(m - half, m + half) for m in self._middles]
+        # Samples needed after the start edge to decide the character
+        self._length = self._ranges[-1][1]
+        self.chars = 0
+        self.framing_errors = 0
+        self.reset()
+
+
+    def reset(self):
+        """Start over, e.g. after going offline; wait for Z first."""
+        self._soft = np.zeros(0)
+        self._valid = np.zeros(0, dtype=bool)
+        # Absolute sample number of self._soft[0], and of next sample
+        self._base = 0
+        self._pos = 0
+        # Line has been Z before self._pos (start edge possible)
+        self._mark = False
+
+
+    def process(self, soft, valid=None, t_end:float=None) -> list:
+        """
+        Feed soft bits of the next block; valid (bool per sample, optional):
+        carrier present. Return [(code, time), ...] of the characters
+        received, time being the start edge in s: relative to t_end (time of
+        the block's last sample) if given, else since the start.
+        """
+        soft = np.asarray(soft, dtype=np.float64)
+        if valid is None:
+            valid = np.ones(len(soft), dtype=bool)
+        self._soft = np.concatenate((self._soft, soft))
+        self._valid = np.concatenate((self._valid, valid))
+        end = self._base + len(self._soft)
+
+        result = []
+        while True:
+            start = self._find_start()
+            if start is None:
+                break
+            if start + self._length > end:
+                # Character not complete yet
+                break
+            code = self._decode(start)
+            if code is None:
+                self.framing_errors += 1
+                # Look for the next edge right after this one
+                self._pos = start + 1
+                self._mark = False
+                continue
+            self.chars += 1
+            t = (start - end) / self.fs + t_end if t_end is not None else start / self.fs
+            result.append((code, t))
+            # Next start bit can follow right after the stop bit's middle
+            self._pos = start + self._middles[-1]
+            self._mark = True
+
+        # Drop samples no longer needed
+        keep = self._pos - self._base
+        if keep > 0:
+            self._soft = self._soft[keep:]
+            self._valid = self._valid[keep:]
+            self._base = self._pos
+        return result
+
+    # =====
+
+    def _find_start(self):
+        """
+        Return absolute sample number of the next start edge from self._pos
+        on, or None. Advance self._pos over samples searched in vain.
+        """
+        i = self._pos - self._base
+        space = (self._soft[i:] <= 0) | ~self._valid[i:]
+        if not self._mark:
+            # Wait for Z (with carrier) first
+            marks = np.flatnonzero(~space)
+            if not len(marks):
+                self._pos = self._base + len(self._soft)
+                return None
+            i += marks[0]
+            space = space[marks[0]:]
+            self._mark = True
+        edges = np.flatnonzero(space)
+        if not len(edges):
+            self._pos = self._base + len(self._soft)
+            return None
+        self._pos = self._base + i + edges[0]
+        return self._pos
+
+
+    def _decode(self, start):
+        """Return code of the character starting at start, None if invalid."""
+        i = start - self._base
+        if not self._valid[i:i+self._length].all():
+            return None
+        bits = [self._soft[i+a:i+b].mean() > 0 for a, b in self._ranges]
+        if bits[0] or not bits[6]:
+            # Start bit not A, or stop bit not Z
+            return None
+        code = 0
+        for n in range(5):
+            if bits[1 + n]:
+                code |= 1 << n
+        return code
+
+#######
+
+class NCO:
+    """
+    Numerically controlled oscillator: renders a sine wave along a phase
+    trajectory, starting where the last one ended, so there is never a
+    phase jump between waveforms.
+
+    Trajectories are prepared once (prepare); rendering one is then a
+    rotation: sin(p + t) = sin(p) cos(t) + cos(p) sin(t), two multiplies
+    and an add per sample.
+    """
+    def __init__(self, amplitude:int=32000):
+        self.amplitude = amplitude
+        self.phase = 0.0
+
+
+    def prepare(self, trajectory:np.ndarray, total:float):
+        """
+        Return prepared form of trajectory (phase of each sample relative to
+        the first one); total is the phase at the sample after the last one.
+        """
+        return (np.cos(trajectory) * self.amplitude, np.sin(trajectory) * self.amplitude, total)
+
+
+    def render(self, prepared) -> np.ndarray:
+        """Return int16 samples of a prepared trajectory and advance the phase."""
+        cos_t, sin_t, total = prepared
+        out = (math.sin(self.phase) * cos_t + math.cos(self.phase) * sin_t).astype(np.int16)
+        self.advance(prepared)
+        return out
+
+
+    def advance(self, prepared):
+        """Advance the phase as render does, without rendering."""
+        self.phase = (self.phase + prepared[2]) % (2 * math.pi)
+
+
+class WaveformCache:
+    """
+    Transmit waveforms for send_f (A, Z, and the middle frequency used for
+    nothing else but kept for compatibility):
+
+    - code(b): Baudot character b with start bit and 1.5 stop bits
+    - idle(level): one bit of level 0 (A), 1 (Z), 2 (middle)
+    - bits(b, nbit): any bit pattern (LSB first), e.g. signalling pulses
+
+    The phase trajectories of all characters and idle levels are computed
+    once (patterns on first use). A waveform continues the phase of the
+    previous one, rounded to one of PHASE_STEPS start phases: no phase jumps
+    between bits, and at most half a step between characters (none if a
+    character takes a whole number of cycles, like 500/700 Hz at 50 Bd).
+    Each waveform is rendered by the NCO once per start phase on first use
+    and then returned from the cache; the arrays returned are read-only. Use
+    one instance for one output stream, in the order of output.
+    """
+    def __init__(self, send_f:list, baudrate:float=50, fs:int=sample_f, amplitude:int=32000):
+        self.send_f = list(send_f)
+        self.fs = fs
+        self.Fpb = int(fs / baudrate + 0.5)   # Frames per bit
+        self.Fpw = int(self.Fpb * 7.5 + 0.5)   # Frames per wave (character)
+        self.nco = NCO(amplitude)
+
+        self._idle = [self._prepare([i]) for i in range(len(self.send_f))]
+        # Start bit, 5 data bits, stop bits, cut to 1.5 stop bits
+        self._codes = [self._prepare([0] + [(b >> i) & 1 for i in range(5)] + [1, 1], self.Fpw)
+            for b in range(32)]
+        self._patterns = {}
+        # Rendered waveforms by (key, start phase step)
+        self._rendered = {}
+
+
+    def code(self, b:int) -> np.ndarray:
+        b &= 0x1F
+        return self._render(('code', b), self._codes[b])
+
+
+    def idle(self, level:int) -> np.ndarray:
+        return self._render(('idle', level), self._idle[level])
+
+
+    def bits(self, b:int, nbit:int) -> np.ndarray:
+        key = (b, nbit)
+        prepared = self._patterns.get(key)
+        if prepared is None:
+            prepared = self._patterns[key] = self._prepare([(b >> i) & 1 for i in range(nbit)])
+        return self._render(key, prepared)
+
+
+    def _render(self, key, prepared) -> np.ndarray:
+        """Return waveform of prepared, starting at the NCO's phase (rounded)."""
+        step = round(self.nco.phase * PHASE_STEPS / (2 * math.pi)) % PHASE_STEPS
+        self.nco.phase = step * 2 * math.pi / PHASE_STEPS
+        out = self._rendered.get((key, step))
+        if out is None:
+            out = self._rendered[key, step] = self.nco.render(prepared)
+            out.flags.writeable = False
+        else:
+            self.nco.advance(prepared)
+        return out
+
+
+    def _prepare(self, levels:list, length:int=None):
+        """
+        Return phase trajectory of one bit per level, cut to length samples,
+        prepared for the NCO.
+        """
+        freq = np.repeat(np.array(self.send_f, dtype=np.float64)[levels], self.Fpb)[:length]
+        steps = 2 * np.pi * freq / self.fs
+        # Phase of each sample: sum of the steps of all samples before
+        phase = np.empty(len(steps))
+        phase[0] = 0
+        np.cumsum(steps[:-1], out=phase[1:])
+        return self.nco.prepare(phase, phase[-1] + steps[-1])
+
+# -----
+
+class SampleRing:
+    """
+    Ring buffer of int16 samples for audio output in callback mode.
+
+    write() (tx thread) blocks while the ring is full, so the writer is
+    paced by the audio output just like by a blocking stream.write. read()
+    (audio callback) never blocks: it returns what's there and pads with
+    silence. Running dry while a writer is active (the writer being late)
+    is counted in underruns; after flush() (end of output, nothing to send)
+    or close() it isn't.
+    """
+    def __init__(self, capacity:int):
+        self._buf = np.zeros(capacity, dtype=np.int16)
+        self._capacity = capacity
+        self._start = 0
+        self._len = 0
+        self._closed = False
+        self._cond = Condition()
+        self._active = False
+        self.underruns = 0
+
+
+    def __len__(self):
+        return self._len
+
+
+    def write(self, samples:np.ndarray) -> bool:
+        """Append samples, waiting for space. Return False if closed."""
+        pos = 0
+        n = len(samples)
+        with self._cond:
+            self._active = True
+            while pos < n:
+                self._cond.wait_for(lambda: self._len < self._capacity or self._closed)
+                if self._closed:
+                    return False
+                count = min(n - pos, self._capacity - self._len)
+                end = (self._start + self._len) % self._capacity
+                first = min(count, self._capacity - end)
+                self._buf[end:end+first] = samples[pos:pos+first]
+                self._buf[:count-first] = samples[pos+first:pos+count]
+                self._len += count
+                pos += count
+        return True
+
+
+    def read(self, n:int) -> np.ndarray:
+        """Return n samples; silence for those missing."""
+        out = np.zeros(n, dtype=np.int16)
+        with self._cond:
+            count = min(n, self._len)
+            first = min(count, self._capacity - self._start)
+            out[:first] = self._buf[self._start:self._start+first]
+            out[first:count] = self._buf[:count-first]
+            self._start = (self._start + count) % self._capacity
+            self._len -= count
+            if count < n and self._active and not self._closed:
+                self.underruns += 1
+                # Count each gap once
+                self._active = False
+            self._cond.notify_all()
+        return out
+
+
+    def flush(self):
+        """End of output: the ring may run dry now without an underrun."""
+        with self._cond:
+            self._active = False
+
+
+    def close(self):
+        """Wake up and refuse all writers (on exit)."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+#######
@@ -0,0 +1,180 @@
+#!/usr/bin/python3
+"""
+Telex i-Telex Flow Control
+
+Paces the Baudot data sent on an i-Telex connection so that the remote
+teleprinter always has something to print, but its buffer isn't overrun.
+
+The remote reports the number of characters it has printed by Acknowledge
+packets (8 bit counter). Characters sent but not yet printed are "in
+flight". Between two Acknowledge packets, the number in flight is estimated
+from the last reported value, the characters sent since, and the characters
+the remote has presumably printed since (one per char_time, 150 ms at 50
+Bd). Sending is allowed as long as the estimate is below the window.
+
+char_time is adapted to the remote's actual printing speed as measured
+between Acknowledge packets, so that fast remotes (e.g. computer services)
+aren't left waiting for the next Acknowledge.
+
+    flow = FlowControl(window)
+    ...
+    n = flow.allowance()   # before sending
+    flow.on_sent(n_sent)   # after sending
+    flow.on_ack(counter)   # on receipt of Acknowledge
+"""
+__author__      = "Jochen Krapf"
+__email__       = "jk@nerd2nerd.org"
+__copyright__   = "Copyright 2020, JK"
+__license__     = "GPL3"
+__version__     = "0.0.1"
+
+import time
+
+import logging
+l = logging.getLogger("piTelex." + __name__)
+
+# Default target number of characters in flight (about 1.5 s of printing at
+# 50 Bd)
+SEND_WINDOW = 10
+
+# Time to print one character at 50 Bd (7.5 bit)
+CHAR_TIME = 0.15
+
+# Limits for the measured time to print one character
+CHAR_TIME_MIN = 0.005
+CHAR_TIME_MAX = 0.3
+
+#######
+
+class FlowControl:
+    def __init__(self, window:int=SEND_WINDOW, char_time:float=CHAR_TIME):
+        if not 1 <= window <= 255:
+            # The Acknowledge counter is 8 bit wide, so more than 255
+            # characters in flight can't be told apart from less
+            l.warning("Invalid send window {!r}, using {}".format(window, SEND_WINDOW))
+            window = SEND_WINDOW
+        self.window = window
+        self.char_time = char_time
+
+        # Characters sent in total (not wrapped)
+        self.sent = 0
+        # Characters in flight as of the last Acknowledge
+        self.unprinted = 0
+        # Characters printed as of the last Acknowledge (not wrapped) and
+        # its time
+        self._printed = None
+        self._ack_time = None
+
+        # Estimate of characters in flight at time _estimate_time
+        self._estimate = 0.0
+        self._estimate_time = time.monotonic()
+
+        # Statistics
+        self._start_time = self._estimate_time
+        self._first_send_time = None
+        self._last_send_time = None
+        self._acks = 0
+        self._unprinted_sum = 0
+        self._unprinted_max = 0
+        self._sends = 0
+        self._paused = 0
+
+
+    def in_flight(self, now:float=None) -> float:
+        """Return estimate of characters sent but not printed yet."""
+        if now is None:
+            now = time.monotonic()
+        return max(0.0, self._estimate - (now - self._estimate_time) / self.char_time)
+
+
+    def allowance(self, now:float=None) -> int:
+        """
+        Return number of characters which may be sent now (0 if sending has to
+        be paused).
+        """
+        allowed = int(self.window - self.in_flight(now))
+        if allowed <= 0:
+            self._paused += 1
+            return 0
+        return allowed
+
+
+    def on_sent(self, count:int, now:float=None):
+        """Account for count characters having been sent."""
+        if not count:
+            return
+        if now is None:
+            now = time.monotonic()
+        self._estimate = self.in_flight(now) + count
+        self._estimate_time = now
+        self.sent += count
+        self._sends += 1
+        if self._first_send_time is None:
+            self._first_send_time = now
+        self._last_send_time = now
+
+
+    def on_ack(self, counter:int, now:float=None) -> int:
+        """
+        Evaluate the counter of an Acknowledge packet received. Return the
+        number of characters in flight.
+        """
+        if now is None:
+            now = time.monotonic()
+        # The counter is 8 bit, just like the difference. If the remote's
+        # counter starts below zero (e.g. while printing its welcome banner),
+        # this yields the characters it has still got to print.
+        unprinted = (self.sent - counter) & 0xFF
+        printed = self.sent - unprinted
+
+        # Measure printing speed: characters printed since the last
+        # Acknowledge. If the remote had characters to print all the time,
+        # this is its speed; if it ran empty, it's at least this fast.
+        if self._ack_time is not None:
+            count = printed - self._printed
+            if count > 0:
+                char_time = (now - self._ack_time) / count
+                if (self.unprinted and unprinted) or char_time < self.char_time:
+                    char_time = (self.char_time + char_time) / 2
+                    self.char_time = min(max(char_time, CHAR_TIME_MIN), CHAR_TIME_MAX)
+
+        self.unprinted = unprinted
+        self._printed = printed
+        self._ack_time = now
+        self._estimate = unprinted
+        self._estimate_time = now
+        self._acks += 1
+        self._unprinted_sum += self.unprinted
+        self._unprinted_max = max(self._unprinted_max, self.unprinted)
+        return self.unprinted
+
+    # =====
+
+    def stats(self) -> dict:
+        """Return statistics of the connection so far."""
+        now = time.monotonic()
+        if self._first_send_time is not None and self._last_send_time > self._first_send_time:
+            throughput = self.sent / (self._last_send_time - self._first_send_time)
+        else:
+            throughput = 0.0
+        return {
+            'duration': now - self._start_time,
+            'sent': self.sent,
+            'packets': self._sends,
+            'throughput': throughput,
+            'window': self.window,
+            'char_time': self.char_time,
+            'acks': self._acks,
+            'unprinted_avg': self._unprinted_sum / self._acks if self._acks else 0.0,
+            'unprinted_max': self._unprinted_max,
+            'paused': self._paused,
+        }
+
+
+    def stats_text(self) -> str:
+        """Return statistics for the log."""
+        return ("{sent} chars in {packets} packets, {throughput:.2f} chars/s, "
+            "window {window}, in flight avg {unprinted_avg:.1f} max {unprinted_max} "
+            "({acks} acks), {char_time:.3f} s/char, paused {paused} times".format(**self.stats()))
+
+#######
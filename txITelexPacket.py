@@ -0,0 +1,216 @@
+#!/usr/bin/python3
+"""
+Telex i-Telex Packet Decoder
+
+Incremental decoder for the data received on an i-Telex connection. Feed it
+the chunks as they come from the socket, of any size; it returns the
+complete packets found so far and keeps the rest for the next chunk.
+
+Packet layout (see i-Telex Communication Specification, r874): one byte
+type, one byte payload length, payload.
+
+    Type  Packet         Payload length   Payload
+    0x00  Heartbeat      0
+    0x01  Direct Dial    1                extension (encoded)
+    0x02  Baudot Data    1..50            Baudot codes
+    0x03  End            0
+    0x04  Reject         0..20            reason (ASCII, may be padded by 0)
+    0x06  Acknowledge    1                counter of printed characters
+    0x07  Version        1..20            version number, version string
+    0x08  Self Test      >= 2             arbitrary
+    0x09  Remote Config  >= 3             (not evaluated)
+
+Types 0x00-0x09 and 0x10-0x1F are i-Telex packet types; a packet of one of
+these types with an unknown type or invalid length is returned as
+InvalidPacket. Byte 0xFF starts a 3 byte Telnet command (IAC). All other
+bytes are ASCII connection data, returned in runs as AsciiData.
+"""
+__author__      = "Jochen Krapf"
+__email__       = "jk@nerd2nerd.org"
+__copyright__   = "Copyright 2020, JK"
+__license__     = "GPL3"
+__version__     = "0.0.1"
+
+import logging
+l = logging.getLogger("piTelex." + __name__)
+
+# i-Telex packet types (everything else is ASCII data or Telnet command)
+PACKET_TYPES = frozenset(list(range(0x00, 0x09+1)) + list(range(0x10, 0x1f+1)))
+
+TELNET_IAC = 0xFF
+
+#######
+
+class Packet:
+    """
+    Received packet. raw contains the complete packet as received, including
+    type and length bytes (if any).
+    """
+    __slots__ = ('raw',)
+
+    def __init__(self, raw:bytes):
+        self.raw = bytes(raw)
+
+    @property
+    def payload(self) -> bytes:
+        return self.raw[2:]
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.raw == other.raw
+
+    def __repr__(self):
+        return "{}({!r})".format(type(self).__name__, self.raw)
+
+
+class Heartbeat(Packet):
+    __slots__ = ()
+
+class DirectDial(Packet):
+    __slots__ = ()
+
+    @property
+    def extension(self) -> int:
+        ''' raw extension number, see txDevITelexCommon.decode_ext_from_direct_dial '''
+        return self.raw[2]
+
+class BaudotData(Packet):
+    __slots__ = ()
+
+class End(Packet):
+    __slots__ = ()
+
+class Reject(Packet):
+    __slots__ = ()
+
+    @property
+    def reason(self) -> str:
+        return self.raw[2:].decode('ASCII', errors='ignore').rstrip('\x00')
+
+class Ack(Packet):
+    __slots__ = ()
+
+    @property
+    def counter(self) -> int:
+        return self.raw[2]
+
+class Version(Packet):
+    __slots__ = ()
+
+    @property
+    def version(self) -> int:
+        return self.raw[2]
+
+    @property
+    def version_string(self) -> str:
+        return self.raw[3:].decode('ASCII', errors='ignore').rstrip('\x00')
+
+class SelfTest(Packet):
+    __slots__ = ()
+
+class RemoteConfig(Packet):
+    __slots__ = ()
+
+class InvalidPacket(Packet):
+    """i-Telex packet type with unknown type or invalid length"""
+    __slots__ = ()
+
+class TelnetCommand(Packet):
+    """Telnet IAC sequence (3 bytes), to be ignored"""
+    __slots__ = ()
+
+    @property
+    def payload(self) -> bytes:
+        return self.raw[1:]
+
+class AsciiData(Packet):
+    """Run of ASCII connection data (no type and length bytes)"""
+    __slots__ = ()
+
+    @property
+    def payload(self) -> bytes:
+        return self.raw
+
+# =====
+
+# type: (class, minimum payload length, maximum payload length)
+_PACKET_CLASSES = {
+    0x00: (Heartbeat, 0, 0),
+    0x01: (DirectDial, 1, 1),
+    0x02: (BaudotData, 1, 50),
+    0x03: (End, 0, 0),
+    0x04: (Reject, 0, 20),
+    0x06: (Ack, 1, 1),
+    0x07: (Version, 1, 20),
+    0x08: (SelfTest, 2, 255),
+    0x09: (RemoteConfig, 3, 255),
+}
+
+#######
+
+class PacketDecoder:
+    """
+    Incremental i-Telex packet decoder, see module description.
+
+    decoder = PacketDecoder()
+    for packet in decoder.feed(s.recv(4096)):
+        ...
+    """
+    def __init__(self):
+        self._buffer = bytearray()
+
+
+    def feed(self, data:bytes) -> list:
+        """
+        Add received data and return the list of packets completed by it
+        (possibly empty).
+        """
+        buf = self._buffer
+        buf += data
+        packets = []
+        pos = 0
+        end = len(buf)
+
+        while pos < end:
+            b = buf[pos]
+
+            if b in PACKET_TYPES:
+                if end - pos < 2:
+                    break   # length byte missing
+                length = buf[pos + 1]
+                if end - pos < 2 + length:
+                    break   # payload incomplete
+                raw = buf[pos:pos + 2 + length]
+                pos += 2 + length
+                cls, min_len, max_len = _PACKET_CLASSES.get(b, (InvalidPacket, 0, 255))
+                if not min_len <= length <= max_len:
+                    cls = InvalidPacket
+                packets.append(cls(raw))
+
+            elif b == TELNET_IAC:
+                if end - pos < 3:
+                    break   # command incomplete
+                packets.append(TelnetCommand(buf[pos:pos + 3]))
+                pos += 3
+
+            else:
+                # Run of ASCII data, up to the next packet or Telnet command
+                start = pos
+                pos += 1
+                while pos < end and buf[pos] not in PACKET_TYPES and buf[pos] != TELNET_IAC:
+                    pos += 1
+                packets.append(AsciiData(buf[start:pos]))
+
+        del buf[:pos]
+        return packets
+
+
+    def pending(self) -> int:
+        """Return number of bytes of an incomplete packet kept so far."""
+        return len(self._buffer)
+
+
+    def reset(self):
+        """Drop incomplete data, e.g. after a protocol error."""
+        self._buffer.clear()
+
+#######
@@ -0,0 +1,463 @@
+#!/usr/bin/python3
+"""
+Telex i-Telex TNS (Teilnehmerserver, subscriber server) support
+
+TNSCache: cache of TNS query results, kept in memory and in a JSON file so
+that it survives a restart.
+
+- Entries younger than ttl are returned as they are. Entries giving an IP
+  address instead of a hostname (dynamic IP subscribers, whose address may
+  change any time) use the much shorter ttl_dynamic instead.
+- Entries older than ttl, but younger than stale, are returned as well, but
+  the caller should refresh them in the background (stale-while-revalidate):
+  the dial goes ahead immediately with the address known, which is nearly
+  always still right.
+- "Not found" results are cached too, for negative_ttl only, so that
+  redialling a wrong number doesn't query the TNS again and again.
+
+TNSServers: health tracker for the configured TNS servers. A background
+thread probes all servers concurrently (connect only, short timeout) and
+ranks them by latency. best() answers at once: the last server that worked,
+as long as it keeps working, otherwise the fastest one known to be up.
+Actual queries report their outcome, so a failing server is noticed
+without waiting for the next probe. get_servers() returns the shared
+tracker for a server list, so all i-Telex modules use the same one.
+
+first_answer: run several queries (e.g. for several TNS servers)
+concurrently and return the first positive result.
+"""
+__author__      = "Jochen Krapf"
+__email__       = "jk@nerd2nerd.org"
+__copyright__   = "Copyright 2020, JK"
+__license__     = "GPL3"
+__version__     = "0.0.1"
+
+import asyncio
+import ipaddress
+import json
+import os
+import socket
+import threading
+import time
+
+import logging
+l = logging.getLogger("piTelex." + __name__)
+
+# Default cache parameters (seconds)
+CACHE_TTL = 24 * 60 * 60
+CACHE_TTL_DYNAMIC = 5 * 60
+CACHE_STALE = 7 * 24 * 60 * 60
+CACHE_NEGATIVE_TTL = 10 * 60
+
+# Cache lookup results
+MISS = 0    # not cached (or expired): query TNS
+FRESH = 1   # cached and fresh
+STALE = 2   # cached, usable, but should be refreshed
+
+# Default health tracker parameters (seconds)
+PROBE_TIMEOUT = 1.0
+PROBE_INTERVAL = 10 * 60
+
+#######
+
+class TNSCache:
+    def __init__(self, file_name:str=None, ttl:float=CACHE_TTL, stale:float=CACHE_STALE, negative_ttl:float=CACHE_NEGATIVE_TTL,
+            ttl_dynamic:float=CACHE_TTL_DYNAMIC):
+        """
+        file_name: JSON file to keep the cache in; None or empty for memory
+        only
+        """
+        self.file_name = file_name
+        self.ttl = ttl
+        self.ttl_dynamic = min(ttl_dynamic, ttl)
+        self.stale = max(stale, ttl)
+        self.negative_ttl = negative_ttl
+
+        # number: (time, user dict or None for "not found")
+        self._entries = {}
+        self._lock = threading.Lock()
+
+        # Numbers being refreshed in background (see refresh)
+        self._refreshing = set()
+
+        self.load()
+
+
+    def get(self, number:str):
+        """
+        Look up number. Return (state, user), state being MISS, FRESH or
+        STALE. user is a copy of the cached user dict, or None if the number
+        is cached as not found (or not cached at all).
+        """
+        with self._lock:
+            entry = self._entries.get(number)
+        if not entry:
+            return MISS, None
+
+        t, user = entry
+        age = time.time() - t
+        if user is None:
+            if 0 <= age < self.negative_ttl:
+                return FRESH, None
+            return MISS, None
+        ttl = self.ttl_dynamic if is_ip_address(user.get('Host')) else self.ttl
+        if 0 <= age < ttl:
+            return FRESH, dict(user)
+        if age < self.stale:
+            return STALE, dict(user)
+        return MISS, None
+
+
+    def put(self, number:str, user:dict):
+        """Cache TNS result for number (user None: not found)."""
+        with self._lock:
+            self._entries[number] = (time.time(), dict(user) if user else None)
+        self.save()
+
+
+    def remove(self, number:str):
+        with self._lock:
+            if self._entries.pop(number, None) is None:
+                return
+        self.save()
+
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        self.save()
+
+
+    def refresh(self, number:str, query):
+        """
+        Refresh number in background by calling query(number), which returns
+        the user dict, None if not found, or raises an exception if the TNS
+        couldn't be asked (entry is kept then). Only one refresh per number
+        runs at a time.
+        """
+        with self._lock:
+            if number in self._refreshing:
+                return
+            self._refreshing.add(number)
+
+        def worker():
+            try:
+                user = query(number)
+            except Exception as e:
+                l.info("TNS cache: refreshing {!r} failed: {!r}".format(number, e))
+            else:
+                l.info("TNS cache: refreshed {!r}".format(number))
+                self.put(number, user)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(number)
+
+        threading.Thread(target=worker, name='TNSRefresh', daemon=True).start()
+
+    # =====
+
+    def load(self):
+        if not self.file_name:
+            return
+        try:
+            with open(self.file_name, 'r') as fp:
+                data = json.load(fp)
+            entries = {}
+            for number, entry in data.get('entries', {}).items():
+                entries[str(number)] = (float(entry['time']), entry['user'])
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            l.warning("TNS cache: can't load {!r}, starting empty: {!r}".format(self.file_name, e))
+            return
+        with self._lock:
+            self._entries = entries
+        l.info("TNS cache: {} entries loaded from {!r}".format(len(entries), self.file_name))
+
+
+    def save(self):
+        if not self.file_name:
+            return
+        with self._lock:
+            data = {
+                'version': 1,
+                'entries': {number: {'time': t, 'user': user} for number, (t, user) in self._entries.items()},
+            }
+            # Write to temporary file first so that a crash never leaves a
+            # broken cache file behind
+            tmp_name = self.file_name + '.tmp'
+            try:
+                with open(tmp_name, 'w') as fp:
+                    json.dump(data, fp, indent=1)
+                os.replace(tmp_name, self.file_name)
+            except OSError as e:
+                l.warning("TNS cache: can't save {!r}: {!r}".format(self.file_name, e))
+
+#######
+
+def is_ip_address(host) -> bool:
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
+
+# =====
+
+class TNSServers:
+    def __init__(self, addresses:list, port:int, probe_timeout:float=PROBE_TIMEOUT, probe_interval:float=PROBE_INTERVAL):
+        self.addresses = list(addresses)
+        self.port = port
+        self.probe_timeout = probe_timeout
+        self.probe_interval = probe_interval
+
+        # address: latency of last successful connect (s), None if last
+        # connect failed; missing if not tried yet
+        self._latency = {}
+        # Server that worked last
+        self._sticky = None
+        self._lock = threading.Lock()
+
+        self._probe_request = threading.Event()
+        self._probe_done = threading.Event()
+        self._thread = None
+
+
+    def best(self) -> str:
+        """
+        Return the server to use now, without blocking. Before the first
+        probe has finished, that's the first configured one.
+        """
+        self._start()
+        ranked = self.ranked()
+        return ranked[0] if ranked else None
+
+
+    def ranked(self) -> list:
+        """
+        Return all servers, best first: the sticky one, if it's up, then
+        those known up by latency, then the untried ones and finally those
+        known down, each in configured order.
+        """
+        with self._lock:
+            latency = dict(self._latency)
+            sticky = self._sticky
+        up = sorted((a for a in self.addresses if latency.get(a) is not None), key=lambda a: latency[a])
+        untried = [a for a in self.addresses if a not in latency]
+        down = [a for a in self.addresses if a in latency and latency[a] is None]
+        ranked = up + untried + down
+        if sticky in up:
+            ranked.remove(sticky)
+            ranked.insert(0, sticky)
+        return ranked
+
+
+    def report_success(self, address:str, latency:float=None):
+        """Report that address worked (connect took latency seconds)."""
+        with self._lock:
+            if latency is not None or self._latency.get(address) is None:
+                self._latency[address] = latency if latency is not None else self.probe_timeout
+            self._sticky = address
+
+
+    def report_failure(self, address:str):
+        """Report that address didn't work; reprobe all servers soon."""
+        with self._lock:
+            self._latency[address] = None
+            if self._sticky == address:
+                self._sticky = None
+        self.probe()
+
+
+    def status(self) -> dict:
+        """Return address: latency (None: down) of all servers tried."""
+        with self._lock:
+            return dict(self._latency)
+
+    # =====
+
+    def probe(self, wait:float=0) -> bool:
+        """
+        Request probing all servers now. Wait at most wait seconds for it to
+        finish; return True if finished.
+        """
+        self._start()
+        self._probe_done.clear()
+        self._probe_request.set()
+        if wait:
+            return self._probe_done.wait(wait)
+        return False
+
+
+    def _start(self):
+        with self._lock:
+            if self._thread:
+                return
+            self._thread = threading.Thread(target=self._thread_probe, name='TNSProbe', daemon=True)
+        # First probe right away
+        self._probe_request.set()
+        self._thread.start()
+
+
+    def _thread_probe(self):
+        while True:
+            self._probe_request.wait(self.probe_interval)
+            self._probe_request.clear()
+            self._probe_all()
+            self._probe_done.set()
+
+
+    def _probe_all(self):
+        """Probe all servers concurrently."""
+        results = {}
+        def probe(address):
+            t = time.monotonic()
+            try:
+                with socket.create_connection((address, self.port), timeout=self.probe_timeout):
+                    pass
+            except OSError as e:
+                l.info("TNS {} down: {!s}".format(address, e))
+                results[address] = None
+            else:
+                results[address] = time.monotonic() - t
+
+        threads = [threading.Thread(target=probe, args=(a,), daemon=True) for a in self.addresses]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        with self._lock:
+            self._latency.update(results)
+            if self._sticky is None or results.get(self._sticky, 0) is None:
+                up = [a for a in self.addresses if results.get(a) is not None]
+                self._sticky = min(up, key=results.get) if up else None
+        l.debug("TNS probe: {!r}, using {!r}".format(results, self._sticky))
+
+
+    def connect(self, timeout:float=3.0) -> socket.socket:
+        """
+        Return a socket connected to the best server that can be reached.
+        Servers are tried in ranked order; the outcome is reported. Raises
+        OSError if none can be reached.
+        """
+        self._start()
+        error = OSError("No TNS configured")
+        for address in self.ranked():
+            try:
+                return self.connect_to(address, timeout)
+            except OSError as e:
+                error = e
+        raise error
+
+
+    def connect_to(self, address:str, timeout:float=3.0) -> socket.socket:
+        """
+        Return a socket connected to server address and report the outcome.
+        Raises OSError if it can't be reached.
+        """
+        t = time.monotonic()
+        try:
+            s = socket.create_connection((address, self.port), timeout=timeout)
+        except OSError as e:
+            l.info("TNS {} not reachable: {!s}".format(address, e))
+            self.report_failure(address)
+            raise
+        self.report_success(address, time.monotonic() - t)
+        l.info("TNS selected: "+address)
+        return s
+
+
+    async def open_connection(self, timeout:float=3.0):
+        """
+        Coroutine version of connect() for the shared event loop (txAsync):
+        return (reader, writer) connected to the best server that can be
+        reached. Raises OSError if none can be reached.
+        """
+        self._start()
+        error = OSError("No TNS configured")
+        for address in self.ranked():
+            t = time.monotonic()
+            try:
+                streams = await asyncio.wait_for(asyncio.open_connection(address, self.port), timeout)
+            except (OSError, asyncio.TimeoutError) as e:
+                l.info("TNS {} not reachable: {!r}".format(address, e))
+                self.report_failure(address)
+                error = e if isinstance(e, OSError) else OSError("TNS {} timeout".format(address))
+                continue
+            self.report_success(address, time.monotonic() - t)
+            l.info("TNS selected: "+address)
+            return streams
+        raise error
+
+# =====
+
+_servers = {}
+_servers_lock = threading.Lock()
+
+def get_servers(addresses:list, port:int) -> TNSServers:
+    """Return the shared health tracker for addresses and port."""
+    key = (tuple(addresses), port)
+    with _servers_lock:
+        servers = _servers.get(key)
+        if not servers:
+            servers = _servers[key] = TNSServers(addresses, port)
+        return servers
+
+#######
+
+def first_answer(queries:list, timeout:float):
+    """
+    Run queries concurrently, each in a thread of its own, and return the
+    first result that isn't None, without waiting for the others.
+
+    queries: list of (key, function); the functions take no arguments and
+    return the result, None for "not found", or raise an exception if they
+    couldn't get an answer.
+
+    If there is no result: return None as soon as a "not found" has been
+    received for every key (several queries may share a key, e.g. the same
+    number asked at several servers), else raise the last exception (e.g.
+    timeout: all queries taking longer than timeout seconds).
+    """
+    cond = threading.Condition()
+    answers = []   # (key, result, exception)
+
+    def worker(key, query):
+        try:
+            result, error = query(), None
+        except Exception as e:
+            result, error = None, e
+        with cond:
+            answers.append((key, result, error))
+            cond.notify()
+
+    for key, query in queries:
+        threading.Thread(target=worker, args=(key, query), name='TNSQuery', daemon=True).start()
+
+    deadline = time.monotonic() + timeout
+    keys = {key for key, _ in queries}
+    not_found = set()
+    error = TimeoutError("No TNS answer within {} s".format(timeout))
+    done = 0
+    with cond:
+        while done < len(queries):
+            if len(answers) == done:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                cond.wait(remaining)
+                continue
+            key, result, e = answers[done]
+            done += 1
+            if result is not None:
+                return result
+            if e:
+                error = e
+            else:
+                not_found.add(key)
+                if not_found >= keys:
+                    return None
+    raise error
+
+#######
@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+"""
+Telex Timers - periodic timers for the main loop
+"""
+__author__      = "Jochen Krapf"
+__email__       = "jk@nerd2nerd.org"
+__copyright__   = "Copyright 2020, JK"
+__license__     = "GPL3"
+__version__     = "0.0.1"
+
+import time
+import heapq
+
+import logging
+l = logging.getLogger("piTelex." + __name__)
+
+#######
+
+class TimerQueue():
+    """
+    Periodic timers ordered by their next due time.
+
+    The main loop asks for the time until the next timer is due, blocks at
+    most that long and then calls process() to run all due callbacks. Timers
+    don't drift: the next due time is advanced by the period, not computed
+    from the time the callback actually ran. If the loop fell behind by more
+    than one period (e.g. a device blocked in write), missed ticks are dropped
+    instead of being run in a burst.
+
+    A timer may be given a predicate active(): while it returns False, the
+    timer doesn't wake up the loop and its ticks are skipped.
+    """
+
+    def __init__(self):
+        self._timers = []   # heap of [due, seq, period, callback, active]
+        self._seq = 0
+
+    def add(self, period:float, callback, active=None):
+        self._seq += 1
+        heapq.heappush(self._timers, [time.monotonic() + period, self._seq, period, callback, active])
+
+    def time_to_next(self) -> float:
+        ''' seconds until the next active timer is due (None if there is none) '''
+        due = [timer[0] for timer in self._timers if timer[4] is None or timer[4]()]
+        if not due:
+            return None
+        return max(0.0, min(due) - time.monotonic())
+
+    def process(self) -> bool:
+        ''' run all due active timers; return True if at least one has been run '''
+        ran = False
+        time_act = time.monotonic()
+
+        while self._timers and self._timers[0][0] <= time_act:
+            timer = self._timers[0]
+            due, _, period, callback, active = timer
+            due += period
+            if due <= time_act:
+                due = time_act + period   # fell behind - skip missed ticks
+            timer[0] = due
+            heapq.heapreplace(self._timers, timer)
+            if active is None or active():
+                callback()
+                ran = True
+
+        return ran
+
+#######
@@ -0,0 +1,138 @@
+#!/usr/bin/python3
+"""
+Telex local user list (phonebook) of the i-Telex client
+
+The CSV file is read once and indexed by nickname and telex number. It's
+read again only when it has changed on disk (modification time or size),
+so edits take effect with the next dial without restarting piTelex.
+
+The header items must be: 'nick,tnum,extn,type,host,port,name' (can be in
+any order). Typical row: 'FABLABWUE, 234200, -, I, fablab.dyn.nerd2nerd.org,
+2342, "FabLab, Wuerzburg"'. Rows starting with '#' are comments.
+"""
+__author__      = "Jochen Krapf"
+__email__       = "jk@nerd2nerd.org"
+__copyright__   = "Copyright 2020, JK"
+__license__     = "GPL3"
+__version__     = "0.0.1"
+
+from bisect import bisect_left
+import csv
+import os
+import threading
+
+import logging
+l = logging.getLogger("piTelex." + __name__)
+
+# Possible CSV delimiters
+DELIMITERS = ',;\t|'
+
+#######
+
+class UserList:
+    def __init__(self, file_name:str):
+        self.file_name = file_name
+        # All user dicts in file order
+        self.users = []
+        # Nick or TNum: user dict (first one in file order)
+        self._index = {}
+        # Sorted keys of _index, for prefix search
+        self._keys = []
+        # (mtime, size) of the file read, None if not read
+        self._file_state = None
+        self._lock = threading.Lock()
+
+
+    def find(self, number:str) -> dict:
+        """
+        Return a copy of the user dict whose Nick or TNum equals number (the
+        first one in the file), None if there is none.
+        """
+        self._check_reload()
+        user = self._index.get(number)
+        return dict(user) if user else None
+
+
+    def find_prefix(self, prefix:str, limit:int=None) -> list:
+        """
+        Return copies of the user dicts whose Nick or TNum starts with prefix,
+        in order of these keys (each user only once). Return at most limit
+        users if limit is given.
+        """
+        self._check_reload()
+        keys = self._keys
+        users = []
+        seen = set()
+        i = bisect_left(keys, prefix)
+        while i < len(keys) and keys[i].startswith(prefix):
+            user = self._index[keys[i]]
+            if id(user) not in seen:
+                seen.add(id(user))
+                users.append(dict(user))
+                if limit and len(users) >= limit:
+                    break
+            i += 1
+        return users
+
+
+    def find_abbreviated(self, prefix:str) -> dict:
+        """
+        Abbreviated dialling: return a copy of the user dict that is the only
+        one whose Nick or TNum starts with prefix, or whose Nick or TNum
+        equals it; None if there's none or the prefix is ambiguous.
+        """
+        user = self.find(prefix)
+        if user:
+            return user
+        users = self.find_prefix(prefix, limit=2)
+        return users[0] if len(users) == 1 else None
+
+    # =====
+
+    def _check_reload(self):
+        try:
+            st = os.stat(self.file_name)
+            state = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            state = None
+        if state == self._file_state:
+            return
+        with self._lock:
+            if state != self._file_state:
+                self._load(state)
+
+
+    def _load(self, state):
+        users = []
+        if state:
+            try:
+                with open(self.file_name, 'r') as f:
+                    # Delimiter is the one found most in the header; the csv
+                    # sniffer gets rows like 'A, 1, -, I, ...' wrong
+                    header = f.readline()
+                    delimiter = max(DELIMITERS, key=header.count)
+                    f.seek(0)
+                    csv_reader = csv.DictReader(f, delimiter=delimiter, skipinitialspace=True)
+                    for user in csv_reader:
+                        first = next(iter(user.values()), None)
+                        if not first or first.startswith('#'):
+                            continue   # comment or empty row
+                        users.append(dict(user))
+            except Exception as e:
+                l.warning("Can't read user list {!r}: {!r}".format(self.file_name, e))
+                users = []
+
+        index = {}
+        for user in users:
+            for key in (user.get('Nick'), user.get('TNum')):
+                if key:
+                    index.setdefault(key, user)
+
+        self.users = users
+        self._keys = sorted(index)
+        self._index = index
+        self._file_state = state
+        if state:
+            l.info("User list {!r} loaded: {} entries".format(self.file_name, len(users)))
+
+#######
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+ED1000 receive demodulator check, offline
+
+Runs the receive demodulators of the ED1000 module (txFSK, "recv_detector"
+iir and dft) over a test signal in blocks, like the rx thread does, and
+compares them with the former one, which restarted its filters on every
+block and averaged over the whole block. Shown per block size:
+
+- delay: time from a level change until the decision follows, mean and max
+- errors: blocks decided wrong, not counting those ending within one slice
+  (a quarter bit) around a level change or after the start. The level sent
+  is delayed by the median delay first: a constant delay doesn't matter for
+  character recognition, only its variation does. So this counts wrong
+  decisions in the middle half of the bits, where characters are sampled.
+- CPU: processor time per second of audio
+
+The script exits with an error if a current demodulator makes more errors
+than the former one at any block size, or if the default one (iir) follows
+level changes later on average.
+
+The test signal is synthesized: random characters with start and stop bits
+at the receive frequencies, plus noise. It can be written to a WAV file
+(--write) to be played to a teleprinter or another check. A recorded WAV
+file (48 kHz, 16 bit, mono) can be demodulated instead (--wav); as its
+content is unknown, only the decisions are written to a CSV file.
+
+How to use (from the piTelex directory):
+
+    python3 utils/ED1000/demod_check.py [--baudrate 50] [--snr DB] [--write test.wav]
+    python3 utils/ED1000/demod_check.py --wav recording.wav [--csv bits.csv]
+"""
+
+import argparse
+import os
+import sys
+import time
+import wave
+
+import numpy as np
+from scipy import signal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import txFSK
+from txFSK import sample_f
+
+#######
+
+def synthesize(recv_f, baudrate, chars, snr=None, amplitude=8000, seed=1, stop_bits=2.0, gap=0.0):
+    """
+    Return (samples, levels, frames): int16 FSK signal of random Baudot
+    characters (start bit, 5 data bits, stop_bits, a random pause of up to
+    gap bits, idle Z before and after), the level sent (0: A, 1: Z) per
+    sample and (start sample, code) of each character.
+    """
+    rng = np.random.default_rng(seed)
+    spb = sample_f / baudrate
+    # (level, length in bits)
+    steps = [(1, 20)]
+    for code in rng.integers(0, 32, chars):
+        steps.append((0, 1))
+        steps += [((code >> i) & 1, 1) for i in range(5)]
+        steps.append((1, stop_bits + rng.uniform(0, gap)))
+    steps.append((1, 20))
+
+    bounds = np.rint(np.cumsum([0] + [n for _, n in steps]) * spb).astype(int)
+    levels = np.repeat(np.array([b for b, _ in steps], dtype=np.int8), np.diff(bounds))
+    codes = [sum(steps[2 + 7 * k + i][0] << i for i in range(5)) for k in range(chars)]
+    frames = [(int(bounds[1 + 7 * k]), codes[k]) for k in range(chars)]
+
+    freq = np.where(levels, recv_f[1], recv_f[0])
+    phase = np.cumsum(2 * np.pi * freq / sample_f)
+    x = amplitude * np.sin(phase)
+    if snr is not None:
+        x += rng.normal(0, amplitude / np.sqrt(2) / 10 ** (snr / 20), len(x))
+    return np.clip(x, -32767, 32767).astype(np.int16), levels, frames
+
+
+def read_wav(file_name):
+    with wave.open(file_name, 'rb') as f:
+        if f.getframerate() != sample_f or f.getsampwidth() != 2 or f.getnchannels() != 1:
+            sys.exit("{}: must be {} Hz, 16 bit, mono".format(file_name, sample_f))
+        return np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+
+
+def write_wav(file_name, samples):
+    with wave.open(file_name, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_f)
+        f.writeframes(samples.astype(np.int16).tobytes())
+
+# =====
+
+class LegacyDemodulator:
+    """Former TelexED1000SC._recv_decode: filters restarted on every block."""
+    def __init__(self, recv_f):
+        self._filters = [signal.iirfilter(4, [f/1.05, f*1.05], rs=40, btype='bandpass',
+                            analog=False, ftype='butter', fs=sample_f, output='sos')
+                        for f in recv_f]
+
+    def decide(self, data, squelch):
+        val = [None, None]
+        for i in range(2):
+            fdata = signal.sosfilt(self._filters[i], data)
+            fdata = np.abs(fdata)
+            val[i] = int(np.average(fdata))
+        return None if val[0] + val[1] < squelch else val[0] < val[1]
+
+
+class StreamingDemodulator:
+    """Current TelexED1000SC._recv_decode, recv_detector as given."""
+    def __init__(self, recv_f, baudrate, detector):
+        self._demod = txFSK.DEMODULATORS[detector](recv_f, baudrate)
+
+    def decide(self, data, squelch):
+        energy = self._demod.process(data)
+        val = [int(energy[0, -1]), int(energy[1, -1])]
+        return None if val[0] + val[1] < squelch else val[0] < val[1]
+
+
+def demodulators(recv_f, baudrate):
+    """Return (name, demodulator) of the former and all current ones."""
+    return [('former', LegacyDemodulator(recv_f))] + [
+        (detector, StreamingDemodulator(recv_f, baudrate, detector)) for detector in txFSK.DEMODULATORS]
+
+
+def run_blocks(demod, samples, block, squelch):
+    """
+    Return decision (1, 0, -1: squelch) at the end of every block, and CPU
+    time used per second of audio.
+    """
+    n = len(samples) // block
+    t = time.process_time()
+    decisions = [demod.decide(samples[i*block:(i+1)*block], squelch) for i in range(n)]
+    t = time.process_time() - t
+    return (np.array([{True: 1, False: 0, None: -1}[d] for d in decisions], dtype=np.int8),
+        t / (n * block / sample_f))
+
+
+def evaluate(decisions, levels, block, guard):
+    """Return (errors, blocks counted, delays in s) of decisions against levels."""
+    ends = np.arange(1, len(decisions) + 1) * block - 1
+    changes = np.flatnonzero(np.diff(levels)) + 1
+
+    delays = []
+    for c in changes:
+        k = np.searchsorted(ends, c)
+        new = levels[c]
+        # Next change; the decision must follow before it
+        following = changes[np.searchsorted(changes, c, side='right')] if c < changes[-1] else len(levels)
+        while k < len(decisions) and ends[k] < following:
+            if decisions[k] == new:
+                delays.append((ends[k] - c) / sample_f)
+                break
+            k += 1
+
+    # Compare with level sent, delayed like the decisions
+    shift = int(np.median(delays) * sample_f) if delays else 0
+    truth = levels[np.maximum(ends - shift, 0)]
+    # Count only blocks ending at least guard samples away from any (delayed)
+    # level change, and the start
+    shifted = np.concatenate(([0], changes + shift, [len(levels) + guard]))
+    k = np.searchsorted(shifted, ends, side='right')
+    counted = (ends - shifted[k - 1] >= guard) & (shifted[k] - ends >= guard)
+    errors = int(np.sum((decisions != truth) & counted))
+    return errors, int(np.sum(counted)), delays
+
+# =====
+
+def main():
+    parser = argparse.ArgumentParser(description="ED1000 receive demodulator check")
+    parser.add_argument('--baudrate', type=float, default=50)
+    parser.add_argument('--recv-f', type=float, nargs=2, default=[2250, 3150], metavar=('F0', 'F1'))
+    parser.add_argument('--chars', type=int, default=200)
+    parser.add_argument('--snr', type=float, help="add noise, dB")
+    parser.add_argument('--squelch', type=int, default=100)
+    parser.add_argument('--blocks', type=int, nargs='+', help="block sizes (default: 1/4, 1/8, 1/16 bit)")
+    parser.add_argument('--write', help="write test signal to WAV file")
+    parser.add_argument('--wav', help="demodulate WAV file instead")
+    parser.add_argument('--csv', help="with --wav: write decisions per block to CSV file")
+    args = parser.parse_args()
+
+    spb = sample_f / args.baudrate
+    blocks = args.blocks or [int(spb / d + 0.5) for d in (4, 8, 16)]
+
+    if args.wav:
+        samples = read_wav(args.wav)
+        block = blocks[0]
+        print("{}: {:.1f} s, {} blocks of {}".format(args.wav, len(samples) / sample_f, len(samples) // block, block))
+        results = {}
+        for name, demod in demodulators(args.recv_f, args.baudrate):
+            results[name], cpu = run_blocks(demod, samples, block, args.squelch)
+            print("{:8}  CPU {:6.1f} ms/s  decisions differing from former: {}".format(
+                name, cpu * 1000, int(np.sum(results[name] != results['former']))))
+        if args.csv:
+            with open(args.csv, 'w') as f:
+                f.write("time,{}\n".format(','.join(results)))
+                for i, row in enumerate(zip(*results.values())):
+                    f.write("{:.4f},{}\n".format((i + 1) * block / sample_f, ','.join(str(d) for d in row)))
+        return
+
+    samples, levels, _ = synthesize(args.recv_f, args.baudrate, args.chars, args.snr)
+    if args.write:
+        write_wav(args.write, samples)
+    print("{} characters at {} Bd, {} Hz/{} Hz, SNR {}".format(args.chars, args.baudrate,
+        *args.recv_f, "{} dB".format(args.snr) if args.snr is not None else "-"))
+
+    failed = False
+    guard = int(spb / 4)
+    for block in blocks:
+        results = {}
+        mean_delays = {}
+        for name, demod in demodulators(args.recv_f, args.baudrate):
+            decisions, cpu = run_blocks(demod, samples, block, args.squelch)
+            errors, counted, delays = evaluate(decisions, levels, block, guard)
+            print("block {:4} ({:4.1f} ms)  {:6}  delay {}  errors {:5} of {:5}  CPU {:6.1f} ms/s".format(
+                block, block / sample_f * 1000, name,
+                "mean {:5.1f} ms  max {:5.1f} ms".format(np.mean(delays) * 1000, max(delays) * 1000)
+                    if delays else "{:^27}".format("-"),
+                errors, counted, cpu * 1000))
+            results[name] = errors
+            mean_delays[name] = np.mean(delays) if delays else None
+        if any(errors > results['former'] for errors in results.values()):
+            failed = True
+        if mean_delays['former'] is not None and (mean_delays['iir'] is None
+                or mean_delays['iir'] > mean_delays['former'] + 0.1e-3):
+            failed = True
+    if failed:
+        sys.exit("FAILED: current demodulator worse than former")
+
+
+if __name__ == '__main__':
+    main()
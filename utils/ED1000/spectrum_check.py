@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+ED1000 transmit spectrum check, offline
+
+Compares the spectrum of a transmitted random text from three generators:
+
+- former: per-bit tone tables, each starting at phase 0 (phase jumps at
+  bit boundaries, unless a bit holds a whole number of cycles)
+- per-char: characters rendered with continuous phase inside, but each
+  starting at phase 0 (phase jumps between characters)
+- nco: txFSK.WaveformCache, phase continuous across bits and characters
+  (start phase of each character rounded to txFSK.PHASE_STEPS)
+
+Shown for each, relative to the total signal energy:
+
+- out of band: energy outside send_f0 - 2*baudrate .. send_f1 + 2*baudrate
+- rx band: energy within the receive band-passes (+-txFSK.RECV_BANDWIDTH),
+  where it may cross-talk into the receive path
+
+The script exits with an error if the NCO has more out of band energy than
+the former generator at any baud rate.
+
+How to use (from the piTelex directory):
+
+    python3 utils/ED1000/spectrum_check.py [--baudrate 50 75 100] [--send-f 500 700] [--plot]
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+from scipy import signal
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import txFSK
+from txFSK import sample_f
+from tx_check import LegacyWaves
+
+#######
+
+def former(codes, send_f, baudrate):
+    waves = LegacyWaves(send_f, baudrate)
+    return np.frombuffer(b''.join(waves.wave(b) for b in codes), dtype=np.int16)
+
+
+def per_char(codes, send_f, baudrate):
+    cache = txFSK.WaveformCache(send_f, baudrate)
+    out = []
+    for b in codes:
+        cache.nco.phase = 0
+        out.append(cache.code(b))
+    return np.concatenate(out)
+
+
+def nco(codes, send_f, baudrate):
+    cache = txFSK.WaveformCache(send_f, baudrate)
+    return np.concatenate([cache.code(b) for b in codes])
+
+
+def band_energy(f, psd, bands):
+    """Return part of total energy in bands [(low, high), ...]."""
+    inside = np.zeros(len(f), dtype=bool)
+    for low, high in bands:
+        inside |= (f >= low) & (f <= high)
+    return psd[inside].sum() / psd.sum()
+
+
+def db(x):
+    return 10 * np.log10(max(x, 1e-30))
+
+# =====
+
+def main():
+    parser = argparse.ArgumentParser(description="ED1000 transmit spectrum check")
+    parser.add_argument('--baudrate', type=float, nargs='+', default=[50, 75, 100])
+    parser.add_argument('--send-f', type=float, nargs=2, default=[500, 700], metavar=('F0', 'F1'))
+    parser.add_argument('--recv-f', type=float, nargs=2, default=[2250, 3150], metavar=('F0', 'F1'))
+    parser.add_argument('--chars', type=int, default=500)
+    parser.add_argument('--plot', action='store_true', help="plot spectra (needs matplotlib)")
+    args = parser.parse_args()
+    send_f = args.send_f + [(args.send_f[0] + args.send_f[1]) / 2]
+    codes = np.random.default_rng(1).integers(0, 32, args.chars)
+
+    failed = False
+    for baudrate in args.baudrate:
+        print("{} characters at {} Bd, {} Hz/{} Hz".format(args.chars, baudrate, *args.send_f))
+        in_band = [(args.send_f[0] - 2 * baudrate, args.send_f[1] + 2 * baudrate)]
+        w = 1 + txFSK.RECV_BANDWIDTH
+        rx_band = [(f / w, f * w) for f in args.recv_f]
+        results = {}
+        for name, generator in (('former', former), ('per-char', per_char), ('nco', nco)):
+            samples = generator(codes, send_f, baudrate).astype(np.float64)
+            f, psd = signal.welch(samples, fs=sample_f, nperseg=8192)
+            results[name] = oob = 1 - band_energy(f, psd, in_band)
+            print("  {:9} out of band {:7.1f} dB   rx band {:7.1f} dB".format(
+                name, db(oob), db(band_energy(f, psd, rx_band))))
+            if args.plot:
+                import matplotlib.pyplot as plt
+                plt.semilogy(f, psd, label="{} {} Bd".format(name, baudrate))
+        if db(results['nco']) > db(results['former']) + 0.5:
+            failed = True
+
+    if args.plot:
+        import matplotlib.pyplot as plt
+        plt.xlim(0, 5000)
+        plt.xlabel('Frequency (Hz)')
+        plt.legend()
+        plt.show()
+    if failed:
+        sys.exit("FAILED: NCO has more out of band energy than former generator")
+
+
+if __name__ == '__main__':
+    main()
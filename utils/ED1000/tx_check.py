@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+ED1000 transmit check, offline
+
+Checks the transmit waveforms of the ED1000 module (txFSK.WaveformCache) and
+their way to the audio output (txFSK.SampleRing), without sound card:
+
+- time to get the waveform of a character: former (built from per-bit
+  tables for each character, see LegacyWaves) and current (rendered by the
+  NCO on first use per start phase, then from the cache)
+- difference of the waveforms, where the former ones are phase continuous
+  too (whole number of cycles per bit, like 500/700 Hz at 50 Bd)
+- a text sent through the ring buffer by a writer thread, read by a
+  simulated audio callback: the output must be the characters back to back,
+  without gaps or underruns, and decode to the text again (demodulator and
+  SoftUART set to the send frequencies)
+- underruns: counted if the ring runs dry while the writer is active, not
+  at the end of output (after flush)
+
+How to use (from the piTelex directory):
+
+    python3 utils/ED1000/tx_check.py [--baudrate 50] [--send-f 500 700]
+"""
+
+import argparse
+import math
+import os
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'i-Telex'))
+
+import txCode
+import txFSK
+from txFSK import sample_f
+from checklib import check, finish
+
+TEXT = "RYRY THE QUICK BROWN FOX JUMPS OVER THE LAZY DOG 0123456789 "
+
+#######
+
+class LegacyWaves:
+    """Former waveform generation of TelexED1000SC.thread_tx."""
+    def __init__(self, send_f, baudrate):
+        self.Fpb = int(sample_f / baudrate + 0.5)
+        self.Fpw = int(self.Fpb * 7.5 + 0.5)
+        self.waves = []
+        for i in range(3):
+            samples = []
+            for n in range(self.Fpb):
+                t = n / sample_f
+                s = math.sin(t * 2 * math.pi * send_f[i])
+                samples.append(int(s*32000))
+            self.waves.append(struct.pack('%sh' % self.Fpb, *samples))
+
+    def wave(self, b):
+        mask = 1
+        wavecomp = bytearray()
+        for i in range(5):
+            bit = 1 if (b & mask) else 0
+            mask <<= 1
+            wavecomp.extend(self.waves[bit])
+        wavecomp[0:0] = self.waves[0]
+        wavecomp.extend(self.waves[1])
+        wavecomp.extend(self.waves[1])
+        return bytes(wavecomp[:self.Fpw * 2])
+
+
+def send(cache, codes, block):
+    """
+    Write codes to a ring buffer from a thread, read it in blocks like the
+    audio callback. Return (output, underruns).
+    """
+    ring = txFSK.SampleRing(cache.Fpw + cache.Fpb)
+    def writer():
+        for b in codes:
+            ring.write(cache.code(b))
+            time.sleep(0.0005)   # some Python work in between
+        ring.close()
+    thread = threading.Thread(target=writer)
+    thread.start()
+    total = len(codes) * cache.Fpw
+    out = []
+    n = 0
+    # Start reading when the first character is there
+    while len(ring) < min(cache.Fpw, total):
+        time.sleep(0.001)
+    while n < total:
+        chunk = ring.read(min(block, total - n))
+        out.append(chunk)
+        n += len(chunk)
+        # Audio hardware takes block / sample_f s per block; be 20x faster
+        time.sleep(block / sample_f / 20)
+    thread.join()
+    return np.concatenate(out), ring.underruns
+
+
+def decode(samples, send_f, baudrate):
+    demod = txFSK.IIRDemodulator(send_f[:2], baudrate)
+    uart = txFSK.SoftUART(baudrate)
+    # Idle Z before and after
+    cache = txFSK.WaveformCache(send_f, baudrate)
+    idle = np.concatenate([cache.idle(1) for _ in range(10)])
+    energy = demod.process(np.concatenate((idle, samples, idle)))
+    return [code for code, _ in uart.process(energy[1] - energy[0])]
+
+# =====
+
+def main():
+    parser = argparse.ArgumentParser(description="ED1000 transmit check")
+    parser.add_argument('--baudrate', type=float, default=50)
+    parser.add_argument('--send-f', type=float, nargs=2, default=[500, 700], metavar=('F0', 'F1'))
+    args = parser.parse_args()
+    send_f = args.send_f + [(args.send_f[0] + args.send_f[1]) / 2]
+
+    mc = txCode.BaudotMurrayCode(False, False, True)
+    codes = list(mc.encodeA2BM(TEXT * 4))
+
+    # Time per character
+    t = time.perf_counter()
+    legacy = LegacyWaves(send_f, args.baudrate)
+    t_init_legacy = time.perf_counter() - t
+    t = time.perf_counter()
+    cache = txFSK.WaveformCache(send_f, args.baudrate)
+    t_init = time.perf_counter() - t
+
+    t = time.perf_counter()
+    for b in codes:
+        legacy.wave(b)
+    t_legacy = (time.perf_counter() - t) / len(codes)
+    t = time.perf_counter()
+    for b in codes:
+        cache.code(b)
+    t_first = (time.perf_counter() - t) / len(codes)
+    # All start phases rendered
+    for step in range(txFSK.PHASE_STEPS):
+        for b in range(32):
+            cache.nco.phase = step * 2 * math.pi / txFSK.PHASE_STEPS
+            cache.code(b)
+    t = time.perf_counter()
+    for b in codes:
+        cache.code(b)
+    t_cache = (time.perf_counter() - t) / len(codes)
+    print("former:  init {:6.1f} ms, {:6.1f} us per character".format(t_init_legacy * 1000, t_legacy * 1e6))
+    print("current: init {:6.1f} ms, {:6.1f} us per character ({:.1f} us including first use)".format(
+        t_init * 1000, t_cache * 1e6, t_first * 1e6))
+
+    # Same waveforms where the former ones are continuous
+    continuous = all(abs(cache.Fpb * f / sample_f - round(cache.Fpb * f / sample_f)) < 1e-9 for f in send_f[:2])
+    if continuous:
+        diff = 0
+        for b in range(32):
+            cache.nco.phase = 0
+            diff = max(diff, int(np.max(np.abs(np.frombuffer(legacy.wave(b), dtype=np.int16).astype(int)
+                - cache.code(b).astype(int)))))
+        check("waveforms as before (max. difference {})".format(diff), diff <= 1)
+    else:
+        print("(former waveforms have phase jumps at {} Bd, not compared)".format(args.baudrate))
+    check("character length 7.5 bits", all(len(cache.code(b)) == cache.Fpw for b in range(32)))
+
+    # Through the ring buffer
+    out, underruns = send(txFSK.WaveformCache(send_f, args.baudrate), codes, cache.Fpb // 4)
+    cache = txFSK.WaveformCache(send_f, args.baudrate)
+    expected = np.concatenate([cache.code(b) for b in codes])
+    check("output back to back, no gaps", np.array_equal(out, expected))
+    check("no underruns", underruns == 0)
+    check("decodes to the text sent", decode(out, send_f, args.baudrate) == codes)
+
+    # Underruns
+    ring = txFSK.SampleRing(cache.Fpw + cache.Fpb)
+    ring.write(cache.code(0))
+    ring.read(cache.Fpw + 10)
+    check("underrun counted while writing", ring.underruns == 1)
+    ring.write(cache.code(0))
+    ring.flush()
+    ring.read(cache.Fpw + 10)
+    ring.read(10)
+    check("no underrun at the end of output", ring.underruns == 1)
+
+    finish()
+
+
+if __name__ == '__main__':
+    main()
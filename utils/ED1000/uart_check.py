@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+ED1000 character recognition check, offline
+
+Receives a synthesized test signal (see demod_check.py) of random characters
+with 1.5 stop bits and random pauses, like a teleprinter sends them, in
+audio blocks of a quarter bit, like the rx thread does. Compared are:
+
+- former: block decisions of the former demodulator, characters found by
+  counting blocks ("recv_uart": false, with the former demodulator)
+- uart-iir, uart-dft: txFSK.SoftUART on the soft bits of the current
+  demodulators ("recv_uart": true)
+
+Shown per baud rate: characters received right, wrong (mis-framed or bit
+errors), missed and extra, and the jitter of the start times found.
+
+How to use (from the piTelex directory):
+
+    python3 utils/ED1000/uart_check.py [--baudrate 50 75 100] [--snr DB] [--chars N]
+
+The script exits with an error if a SoftUART receives fewer characters
+right than the former method at any baud rate.
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import txFSK
+from txFSK import sample_f
+from demod_check import synthesize, LegacyDemodulator
+
+#######
+
+def legacy_receive(samples, recv_f, baudrate, squelch):
+    """
+    Former character recognition of TelexED1000SC.thread_rx: one decision
+    per slice (quarter bit), start bit found by counting slices. Return
+    [(code, time), ...].
+    """
+    demod = LegacyDemodulator(recv_f)
+    FpS = int(sample_f / baudrate / 4 + 0.5)
+    result = []
+    slice_counter = 0
+    symbol = 0
+    for k in range(len(samples) // FpS):
+        bit = demod.decide(samples[k*FpS:(k+1)*FpS], squelch)
+        if slice_counter == 0:
+            if not bit:   # found start step
+                symbol = 0
+                slice_counter = 1
+                start = k * FpS / sample_f
+        else:
+            if slice_counter in (1, 2):   # middle of start step
+                if bit:
+                    slice_counter = -1
+            for n in range(5):
+                if slice_counter == 6 + 4 * n and bit:
+                    symbol |= 1 << n
+            if slice_counter == 26:   # middle of stop step
+                if not bit:
+                    slice_counter = -5   # wrong stop bit!
+            if slice_counter >= 28:   # end of stop step
+                slice_counter = 0
+                result.append((symbol, start))
+                continue
+            slice_counter += 1
+    return result
+
+
+def uart_receive(samples, recv_f, baudrate, squelch, detector):
+    """Current character recognition: SoftUART. Return [(code, time), ...]."""
+    demod = txFSK.DEMODULATORS[detector](recv_f, baudrate)
+    uart = txFSK.SoftUART(baudrate)
+    FpS = int(sample_f / baudrate / 4 + 0.5)
+    result = []
+    for k in range(len(samples) // FpS):
+        energy = demod.process(samples[k*FpS:(k+1)*FpS])
+        result += uart.process(energy[1] - energy[0], energy.sum(axis=0) >= squelch)
+    return result
+
+
+def compare(received, frames, baudrate):
+    """
+    Match received characters to those sent by time. Return (right, wrong,
+    missed, extra, jitter in s).
+    """
+    if not received:
+        return 0, 0, len(frames), 0, 0
+    starts = np.array([f[0] for f in frames]) / sample_f
+    times = np.array([t for _, t in received])
+    # Constant delay of the receiver
+    nearest = np.abs(times[:, None] - starts[None, :]).argmin(axis=1)
+    delay = np.median(times - starts[nearest])
+
+    right = wrong = 0
+    offsets = []
+    matched = set()
+    for (code, t) in received:
+        k = np.abs(starts + delay - t).argmin()
+        if abs(starts[k] + delay - t) < 0.5 / baudrate and k not in matched:
+            matched.add(k)
+            offsets.append(t - starts[k] - delay)
+            if code == frames[k][1]:
+                right += 1
+            else:
+                wrong += 1
+    extra = len(received) - right - wrong
+    missed = len(frames) - len(matched)
+    return right, wrong, missed, extra, float(np.std(offsets)) if offsets else 0
+
+# =====
+
+def main():
+    parser = argparse.ArgumentParser(description="ED1000 character recognition check")
+    parser.add_argument('--baudrate', type=float, nargs='+', default=[50, 75, 100])
+    parser.add_argument('--recv-f', type=float, nargs=2, default=[2250, 3150], metavar=('F0', 'F1'))
+    parser.add_argument('--chars', type=int, default=300)
+    parser.add_argument('--snr', type=float, help="add noise, dB")
+    parser.add_argument('--squelch', type=int, default=100)
+    parser.add_argument('--gap', type=float, default=1.0, help="random pause after characters, up to bits")
+    args = parser.parse_args()
+
+    failed = False
+    for baudrate in args.baudrate:
+        samples, levels, frames = synthesize(args.recv_f, baudrate, args.chars, args.snr,
+            stop_bits=1.5, gap=args.gap)
+        print("{} characters at {} Bd, SNR {}".format(args.chars, baudrate,
+            "{} dB".format(args.snr) if args.snr is not None else "-"))
+        methods = [('former', lambda: legacy_receive(samples, args.recv_f, baudrate, args.squelch))]
+        methods += [('uart-' + d, lambda d=d: uart_receive(samples, args.recv_f, baudrate, args.squelch, d))
+            for d in txFSK.DEMODULATORS]
+        results = {}
+        for name, receive in methods:
+            right, wrong, missed, extra, jitter = compare(receive(), frames, baudrate)
+            results[name] = right
+            print("  {:9} right {:4}  wrong {:4}  missed {:4}  extra {:4}  start jitter {:5.2f} ms".format(
+                name, right, wrong, missed, extra, jitter * 1000))
+        if any(right < results['former'] for right in results.values()):
+            failed = True
+    if failed:
+        sys.exit("FAILED: SoftUART worse than former method")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Load generator and throughput benchmark of the inbound i-Telex path
+
+N i-Telex server modules (TelexITelexSrv, one per session, on consecutive
+ports) receive text from N simulated remote stations at once. The text goes
+the whole way a received telex goes: socket -> process_connection ->
+_rx_buffer -> telex.process_data -> teleprinter. The teleprinter is a null
+device (one per session) which only notes when each character arrived, so
+this runs headless anywhere.
+
+The remotes run in a separate process, so that the CPU usage shown is that
+of piTelex alone. They send Baudot Data packets (--mode baudot, default) or
+plain ASCII (--mode ascii), as fast as possible or at --rate characters per
+second per session, without waiting for Acknowledge, so a backlog builds up
+if piTelex can't keep up.
+
+Shown:
+- throughput: characters per second, all sessions together
+- latency: time from a character being sent by the remote to it reaching
+  the teleprinter, percentiles over all characters
+- backlog: most characters waiting in any module's rx buffer
+- CPU: piTelex process time (user + system) during the run, in % of one
+  core
+
+How to use (from the piTelex directory):
+
+    python3 utils/benchmark/itelex_load.py [-s SESSIONS] [-n CHARS] [--mode ascii] [--rate CPS]
+
+e.g. 20 sessions like real 50 Bd teleprinters (6.67 characters/s):
+
+    python3 utils/benchmark/itelex_load.py -s 20 -n 200 --rate 6.67
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import resource
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import txBase
+import txCode
+import txDevITelexSrv
+from txDevITelexCommon import ST
+import telex
+
+TEXT = "THE QUICK BROWN FOX JUMPS OVER THE LAZY DOG "
+
+#######
+
+class NullPrinter(txBase.TelexBase):
+    """
+    Teleprinter of one session: notes the arrival time of all data, answers
+    the session's printer start and welcome banner requests as MCP would
+    """
+    def __init__(self, srv):
+        super().__init__()
+        self.id = 'Prn'
+        self.srv = srv
+        self.count = 0
+        # (count after batch, time) of every batch written
+        self.batches = []
+
+    def write_batch(self, items:list, source:str) -> list:
+        if len(items[0]) == 1:
+            self.count += len(items)
+            self.batches.append((self.count, time.monotonic()))
+        elif items[0] == '\x1bA':
+            self.srv.write('\x1bAA', 'MCP')   # printer started
+        elif items[0] == '\x1bI':
+            self.srv.write('\x1bWELCOME', 'MCP')   # no banner
+        return items
+
+
+class MainLoop(threading.Thread):
+    """The main loop of telex.py, without timers"""
+    def __init__(self):
+        super().__init__(name='MainLoop', daemon=True)
+        self.running = True
+
+    def run(self):
+        while self.running:
+            txBase.data_ready.clear()
+            if not telex.process_data():
+                txBase.data_ready.wait(0.05)
+
+# =====
+
+def peer_process(ports, mode, n, chunk, rate, conn):
+    """
+    Remote stations, one thread per session. Reports 'ready' when all are
+    connected and have asked for the printer, waits for 'go', then sends and
+    reports each session's (time, characters sent so far) per packet. Hangs
+    up on 'end'.
+    """
+    text = (TEXT * (n // len(TEXT) + 1))[:n]
+    if mode == 'baudot':
+        # Same coding as i-Telex (see connection_steps). Letters only, so
+        # each code is one character; the initial LTRS arrives as one, too.
+        codes = txCode.BaudotMurrayCode(False, False, True).encodeA2BM(text)
+        packets = [(bytes([2, len(codes[i:i+chunk])]) + codes[i:i+chunk], min(len(codes), i + chunk))
+            for i in range(0, len(codes), chunk)]
+    else:
+        packets = [(text[i:i+chunk].encode('ASCII'), min(n, i + chunk))
+            for i in range(0, n, chunk)]
+    socks = []
+    for port in ports:
+        s = socket.create_connection(('127.0.0.1', port))
+        if mode == 'baudot':
+            s.sendall(bytes([7, 1, 1]))    # Version 1
+            s.sendall(bytes([1, 1, 0]))    # Direct Dial 0
+        else:
+            s.sendall(b'\r')    # first character starts the printer
+        socks.append(s)
+    conn.send('ready')
+    conn.recv()   # go
+
+    results = [None] * len(socks)
+    def send(i, s):
+        sent = []
+        s.setblocking(False)
+        t0 = time.monotonic()
+        start = 0
+        for data, upto in packets:
+            if rate:
+                delay = t0 + start / rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            s.setblocking(True)
+            s.sendall(data)
+            s.setblocking(False)
+            sent.append((time.monotonic(), upto))
+            start = upto
+            try:
+                while s.recv(4096):   # Acknowledge etc., not needed
+                    pass
+            except BlockingIOError:
+                pass
+        results[i] = sent
+
+    threads = [threading.Thread(target=send, args=(i, s)) for i, s in enumerate(socks)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    conn.send(results)
+    conn.recv()   # end
+    for s in socks:
+        s.setblocking(True)
+        if mode == 'baudot':
+            s.sendall(bytes([3, 0]))    # End
+        s.close()
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def latencies(sent, batches, offset):
+    """Latency of every character of one session, in s."""
+    result = []
+    b = 0
+    for i in range(len(sent)):
+        t_sent, upto = sent[i]
+        start = sent[i-1][1] if i else 0
+        for k in range(start, upto):
+            while b < len(batches) and batches[b][0] - offset <= k:
+                b += 1
+            if b == len(batches):
+                return result
+            result.append(batches[b][1] - t_sent)
+    return result
+
+# =====
+
+def main():
+    parser = argparse.ArgumentParser(description="i-Telex load generator and throughput benchmark")
+    parser.add_argument('-s', type=int, default=4, help="number of parallel sessions")
+    parser.add_argument('-n', type=int, default=5000, help="characters per session")
+    parser.add_argument('--mode', choices=['baudot', 'ascii'], default='baudot')
+    parser.add_argument('--rate', type=float, default=0, help="characters/s per session (0: as fast as possible)")
+    parser.add_argument('--chunk', type=int, default=50, help="characters per packet (Baudot: 1..50)")
+    parser.add_argument('--port', type=int, default=23420, help="first local port")
+    parser.add_argument('--asyncio', action='store_true', help="server modules in asyncio mode")
+    parser.add_argument('--timeout', type=float, default=120, help="s")
+    args = parser.parse_args()
+
+    logging.getLogger().addHandler(logging.NullHandler())
+    logging.getLogger("piTelex").setLevel(logging.WARNING)
+
+    # Characters arriving per session (Baudot: plus LTRS)
+    n = args.n + 1 if args.mode == 'baudot' else args.n
+
+    ports = [args.port + i for i in range(args.s)]
+    srvs = [txDevITelexSrv.TelexITelexSrv(port=port, tns_pin=0, block_ascii=False, asyncio=args.asyncio)
+        for port in ports]
+    printers = [NullPrinter(srv) for srv in srvs]
+
+    # Each session is routed to its own teleprinter only
+    telex.DEVICES[:] = srvs + printers
+    telex.build_routes()
+    routes = {srv: [printer] for srv, printer in zip(srvs, printers)}
+    routes.update({printer: [] for printer in printers})
+    telex.ROUTES_DATA.clear()
+    telex.ROUTES_DATA.update(routes)
+    telex.command_route = lambda in_device, cmd: routes[in_device]
+
+    main_loop = MainLoop()
+    main_loop.start()
+
+    conn, child_conn = multiprocessing.Pipe()
+    peer = multiprocessing.Process(target=peer_process,
+        args=(ports, args.mode, args.n, args.chunk, args.rate, child_conn), daemon=True)
+    peer.start()
+
+    try:
+        # Wait for all connections to be set up
+        if not conn.poll(10) or conn.recv() != 'ready':
+            sys.exit("Remotes couldn't connect")
+        end = time.monotonic() + 10
+        while any(srv._connected < ST.CON_FULL for srv in srvs) and time.monotonic() < end:
+            time.sleep(0.05)
+        if any(srv._connected < ST.CON_FULL for srv in srvs):
+            sys.exit("Connections not set up")
+        time.sleep(0.2)
+        offsets = [printer.count for printer in printers]
+
+        # Run
+        backlog = 0
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        t = time.monotonic()
+        conn.send('go')
+        end = t + args.timeout
+        while time.monotonic() < end:
+            backlog = max(backlog, max(srv._rx_buffer.data_len() for srv in srvs))
+            if all(printer.count - offset >= n for printer, offset in zip(printers, offsets)):
+                break
+            time.sleep(0.01)
+        t = time.monotonic() - t
+        usage2 = resource.getrusage(resource.RUSAGE_SELF)
+        cpu = usage2.ru_utime - usage.ru_utime + usage2.ru_stime - usage.ru_stime
+
+        sent = conn.recv()
+        conn.send('end')
+        peer.join(5)
+    finally:
+        main_loop.running = False
+        for srv in srvs:
+            srv.exit()
+
+    received = sum(printer.count - offset for printer, offset in zip(printers, offsets))
+    lat = []
+    for s, printer, offset in zip(sent, printers, offsets):
+        lat.extend(latencies(s, printer.batches, offset))
+    lat.sort()
+
+    print("{} sessions, {} mode{}, {} chars each{}".format(args.s, args.mode, ", asyncio" if args.asyncio else "",
+        args.n, ", {} chars/s each".format(args.rate) if args.rate else ""))
+    print("received    {} of {} chars in {:.2f} s".format(received, args.s * n, t))
+    print("throughput  {:.0f} chars/s".format(received / t))
+    if lat:
+        print("latency     p50 {:.1f} ms  p90 {:.1f} ms  p99 {:.1f} ms  max {:.1f} ms".format(
+            *(percentile(lat, p) * 1000 for p in (50, 90, 99, 100))))
+    print("backlog     max {} chars (sampled every 10 ms)".format(backlog))
+    print("CPU         {:.2f} s, {:.0f}% of one core".format(cpu, cpu / t * 100))
+    if received != args.s * n:
+        sys.exit("FAILED: {} characters expected".format(args.s * n))
+
+
+if __name__ == '__main__':
+    main()
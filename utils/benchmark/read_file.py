@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Benchmark of a long text (e.g. a file read by MCP's read_file) passing from
+one device's read buffer through the main loop into a teleprinter's write
+buffer, and out of that buffer character by character, as the teleprinter's
+thread does it.
+
+This is done twice:
+
+- legacy: list buffers, one read() per character and pop(0) at the front of
+  the lists, as before txBuffer
+- current: txBuffer.Buffer (deque) on both sides, read_batch/write_batch in
+  the main loop and popleft() in the teleprinter thread
+
+How to use (from the piTelex directory):
+
+    python3 utils/benchmark/read_file.py [-k KBYTES] [-r REPEAT]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import txBase
+import txBuffer
+import telex
+
+#######
+
+class LegacyReader(txBase.TelexBase):
+    """Device holding the text, list buffer"""
+    def __init__(self):
+        super().__init__()
+        self.id = 'MCP'
+        self._rx_buffer = []
+
+    def read(self) -> str:
+        if self._rx_buffer:
+            return self._rx_buffer.pop(0)
+
+    def read_batch(self) -> list:
+        a = self.read()
+        return [a] if a else []
+
+
+class LegacyPrinter(txBase.TelexBase):
+    """Teleprinter queueing what it's written, list buffer"""
+    def __init__(self):
+        super().__init__()
+        self.id = 'Prn'
+        self._tx_buffer = []
+
+    def write(self, a:str, source:str):
+        self._tx_buffer.append(a)
+
+    def print_all(self) -> int:
+        n = 0
+        while self._tx_buffer:
+            self._tx_buffer.pop(0)
+            n += 1
+        return n
+
+
+class Reader(LegacyReader):
+    """Device holding the text, txBuffer.Buffer"""
+    def __init__(self):
+        super().__init__()
+        self._rx_buffer = txBuffer.Buffer()
+
+    def read(self) -> str:
+        if self._rx_buffer:
+            return self._rx_buffer.popleft()
+
+    def read_batch(self) -> list:
+        return self._rx_buffer.pop_batch()
+
+
+class Printer(LegacyPrinter):
+    """Teleprinter queueing what it's written, txBuffer.Buffer"""
+    def __init__(self):
+        super().__init__()
+        self._tx_buffer = txBuffer.Buffer()
+
+    def write_batch(self, items:list, source:str) -> list:
+        self._tx_buffer.extend(items)
+        return items
+
+    def print_all(self) -> int:
+        n = 0
+        popleft = self._tx_buffer.popleft
+        while self._tx_buffer:
+            popleft()
+            n += 1
+        return n
+
+# =====
+
+def run(name, reader_cls, printer_cls, text, repeat):
+    best = None
+    for _ in range(repeat):
+        reader = reader_cls()
+        printer = printer_cls()
+        telex.DEVICES[:] = [reader, printer]
+        telex.build_routes()
+
+        t = time.perf_counter()
+        reader._rx_buffer.extend(text)
+        while telex.process_data():
+            pass
+        n = printer.print_all()
+        t = time.perf_counter() - t
+
+        if n != len(text):
+            sys.exit("{}: {} of {} characters printed".format(name, n, len(text)))
+        best = t if best is None else min(best, t)
+    print("{:8} {:8.1f} ms  {:6.2f} us/char".format(name, best * 1000, best * 1e6 / len(text)))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark read_file to teleprinter")
+    parser.add_argument('-k', type=int, default=50, help="text size in kB")
+    parser.add_argument('-r', type=int, default=3, help="repetitions (best is shown)")
+    args = parser.parse_args()
+
+    logging.getLogger().addHandler(logging.NullHandler())
+    logging.getLogger("piTelex").setLevel(logging.INFO)
+
+    line = "RYRY THE QUICK BROWN FOX JUMPS OVER THE LAZY DOG 0123456789\r\n"
+    text = (line * (args.k * 1024 // len(line) + 1))[:args.k * 1024]
+
+    legacy = run('legacy', LegacyReader, LegacyPrinter, text, args.r)
+    current = run('current', Reader, Printer, text, args.r)
+    print("speedup  {:.1f}x".format(legacy / current))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the per-character routing cost in the telex.py main loop
+
+A message of N characters is read from one device and routed to a set of
+dummy devices resembling a typical configuration (screen, teleprinter, MCP,
+archive, i-Telex server, plus some devices not interested in data at all).
+This is done twice:
+
+- legacy: the former process_data, one read() and one write() per character
+  and device, debug messages formatted even if they're thrown away
+- current: telex.process_data with batches, routing table and lazy logging
+
+How to use (from the piTelex directory):
+
+    python3 utils/benchmark/routing.py [-n CHARS] [-r REPEAT] [--debug]
+
+--debug sets the log level to DEBUG (output goes to a null handler), to see
+the cost of actually emitted debug messages.
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import txBase
+import telex
+
+l = logging.getLogger("piTelex.telex")
+
+#######
+
+class Source(txBase.TelexBase):
+    """Device producing the message"""
+    def __init__(self, id):
+        super().__init__()
+        self.id = id
+        self._rx_buffer = []
+
+    def read(self) -> str:
+        if self._rx_buffer:
+            return self._rx_buffer.pop(0)
+
+    def read_batch(self) -> list:
+        return txBase.pop_batch(self._rx_buffer)
+
+
+class Sink(txBase.TelexBase):
+    """Device counting what it's written"""
+    def __init__(self, id, data=True, commands=None, ignore=()):
+        super().__init__()
+        self.id = id
+        self.consumes_data = data
+        self.consumes_commands = commands
+        self.ignores_data_from = ignore
+        self.count = 0
+
+    def write(self, a:str, source:str):
+        if len(a) != 1:
+            return
+        if not self.consumes_data or source in self.ignores_data_from:
+            return
+        self.count += 1
+
+
+def make_devices():
+    return [
+        Sink('News', data=False, commands=('\x1bA', '\x1bZ', '\x1bWB')),
+        Sink('REST', data=False, commands=('\x1bZ',)),
+        Sink('Log'),
+        Sink('MCP'),
+        Source('iTs'),
+        Sink('Scrn'),
+        Sink('ED1000'),
+        Sink('Arch', ignore=('Baf',)),
+        Sink('Cmd', data=False),
+        Sink('RSS', data=False, commands=()),
+    ]
+
+# =====
+
+def legacy_process_data(devices):
+    """process_data as it was before batching and routing table"""
+    new_data = False
+    for in_device in devices:
+        try:
+            c = in_device.read()
+        except Exception as e:
+            l.warning("Uncaught Exception in {}.read(): {!r}".format(in_device.id, e))
+        if c:
+            new_data = True
+            l.debug("read {!r} from {!r}".format(c, in_device))
+            for out_device in devices:
+                if out_device != in_device:
+                    l.debug("writing {!r} to {!r}".format(c, out_device))
+                    try:
+                        ret = out_device.write(c, in_device.id)
+                    except Exception as e:
+                        l.warning("Uncaught Exception in {}.write({!r}), {!r}: {!r}".format(out_device.id, c, in_device.id, e))
+                    if ret:
+                        l.debug("writing returned {!r}".format(ret))
+                        break
+    return new_data
+
+
+def current_process_data(devices):
+    telex.DEVICES[:] = devices
+    telex.build_routes()
+    return telex.process_data
+
+
+def run(name, devices, process, msg, repeat):
+    best = None
+    for _ in range(repeat):
+        devices[4]._rx_buffer.extend(msg)
+        t = time.perf_counter()
+        while process(devices) if name == 'legacy' else process():
+            pass
+        t = time.perf_counter() - t
+        best = t if best is None else min(best, t)
+    check = sum(d.count for d in devices if isinstance(d, Sink)) // repeat
+    print("{:8} {:8.1f} ms  {:6.2f} us/char  ({} chars delivered)".format(
+        name, best * 1000, best * 1e6 / len(msg), check))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark main loop routing")
+    parser.add_argument('-n', type=int, default=20000, help="message length")
+    parser.add_argument('-r', type=int, default=5, help="repetitions (best is shown)")
+    parser.add_argument('--debug', action='store_true', help="log level DEBUG")
+    args = parser.parse_args()
+
+    logging.getLogger().addHandler(logging.NullHandler())
+    logging.getLogger("piTelex").setLevel(logging.DEBUG if args.debug else logging.INFO)
+
+    msg = ['\x1bA'] + list("RYRY THE QUICK BROWN FOX JUMPS OVER THE LAZY DOG 0123456789\r\n" * (args.n // 60 + 1))[:args.n] + ['\x1bZ']
+
+    legacy = run('legacy', make_devices(), legacy_process_data, msg, args.r)
+    devices = make_devices()
+    current = run('current', devices, current_process_data(devices), msg, args.r)
+    print("speedup  {:.1f}x".format(legacy / current))
+
+
+if __name__ == '__main__':
+    main()
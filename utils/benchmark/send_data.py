@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the i-Telex send path: a long text in the transmit buffer is
+sent in portions as the flow control allows (send_data_baudot), or all at
+once on ASCII connections (send_data_ascii), to a socket which only counts.
+
+Compared are copies of the former methods (one pop and encodeA2BM call per
+character, one packet per call, str +=) and the current ones (one encoding
+call per portion, all packets assembled in one buffer, one sendall). The
+script exits with an error if the Baudot codes or ASCII bytes sent differ.
+
+Up to the packet size of 40 codes, a portion is one packet either way, so
+the number of sendall calls only drops with windows beyond that
+(--window 200).
+
+How to use (from the piTelex directory):
+
+    python3 utils/benchmark/send_data.py [-k KBYTES] [--window CHARS]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import txCode
+import txITelexFlow
+import txITelexPacket
+from txDevITelexCommon import TelexITelexCommon
+
+#######
+
+class CountingSocket:
+    def __init__(self):
+        self.calls = 0
+        self.data = bytearray()
+
+    def sendall(self, data):
+        self.calls += 1
+        self.data += data
+
+
+def legacy_send_data_ascii(self, s):
+    a = ''
+    while self._tx_buffer and len(a) < 250:
+        b = self._tx_buffer.popleft()
+        if b not in '<>°%':
+            a += b
+    data = a.encode('ASCII')
+    s.sendall(data)
+    return len(data)
+
+
+def legacy_send_data_baudot(self, s, bmc, limit:int=40):
+    limit = min(limit, 40) + 2
+    data = bytearray([2, 0])
+    while self._tx_buffer and len(data) < limit:
+        a = self._tx_buffer.popleft()
+        bb = bmc.encodeA2BM(a)
+        if bb:
+            for b in bb:
+                data.append(b)
+    length = len(data) - 2
+    data[1] = length
+    s.sendall(data)
+    return length
+
+# =====
+
+def run_baudot(name, send, text, window):
+    dev = TelexITelexCommon()
+    dev._tx_buffer.extend(text)
+    bmc = txCode.BaudotMurrayCode(False, False, True)
+    s = CountingSocket()
+    t = time.perf_counter()
+    while dev._tx_buffer:
+        send(dev, s, bmc, window)
+    t = time.perf_counter() - t
+
+    codes = bytearray()
+    for packet in txITelexPacket.PacketDecoder().feed(bytes(s.data)):
+        codes += packet.payload
+    print("{:8} baudot {:8.1f} ms  {:6.2f} us/char  {:6d} sendall".format(name, t * 1000, t * 1e6 / len(text), s.calls))
+    return t, codes
+
+
+def run_ascii(name, send, text):
+    dev = TelexITelexCommon()
+    dev._tx_buffer.extend(text)
+    s = CountingSocket()
+    t = time.perf_counter()
+    while dev._tx_buffer:
+        send(dev, s)
+    t = time.perf_counter() - t
+    print("{:8} ascii  {:8.1f} ms  {:6.2f} us/char  {:6d} sendall".format(name, t * 1000, t * 1e6 / len(text), s.calls))
+    return t, bytes(s.data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark i-Telex send path")
+    parser.add_argument('-k', type=int, default=50, help="text size in kB")
+    parser.add_argument('--window', type=int, default=txITelexFlow.SEND_WINDOW,
+        help="characters allowed per send (flow control, default: send window)")
+    args = parser.parse_args()
+
+    logging.getLogger().addHandler(logging.NullHandler())
+    logging.getLogger("piTelex").setLevel(logging.WARNING)
+
+    line = "RYRY THE QUICK BROWN FOX JUMPS OVER THE LAZY DOG 0123456789\r\n"
+    text = (line * (args.k * 1024 // len(line) + 1))[:args.k * 1024]
+
+    legacy, legacy_codes = run_baudot('legacy', legacy_send_data_baudot, text, args.window)
+    current, codes = run_baudot('current', TelexITelexCommon.send_data_baudot, text, args.window)
+    if codes != legacy_codes:
+        sys.exit("Baudot codes sent differ")
+    print("speedup  baudot {:.1f}x".format(legacy / current))
+
+    legacy, legacy_data = run_ascii('legacy', legacy_send_data_ascii, text)
+    current, data = run_ascii('current', TelexITelexCommon.send_data_ascii, text)
+    if data != legacy_data:
+        sys.exit("ASCII data sent differs")
+    print("speedup  ascii  {:.1f}x".format(legacy / current))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of txCode.BaudotMurrayCode
+
+Compares encodeA2BM/decodeBM2A, do_flip_bits, the bulk variants
+encode_many/decode_many and ascii_to_tty_text with a copy of the former implementation (LUT string
+search per character, string concatenation, bit flipping per bit) and checks
+that both produce identical output for all codings, with and without bit
+flipping.
+
+How to use (from the piTelex directory):
+
+    python3 utils/benchmark/txcode.py [-n CHARS] [-r REPEAT]
+"""
+
+import argparse
+import os
+import sys
+import time
+import unicodedata
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import txCode
+
+#######
+
+class LegacyBaudotMurrayCode(txCode.BaudotMurrayCode):
+    """Reference copy of the former encoder/decoder"""
+
+    @staticmethod
+    def ascii_to_tty_text(text:str) -> str:
+        ret = ''
+
+        text = text.upper()
+
+        for a in text:
+            try:
+                if a not in txCode.BaudotMurrayCode._valid_ASCII_convert_chars:
+                    if a in txCode.BaudotMurrayCode._LUT_convert_chars:
+                        a = txCode.BaudotMurrayCode._LUT_convert_chars.get(a, '?')
+                    else:
+                        nkfd_norm = unicodedata.normalize('NFKD', a)
+                        a =  u"".join([c for c in nkfd_norm if not unicodedata.combining(c)])
+                        if a not in txCode.BaudotMurrayCode._valid_ASCII_convert_chars:
+                            a = '?'
+                ret += a
+            except:
+                pass
+
+        return ret
+
+    @staticmethod
+    def do_flip_bits(code: bytes) -> bytes:
+        ret = bytearray()
+
+        for b in code:
+            rb = 0
+            if b & 1:
+                rb |= 16
+            if b & 2:
+                rb |= 8
+            if b & 4:
+                rb |= 4
+            if b & 8:
+                rb |= 2
+            if b & 16:
+                rb |= 1
+            ret.append(rb)
+
+        return ret
+
+    def encodeA2BM(self, ascii:str) -> bytes:
+        ret = bytearray()
+
+        if not isinstance(ascii, str):
+            ascii = str(ascii)
+
+        ascii = ascii.upper()
+
+        if self._mode is None:
+            self._mode = 0  # letters
+            ret.append(self._LUT_BMsw[self._mode])
+
+        for a in ascii:
+            try:  # symbol in current layer?
+                nm = self._mode
+                b = self._LUT_BM2A[nm].index(a)
+                ret.append(b)
+                if b in self._LUT_BMsw:  # explicit Bu or Zi
+                    self._mode = self._LUT_BMsw.index(b)
+            except ValueError:
+                try:  # symbol in other layer?
+                    nm += 1
+                    if nm >= len(self._LUT_BM2A):
+                        nm = 0
+                    b = self._LUT_BM2A[nm].index(a)
+                    ret.append(self._LUT_BMsw[nm])
+                    ret.append(b)
+                    self._mode = nm
+                except ValueError:
+                    try:  # symbol in other layer?
+                        nm += 1
+                        if nm >= len(self._LUT_BM2A):
+                            nm = 0
+                        b = self._LUT_BM2A[nm].index(a)
+                        ret.append(self._LUT_BMsw[nm])
+                        ret.append(b)
+                        self._mode = nm
+                    except:  # symbol not found -> ignore
+                        pass
+            except:  # unknown -> ignore
+                pass
+
+        if ret and self._flip_bits:
+            ret = self.do_flip_bits(ret)
+
+        return ret
+
+    def decodeBM2A(self, code:bytes) -> str:
+        ret = ''
+
+        if self._flip_bits:
+            code = self.do_flip_bits(code)
+
+        for b in code:
+            try:
+                if b in self._LUT_BMsw:
+                    mode = self._LUT_BMsw.index(b)
+                    if self._mode != mode:
+                        self._mode = mode
+                        if self._show_BuZi == 0: # no BuZi
+                            continue
+                    if self._show_BuZi <= 1: # explicit BuZi
+                        continue
+
+                if b >= 0x20:
+                    ret += '{?#' + hex(b)[2:] + '}'
+                elif self._mode is None:
+                    ret += '{?'
+                    ret += self._LUT_BM2A[0][b]
+                    ret += self._LUT_BM2A[1][b]
+                    ret += '}'
+                else:
+                    ret += self._LUT_BM2A[self._mode][b]
+            except:
+                ret += '{!}'  # debug
+
+        return ret
+
+# =====
+
+def timed(func, repeat):
+    best = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        ret = func()
+        t = time.perf_counter() - t
+        best = t if best is None else min(best, t)
+    return best, ret
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark BaudotMurrayCode")
+    parser.add_argument('-n', type=int, default=100000, help="text length")
+    parser.add_argument('-r', type=int, default=5, help="repetitions (best is shown)")
+    args = parser.parse_args()
+
+    sample = "RYRY the quick brown fox jumps over the lazy dog 0123456789 (+-=:/?.,') \r\n"
+    text = (sample * (args.n // len(sample) + 1))[:args.n]
+    codings = (
+        ('ITA2', txCode.BaudotMurrayCode.CODING_ITA2),
+        ('US', txCode.BaudotMurrayCode.CODING_US),
+        ('MKT2', txCode.BaudotMurrayCode.CODING_MKT2),
+        ('ZUSE', txCode.BaudotMurrayCode.CODING_ZUSE),
+    )
+
+    print("{:14} {:>10} {:>10} {:>8}".format("", "legacy", "current", "speedup"))
+    for name, coding in codings:
+        for flip in (False, True):
+            label = name + (" flip" if flip else "")
+
+            # Each run starts from a fresh instance (mode unknown)
+            t_old, enc_old = timed(lambda: LegacyBaudotMurrayCode(coding=coding, flip_bits=flip).encodeA2BM(text), args.r)
+            t_new, enc_new = timed(lambda: txCode.BaudotMurrayCode(coding=coding, flip_bits=flip).encodeA2BM(text), args.r)
+            if enc_old != enc_new:
+                sys.exit("encodeA2BM output differs for " + label)
+            print("{:14} {:8.1f}ms {:8.1f}ms {:7.1f}x".format("enc " + label, t_old * 1000, t_new * 1000, t_old / t_new))
+
+            t_old, dec_old = timed(lambda: LegacyBaudotMurrayCode(coding=coding, flip_bits=flip).decodeBM2A(enc_old), args.r)
+            t_new, dec_new = timed(lambda: txCode.BaudotMurrayCode(coding=coding, flip_bits=flip).decodeBM2A(enc_old), args.r)
+            if dec_old != dec_new:
+                sys.exit("decodeBM2A output differs for " + label)
+            print("{:14} {:8.1f}ms {:8.1f}ms {:7.1f}x".format("dec " + label, t_old * 1000, t_new * 1000, t_old / t_new))
+
+    code = bytes(range(32)) * (args.n // 32 + 1)
+    t_old, flip_old = timed(lambda: LegacyBaudotMurrayCode.do_flip_bits(code), args.r)
+    t_new, flip_new = timed(lambda: txCode.BaudotMurrayCode.do_flip_bits(code), args.r)
+    if flip_old != flip_new:
+        sys.exit("do_flip_bits output differs")
+    print("{:14} {:8.1f}ms {:8.1f}ms {:7.1f}x".format("flip bits", t_old * 1000, t_new * 1000, t_old / t_new))
+
+    # Bulk transcoding, e.g. a punch tape file read line by line
+    lines = text.split('\n')
+    t_old, enc_old = timed(lambda: [mc.encodeA2BM(line) for mc in [LegacyBaudotMurrayCode(flip_bits=True)] for line in lines], args.r)
+    t_new, enc_new = timed(lambda: txCode.BaudotMurrayCode(flip_bits=True).encode_many(lines), args.r)
+    if enc_old != enc_new:
+        sys.exit("encode_many output differs")
+    print("{:14} {:8.1f}ms {:8.1f}ms {:7.1f}x".format("encode_many", t_old * 1000, t_new * 1000, t_old / t_new))
+    t_old, dec_old = timed(lambda: [mc.decodeBM2A(bb) for mc in [LegacyBaudotMurrayCode(flip_bits=True)] for bb in enc_old], args.r)
+    t_new, dec_new = timed(lambda: txCode.BaudotMurrayCode(flip_bits=True).decode_many(enc_old), args.r)
+    if dec_old != dec_new:
+        sys.exit("decode_many output differs")
+    print("{:14} {:8.1f}ms {:8.1f}ms {:7.1f}x".format("decode_many", t_old * 1000, t_new * 1000, t_old / t_new))
+
+    # Text normalisation, e.g. news feeds
+    feed = "Grüße aus Würzburg – „Fernschreiber“ & Co. kosten 50€ (½ Preis)!\n"
+    feed = (feed * (args.n // len(feed) + 1))[:args.n]
+    t_old, tty_old = timed(lambda: LegacyBaudotMurrayCode.ascii_to_tty_text(feed), args.r)
+    t_new, tty_new = timed(lambda: txCode.BaudotMurrayCode.ascii_to_tty_text(feed), args.r)
+    if tty_old != tty_new:
+        sys.exit("ascii_to_tty_text output differs")
+    print("{:14} {:8.1f}ms {:8.1f}ms {:7.1f}x".format("tty text", t_old * 1000, t_new * 1000, t_old / t_new))
+
+    print("output identical")
+
+
+if __name__ == '__main__':
+    main()
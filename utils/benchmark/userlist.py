@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark of local user list (userlist.csv) lookups by the i-Telex client
+against the size of the list
+
+For each size, a user list with that many entries is written to a temporary
+file and looked up:
+
+- legacy: list of user dicts, scanned linearly for each dial (as before
+  txUserList; the former code read the file only once, too)
+- exact: txUserList.UserList.find (dict index, incl. the check for a changed
+  file)
+- prefix: txUserList.UserList.find_abbreviated with a unique prefix
+  (abbreviated dialling)
+
+Also shown: time to load and index the file, which now happens once and
+again only when the file changes.
+
+How to use (from the piTelex directory):
+
+    python3 utils/benchmark/userlist.py [-s 100 1000 10000] [-n LOOKUPS]
+"""
+
+import argparse
+import csv
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import txUserList
+
+#######
+
+def write_userlist(file_name, size):
+    """Write user list with size entries; return list of their numbers."""
+    numbers = []
+    with open(file_name, 'w') as f:
+        f.write('Nick,TNum,ENum,Type,Host,Port,Name\n')
+        for i in range(size):
+            number = str(100000 + i * 7)
+            numbers.append(number)
+            f.write('USER{:06}XY, {}, -, I, host{}.example.org, 134, "User {}, Somewhere"\n'.format(i, number, i, i))
+    return numbers
+
+
+def legacy_load(file_name):
+    users = []
+    with open(file_name, 'r') as f:
+        dialect = csv.Sniffer().sniff(f.read(1024))
+        f.seek(0)
+        for user in csv.DictReader(f, dialect=dialect, skipinitialspace=True):
+            users.append(dict(user))
+    return users
+
+
+def legacy_find(users, number):
+    for user in users:
+        if number == user['Nick'] or number == user['TNum']:
+            return user
+    return None
+
+
+def timed(func, keys):
+    t = time.perf_counter()
+    found = 0
+    for key in keys:
+        if func(key):
+            found += 1
+    t = time.perf_counter() - t
+    if found != len(keys):
+        sys.exit("{}: {} of {} found".format(func.__name__, found, len(keys)))
+    return t * 1e6 / len(keys)
+
+# =====
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark user list lookups")
+    parser.add_argument('-s', type=int, nargs='+', default=[10, 100, 1000, 10000], help="user list sizes")
+    parser.add_argument('-n', type=int, default=2000, help="lookups per size")
+    args = parser.parse_args()
+
+    logging.getLogger().addHandler(logging.NullHandler())
+    file_name = os.path.join(tempfile.mkdtemp(), 'userlist.csv')
+
+    print("{:>7} {:>10} {:>12} {:>12} {:>12}".format('entries', 'load ms', 'legacy us', 'exact us', 'prefix us'))
+    for size in args.s:
+        numbers = write_userlist(file_name, size)
+        keys = [random.choice(numbers) for _ in range(args.n)]
+        # Nicks are 'USER<6 digits>XY', so 'USER<6 digits>' is a unique
+        # prefix, but no nick by itself
+        prefixes = ['USER{:06}'.format(random.randrange(size)) for _ in range(args.n)]
+
+        legacy_users = legacy_load(file_name)
+        legacy = timed(lambda key: legacy_find(legacy_users, key), keys)
+
+        t = time.perf_counter()
+        users = txUserList.UserList(file_name)
+        users.find('')
+        load = (time.perf_counter() - t) * 1000
+        exact = timed(users.find, keys)
+        prefix = timed(users.find_abbreviated, prefixes)
+
+        print("{:7} {:10.2f} {:12.2f} {:12.2f} {:12.2f}".format(size, load, legacy, exact, prefix))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Stress test of the i-Telex Acknowledge counter with a long inbound telex
+
+A simulated remote sends a long telex (default 100 kB) as Baudot Data
+packets, as fast as possible, to TelexITelexCommon's connection handling
+(connection_steps, as a client connection; no network involved). A
+simulated main loop moves the received characters into a simulated
+teleprinter buffer of limited size, so that the backlog piles up in the rx
+buffer. The teleprinter prints some characters per step and reports its
+buffer length by ESC-~, which makes the module recalculate its Acknowledge
+counter.
+
+Checked:
+- all characters arrive in order
+- the Acknowledge counters sent are monotonic and the last one equals the
+  number of characters received (modulo 256)
+
+Measured: time spent in update_acknowledge_counter (with the rx lock held),
+for the current implementation and, on a shorter telex, the former one which
+counted the unread characters by scanning the whole rx buffer.
+
+How to use (from the piTelex directory):
+
+    python3 utils/i-Telex/ack_stress.py [-k KBYTES] [--legacy-k KBYTES]
+"""
+
+import argparse
+import logging
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import txBuffer
+import txCode
+import txITelexPacket
+from txDevITelexCommon import TelexITelexCommon
+
+#######
+
+class RemoteSocket:
+    """Receiving end of the simulated remote, only decodes what's sent"""
+    def __init__(self):
+        self.decoder = txITelexPacket.PacketDecoder()
+        self.acks = []
+
+    def sendall(self, data:bytes):
+        for packet in self.decoder.feed(data):
+            if isinstance(packet, txITelexPacket.Ack):
+                self.acks.append(packet.counter)
+
+
+def legacy_update_acknowledge_counter(self, print_buf_len):
+    """update_acknowledge_counter as it was before CountingBuffer"""
+    with self._rx_lock:
+        rx_buffer_unread = len([i for i in self._rx_buffer if not i.startswith("\x1b")])
+        self._acknowledge_counter = self._received_counter - print_buf_len - rx_buffer_unread
+        if self._acknowledge_counter < self._last_acknowledge_counter:
+            self._acknowledge_counter = self._last_acknowledge_counter
+        else:
+            self._last_acknowledge_counter = self._acknowledge_counter
+
+# =====
+
+def run(name, text, legacy, printer_size, print_rate):
+    dev = TelexITelexCommon()
+    dev.id = 'iTc'
+    if legacy:
+        dev._rx_buffer = txBuffer.Buffer()
+        update = lambda n: legacy_update_acknowledge_counter(dev, n)
+    else:
+        update = dev.update_acknowledge_counter
+
+    ack_time = [0.0, 0]
+    def timed_update(print_buf_len):
+        t = time.perf_counter()
+        update(print_buf_len)
+        ack_time[0] += time.perf_counter() - t
+        ack_time[1] += 1
+    dev.update_acknowledge_counter = timed_update
+
+    remote = RemoteSocket()
+    steps = dev.connection_steps(remote, False, False)
+    next(steps)
+
+    # Same coding as i-Telex (see connection_steps)
+    mc = txCode.BaudotMurrayCode(False, False, True)
+    codes = mc.encodeA2BM(text)
+    packets = txBuffer.Buffer(bytes([2, len(codes[i:i+50])]) + codes[i:i+50] for i in range(0, len(codes), 50))
+
+    printer = txBuffer.Buffer()
+    printed = []
+    max_backlog = 0
+    step = 0
+    t = time.perf_counter()
+    while packets or dev._rx_buffer or printer:
+        # Remote sends without waiting for Acknowledge
+        if packets:
+            steps.send(packets.popleft())
+        else:
+            steps.throw(socket.timeout("timed out"))
+        max_backlog = max(max_backlog, len(dev._rx_buffer))
+
+        # Main loop: hand on to teleprinter as long as its buffer has room
+        with dev._rx_lock:
+            while dev._rx_buffer and len(printer) < printer_size:
+                a = dev._rx_buffer.popleft()
+                if a == '\x1bA':
+                    dev.write('\x1bAA', 'Prn')   # printer started
+                elif len(a) == 1:
+                    printer.append(a)
+
+        # Teleprinter prints and reports its buffer length
+        for _ in range(min(print_rate, len(printer))):
+            printed.append(printer.popleft())
+            dev.write('\x1b~' + str(len(printer)), 'Prn')
+
+        step += 1
+        if step % 5 == 0:
+            dev.idle2Hz()
+    # Last Acknowledge after everything has been printed
+    for _ in range(5):
+        steps.throw(socket.timeout("timed out"))
+    t = time.perf_counter() - t
+
+    # Checks
+    received = txCode.BaudotMurrayCode(False, False, True).decodeBM2A(codes).replace('@', '#')
+    if ''.join(printed) != received:
+        sys.exit("{}: printed text differs from sent text".format(name))
+    for a, b in zip(remote.acks, remote.acks[1:]):
+        if (b - a) & 0xFF > 0x80:
+            sys.exit("{}: Acknowledge counter not monotonic ({} -> {})".format(name, a, b))
+    if not remote.acks or remote.acks[-1] != len(received) & 0xFF:
+        sys.exit("{}: last Acknowledge {} != {} & 0xFF".format(name, remote.acks[-1:], len(received)))
+
+    print("{:8} {:4d} kB  {:7.2f} s total  {:6d} ack updates  {:8.2f} us/update  "
+        "(max backlog {}, {} Acknowledge sent)".format(
+        name, len(text) // 1024, t, ack_time[1], ack_time[0] * 1e6 / ack_time[1],
+        max_backlog, len(remote.acks)))
+    return ack_time[0] / ack_time[1]
+
+
+def make_text(kbytes):
+    line = "RYRY THE QUICK BROWN FOX JUMPS OVER THE LAZY DOG 0123456789\r\n"
+    return (line * (kbytes * 1024 // len(line) + 1))[:kbytes * 1024]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress test i-Telex Acknowledge counter")
+    parser.add_argument('-k', type=int, default=100, help="telex size in kB")
+    parser.add_argument('--legacy-k', type=int, default=10, help="telex size in kB for the former implementation (0: skip)")
+    parser.add_argument('--printer-size', type=int, default=64, help="teleprinter buffer size")
+    parser.add_argument('--print-rate', type=int, default=8, help="characters printed per step")
+    args = parser.parse_args()
+
+    logging.getLogger().addHandler(logging.NullHandler())
+    logging.getLogger("piTelex").setLevel(logging.WARNING)
+
+    run('current', make_text(args.k), False, args.printer_size, args.print_rate)
+    if args.legacy_k:
+        current = run('current', make_text(args.legacy_k), False, args.printer_size, args.print_rate)
+        legacy = run('legacy', make_text(args.legacy_k), True, args.printer_size, args.print_rate)
+        print("update_acknowledge_counter {:.0f}x faster at {} kB".format(legacy / current, args.legacy_k))
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
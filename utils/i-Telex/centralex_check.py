@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Check the reconnect handling of the Centralex module (TelexITelexCentralex)
+against a fake Centralex server (see fake_centralex.py)
+
+How to use (from the piTelex directory):
+
+    python3 utils/i-Telex/centralex_check.py
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import txDevITelexCentralex
+from txDevITelexCentralex import CTX_ST
+from fake_centralex import FakeCentralex
+from checklib import check, wait_for, finish
+
+def wait_connects(ctx, n, timeout):
+    return wait_for(lambda: len(ctx.connects) >= n, timeout)
+
+#######
+
+def main():
+    logging.basicConfig(level=logging.CRITICAL)
+
+    # Backoff alone
+    backoff = txDevITelexCentralex.Backoff(1, 8)
+    delays = [backoff.next() for _ in range(6)]
+    check("backoff grows, with jitter", all(0.5 * d <= x <= d for x, d in zip(delays, [1, 2, 4, 8, 8, 8])))
+    backoff.reset()
+    check("backoff reset", backoff.next() <= 1)
+
+    ctx = FakeCentralex().start()
+    srv = txDevITelexCentralex.TelexITelexCentralex(
+        centralex_srv='127.0.0.1', centralex_port=ctx.port, tns_dynip_number=12345, tns_pin=4711,
+        centralex_reconnect_min=0.2, centralex_reconnect_max=1.0)
+    try:
+        run(ctx, srv)
+    finally:
+        srv.exit()
+        ctx.stop()
+    finish()
+
+
+def run(ctx, srv):
+    # Standby
+    check("connects and authenticates", ctx.standby(2) and ctx.connects[0][1:] == (12345, 4711))
+    check("state STANDBY", wait_for(lambda: srv._ctx_st == CTX_ST.STANDBY, 1))
+
+    # Incoming call
+    check("incoming call accepted", ctx.call())
+    check("call ended with 'nc'", wait_for(lambda: ctx.ends and ctx.ends[-1][1] == 'nc', 2))
+    t_end = ctx.ends[-1][0]
+    check("reconnected after call", wait_connects(ctx, 2, 2))
+    check("  right away ({:.3f} s)".format(ctx.connects[1][0] - t_end), ctx.connects[1][0] - t_end < 0.2)
+
+    # Connection lost
+    ctx.standby(1)
+    ctx.drop()
+    t = time.monotonic()
+    check("reconnected after connection lost", wait_connects(ctx, 3, 2))
+    check("  after backoff ({:.3f} s)".format(ctx.connects[2][0] - t), 0.1 <= ctx.connects[2][0] - t < 0.5)
+
+    # Rejected: growing delays
+    ctx.standby(1)
+    ctx.reject = 'na'
+    ctx.drop()
+    wait_connects(ctx, 7, 5)
+    times = [c[0] for c in ctx.connects[3:7]]
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    check("rejected: retries with growing delays {}".format(' '.join('{:.2f}'.format(g) for g in gaps)),
+        len(gaps) == 3 and gaps[0] < gaps[2])
+    ctx.reject = None
+    check("recovers when accepted again", ctx.standby(3))
+    check("  backoff reset", wait_for(lambda: srv._ctx_backoff.failures == 0, 1))
+
+    # Outgoing call
+    n = len(ctx.connects)
+    srv.write('\x1bA', 'MCP')
+    check("outgoing call: Centralex told 'occ'", wait_for(lambda: ctx.ends and ctx.ends[-1][1] == 'occ', 1))
+    check("  state BUSY", wait_for(lambda: srv._ctx_st == CTX_ST.BUSY, 1))
+    time.sleep(0.5)
+    check("  no reconnect while busy", len(ctx.connects) == n)
+    t = time.monotonic()
+    srv.write('\x1bZ', 'MCP')
+    check("  reconnected when call ended", wait_connects(ctx, n + 1, 1))
+    check("    right away ({:.3f} s)".format(ctx.connects[-1][0] - t), ctx.connects[-1][0] - t < 0.2)
+
+    # Statistics
+    stats = srv.centralex_stats()
+    print(srv.centralex_stats_text())
+    check("statistics", stats['calls'] == 1 and stats['auth_rejects'] >= 4 and stats['connection_lost'] >= 1)
+
+    # Exit while waiting for backoff
+    ctx.reject = 'na'
+    ctx.drop()
+    time.sleep(0.3)
+    t = time.monotonic()
+    srv.exit()
+    thread = [th for th in threading.enumerate() if th.name == 'iTelexCtxHC']
+    if thread:
+        thread[0].join(2)
+    check("exit stops thread at once ({:.3f} s)".format(time.monotonic() - t),
+        not thread or not thread[0].is_alive() and time.monotonic() - t < 0.5)
+
+
+if __name__ == '__main__':
+    main()
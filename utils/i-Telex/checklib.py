@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Helpers shared by the offline check scripts (*_check.py)
+
+Each check prints one line, "ok" or "FAILED"; finish() prints the summary
+and exits with 1 if any check failed:
+
+    from checklib import check, wait_for, free_port, finish
+
+    check("answer received", wait_for(lambda: answer, 2))
+    finish()
+"""
+
+import socket
+import sys
+import time
+
+#######
+
+# Number of failed checks so far
+failed = 0
+
+def check(description, condition):
+    global failed
+    print("{:60} {}".format(description, "ok" if condition else "FAILED"))
+    if not condition:
+        failed += 1
+
+
+def finish():
+    """Print summary and exit, with 1 if any check failed."""
+    print("FAILED: {}".format(failed) if failed else "OK")
+    sys.exit(1 if failed else 0)
+
+
+def wait_for(condition, timeout):
+    """Poll condition() until it's true; return False on timeout (s)."""
+    end = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > end:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def free_port():
+    """Return a TCP port on 127.0.0.1 that's free at the moment."""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
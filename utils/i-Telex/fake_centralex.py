@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Fake i-Telex Centralex server for tests of the Centralex module
+(TelexITelexCentralex) without the real one
+
+Accepts Connect Remote (0x81) and answers Remote Confirm (0x82), or Reject
+(0x04) if told so. Connected clients get a Heartbeat every hb_interval
+seconds. A test can put a call through (Remote Call 0x83, caller hangs up
+right after Accept Call Remote 0x84), drop all connections, or reject
+clients. All connections and End packets received are recorded.
+
+Use it from a test script:
+
+    ctx = FakeCentralex().start()
+    ... ctx.port, ctx.connects, ctx.call(), ctx.drop() ...
+    ctx.stop()
+
+or run it (from the piTelex directory) to see a module connect, e.g.
+
+    python3 utils/i-Telex/fake_centralex.py --port 49491
+"""
+
+import argparse
+import socket
+import threading
+import time
+
+#######
+
+class FakeCentralex:
+    def __init__(self, port:int=0, hb_interval:float=10.0, host:str='127.0.0.1'):
+        """
+        port: port to listen on (0: any free one, see self.port)
+        hb_interval: seconds between Heartbeats sent to the clients
+        """
+        self.hb_interval = hb_interval
+        # Answer Connect Remote by Reject with this reason (None: confirm)
+        self.reject = None
+        # (time, number, pin) of every Connect Remote received
+        self.connects = []
+        # (time, reason) of every End received
+        self.ends = []
+        # Calls put through (Accept Call Remote received)
+        self.calls = 0
+
+        # Confirmed clients in standby: socket list
+        self._clients = []
+        # Clients that have accepted a call
+        self._in_call = set()
+        self._lock = threading.Lock()
+        self._accepted = threading.Condition(self._lock)
+
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((host, port))
+        self._server.listen(16)
+        self.port = self._server.getsockname()[1]
+        self._run = True
+
+
+    def start(self):
+        threading.Thread(target=self._accept, name='FakeCtx', daemon=True).start()
+        threading.Thread(target=self._heartbeat, name='FakeCtxHB', daemon=True).start()
+        return self
+
+
+    def stop(self):
+        self._run = False
+        try:
+            self._server.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._server.close()
+        self.drop()
+
+
+    def standby(self, timeout:float=0) -> bool:
+        """Return True if a client is in standby; wait up to timeout s."""
+        with self._lock:
+            return self._accepted.wait_for(lambda: self._clients, timeout)
+
+
+    def drop(self):
+        """Close all client connections without notice."""
+        with self._lock:
+            clients, self._clients = self._clients, []
+        for client in clients:
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            client.close()
+
+
+    def call(self, timeout:float=2.0) -> bool:
+        """
+        Put a call through to the client in standby. The caller hangs up as
+        soon as the call has been accepted. Return True if it was accepted.
+        """
+        with self._lock:
+            if not self._accepted.wait_for(lambda: self._clients, timeout):
+                return False
+            client = self._clients.pop(0)
+        # The client's reader thread sees Accept Call Remote and ends the call
+        client.sendall(bytes([0x83, 0x00]))
+        end = time.monotonic() + timeout
+        while time.monotonic() < end:
+            if client in self._in_call:
+                return True
+            time.sleep(0.01)
+        return False
+
+    # =====
+
+    def _accept(self):
+        while self._run:
+            try:
+                client, _ = self._server.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._handle, args=(client,), daemon=True).start()
+
+
+    def _recv_packet(self, client):
+        header = self._recv_exactly(client, 2)
+        if not header:
+            return None
+        return header + self._recv_exactly(client, header[1])
+
+
+    def _recv_exactly(self, client, size):
+        data = b''
+        while len(data) < size:
+            chunk = client.recv(size - len(data))
+            if not chunk:
+                return b''
+            data += chunk
+        return data
+
+
+    def _handle(self, client):
+        client.settimeout(None)
+        try:
+            packet = self._recv_packet(client)
+            if not packet or packet[0] != 0x81 or len(packet) < 8:
+                client.close()
+                return
+            number = int.from_bytes(packet[2:6], 'little')
+            pin = int.from_bytes(packet[6:8], 'little')
+            self.connects.append((time.monotonic(), number, pin))
+
+            if self.reject:
+                reason = self.reject.encode('ASCII')
+                client.sendall(bytes([0x04, len(reason)]) + reason)
+                client.close()
+                return
+
+            client.sendall(bytes([0x82, 0x00]))
+            with self._lock:
+                self._clients.append(client)
+                self._accepted.notify_all()
+
+            while True:
+                packet = self._recv_packet(client)
+                if not packet:
+                    break
+                if packet[0] == 0x84:
+                    # Accept Call Remote: the caller hangs up at once
+                    self.calls += 1
+                    self._in_call.add(client)
+                    client.sendall(bytes([0x03, 0x00]))
+                elif packet[0] == 0x03:
+                    # End; after a call, the client sends one for the call
+                    # and one ('nc') for the Centralex connection
+                    self.ends.append((time.monotonic(), packet[2:].decode('ASCII', errors='ignore')))
+        except OSError:
+            pass
+        with self._lock:
+            if client in self._clients:
+                self._clients.remove(client)
+        client.close()
+
+
+    def _heartbeat(self):
+        while self._run:
+            time.sleep(self.hb_interval)
+            with self._lock:
+                clients = list(self._clients)
+            for client in clients:
+                try:
+                    client.sendall(bytes([0x00, 0x00]))
+                except OSError:
+                    pass
+
+# =====
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake i-Telex Centralex server")
+    parser.add_argument('--port', type=int, default=49491)
+    parser.add_argument('--reject', help="reject clients with this reason")
+    args = parser.parse_args()
+
+    ctx = FakeCentralex(args.port).start()
+    ctx.reject = args.reject
+    print("Fake Centralex listening on port {}".format(ctx.port))
+    n = 0
+    try:
+        while True:
+            time.sleep(1)
+            if len(ctx.connects) != n:
+                n = len(ctx.connects)
+                print("{} connects, last: number {}, pin {}".format(n, *ctx.connects[-1][1:]))
+    except KeyboardInterrupt:
+        ctx.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Fake i-Telex peer to check the send pacing (txITelexFlow) of piTelex
+
+Starts an i-Telex server module (TelexITelexSrv) on localhost, calls it as
+a simulated remote teleprinter and has the module send it a text. The
+remote "prints" one character per character time (7.5 bit at the given
+baud rate) from its buffer and sends Acknowledge packets like a real
+i-Telex station.
+
+Shown afterwards:
+- remote: maximum buffer fill (overrun if above --peer-buffer), time the
+  teleprinter stood idle although text was still to come (gaps), effective
+  printing rate
+- piTelex: the flow control statistics of the connection
+
+How to use (from the piTelex directory):
+
+    python3 utils/i-Telex/fake_peer.py [--baud 50] [--window 10] [-n CHARS]
+
+A remote faster than 50 Bd is e.g. a computer service (--baud 200). piTelex
+learns its speed from the Acknowledge packets; as it sends at most every
+0.2 s, such a remote needs a larger window (--window 20) to print without
+gaps.
+"""
+
+import argparse
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import txBuffer
+import txITelexPacket
+import txDevITelexSrv
+
+#######
+
+class MainLoop(threading.Thread):
+    """Just enough of telex.py and MCP to let the server module run a call"""
+    def __init__(self, srv):
+        super().__init__(name='MainLoop', daemon=True)
+        self.srv = srv
+        self.running = True
+
+    def run(self):
+        while self.running:
+            for a in self.srv.read_batch():
+                if a == '\x1bA':
+                    self.srv.write('\x1bAA', 'MCP')   # printer started
+                elif a == '\x1bI':
+                    self.srv.write('\x1bWELCOME', 'MCP')   # no banner
+            time.sleep(0.01)
+
+
+class Peer:
+    """Simulated remote teleprinter"""
+    def __init__(self, port, baud, ack_interval, peer_buffer):
+        self.char_time = 7.5 / baud
+        self.ack_interval = ack_interval
+        self.peer_buffer = peer_buffer
+        self.s = socket.create_connection(('127.0.0.1', port))
+        self.s.settimeout(0.01)
+        self.decoder = txITelexPacket.PacketDecoder()
+
+        self.buffer = txBuffer.Buffer()
+        self.received = 0
+        self.printed = 0
+        self.max_fill = 0
+        self.overruns = 0
+        self.gap_time = 0.0
+        self.first_print = None
+        self.last_print = None
+
+
+    def call(self):
+        self.s.sendall(bytes([7, 1, 1]))    # Version 1
+        self.s.sendall(bytes([1, 1, 0]))    # Direct Dial 0
+
+
+    def run(self, expected, timeout):
+        next_print = None
+        next_ack = time.monotonic() + self.ack_interval
+        end = time.monotonic() + timeout
+        while self.printed < expected and time.monotonic() < end:
+            try:
+                data = self.s.recv(4096)
+            except socket.timeout:
+                data = b''
+            now = time.monotonic()
+            for packet in self.decoder.feed(data):
+                if isinstance(packet, txITelexPacket.BaudotData):
+                    if not self.buffer and next_print is not None and now > next_print:
+                        # Printer was idle waiting for data
+                        self.gap_time += now - next_print
+                        next_print = now
+                    self.buffer.extend(packet.payload)
+                    self.received += len(packet.payload)
+                    if len(self.buffer) > self.peer_buffer:
+                        self.overruns += 1
+                    self.max_fill = max(self.max_fill, len(self.buffer))
+
+            # Print
+            if self.buffer and next_print is None:
+                next_print = now
+            while self.buffer and now >= next_print:
+                self.buffer.popleft()
+                self.printed += 1
+                if self.first_print is None:
+                    self.first_print = next_print
+                self.last_print = next_print
+                next_print += self.char_time
+
+            # Acknowledge
+            if now >= next_ack:
+                self.s.sendall(bytes([6, 1, self.printed & 0xFF]))
+                next_ack += self.ack_interval
+
+
+    def close(self):
+        self.s.sendall(bytes([3, 0]))    # End
+        self.s.close()
+
+# =====
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake i-Telex peer for send pacing")
+    parser.add_argument('-n', type=int, default=60, help="number of characters to send")
+    parser.add_argument('--baud', type=float, default=50, help="remote teleprinter speed")
+    parser.add_argument('--window', type=int, default=10, help="piTelex send window")
+    parser.add_argument('--ack-interval', type=float, default=1.0, help="remote's Acknowledge interval, s")
+    parser.add_argument('--peer-buffer', type=int, default=64, help="remote's buffer size")
+    parser.add_argument('--port', type=int, default=23420, help="local port for the server module")
+    parser.add_argument('--asyncio', action='store_true', help="server module in asyncio mode")
+    parser.add_argument('-v', action='store_true', help="log level INFO")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.v else logging.WARNING)
+
+    srv = txDevITelexSrv.TelexITelexSrv(port=args.port, tns_pin=0, send_window=args.window, asyncio=args.asyncio)
+    main_loop = MainLoop(srv)
+    main_loop.start()
+
+    peer = Peer(args.port, args.baud, args.ack_interval, args.peer_buffer)
+    peer.call()
+    # Wait for connection to be set up (printer started, no welcome banner)
+    end = time.monotonic() + 5
+    while srv._connected < txDevITelexSrv.ST.CON_FULL and time.monotonic() < end:
+        time.sleep(0.05)
+    if srv._connected < txDevITelexSrv.ST.CON_FULL:
+        sys.exit("Connection not set up")
+
+    # Letters only, so that the number of characters sent equals the number
+    # of Baudot codes (plus one for the initial LTRS)
+    text = ("THE QUICK BROWN FOX JUMPS OVER THE LAZY DOG " * (args.n // 44 + 1))[:args.n]
+    srv.write_batch(list(text), 'Scrn')
+
+    nominal = args.n * 7.5 / args.baud
+    peer.run(args.n, timeout=nominal * 2 + 10)
+    stats = srv.send_flow.stats()
+    peer.close()
+    main_loop.running = False
+    time.sleep(0.5)
+    srv.exit()
+
+    print("remote:  {} Bd, {} of {} chars printed, buffer max {} ({} overruns), "
+        "gaps {:.2f} s".format(args.baud, peer.printed, args.n, peer.max_fill, peer.overruns, peer.gap_time))
+    if peer.printed > 1:
+        rate = (peer.printed - 1) / (peer.last_print - peer.first_print)
+        print("         printing rate {:.2f} chars/s, nominal {:.2f} chars/s".format(rate, args.baud / 7.5))
+    print("piTelex: {sent} chars in {packets} packets, window {window}, in flight avg "
+        "{unprinted_avg:.1f} max {unprinted_max} ({acks} acks), {char_time:.3f} s/char, "
+        "paused {paused} times".format(**stats))
+    if peer.printed < args.n or peer.overruns:
+        sys.exit("FAILED")
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
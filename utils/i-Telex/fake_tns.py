@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Fake i-Telex TNS (subscriber server) for tests without the real ones
+
+Answers binary Peer_query packets (0x03) by Peer_reply_v1 (0x05) or
+Peer_not_found (0x04), from a fixed list of entries, and Client_update
+packets (0x01) by Address_confirm (0x02) with a fixed address. Each server
+can be given a reply delay, or be made to accept connections but never
+answer. All queries and updates are recorded, so tests can count them.
+
+Use it from a test script:
+
+    tns = FakeTNS({'234200': ('FabLab', '127.0.0.1', 2342)}, delay=0.1)
+    tns.start()
+    ... tns.port, tns.queries ...
+    tns.stop()
+
+or run it (from the piTelex directory) to serve entries given on the
+command line, e.g.
+
+    python3 utils/i-Telex/fake_tns.py --port 11811 234200=FabLab,127.0.0.1,2342
+"""
+
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import txDevITelexCommon
+
+#######
+
+def peer_reply_v1(number:int, name:str, host:str, port:int, ext:str=None, entry_type:int=None) -> bytes:
+    """
+    Build Peer_reply_v1 packet. host is either an IPv4 address or a
+    hostname; entry_type defaults to 2 (Baudot, IP address) or 1 (Baudot,
+    hostname) accordingly.
+    """
+    try:
+        ip = bytes(int(i) for i in host.split('.'))
+        if len(ip) != 4:
+            raise ValueError
+        hostname = b''
+        if entry_type is None:
+            entry_type = 2
+    except ValueError:
+        ip = bytes(4)
+        hostname = host.encode('ISO8859-1')
+        if entry_type is None:
+            entry_type = 1
+
+    data = bytearray([0x05, 0x64])
+    data += int(number).to_bytes(4, 'little')
+    data += name.encode('ISO8859-1')[:40].ljust(40, b'\x00')
+    data += bytes(2)    # flags
+    data.append(entry_type)
+    data += hostname[:40].ljust(40, b'\x00')
+    data += ip
+    data += int(port).to_bytes(2, 'little')
+    data.append(txDevITelexCommon.encode_ext_for_direct_dial(ext))
+    data += bytes(2)    # PIN
+    data += bytes(4)    # date
+    return bytes(data)
+
+
+class FakeTNS:
+    def __init__(self, entries:dict, port:int=0, delay:float=0, silent:bool=False, host:str='127.0.0.1'):
+        """
+        entries: number (str) -> (name, host, port[, ext[, entry_type]])
+        port: port to listen on (0: any free one, see self.port)
+        host: address to listen on; as all TNS servers share one port in
+        piTelex, use 127.0.0.2, 127.0.0.3 etc. for several ones
+        delay: seconds to wait before answering
+        silent: accept connections, but never answer
+        """
+        self.entries = entries
+        self.delay = delay
+        self.silent = silent
+        # (time, number) of every query received
+        self.queries = []
+        # Address confirmed to Client_update (None: close without answer)
+        self.address = '127.0.0.1'
+        # (time, number, pin, port) of every Client_update received
+        self.updates = []
+        # Number of connections accepted (including probes without query)
+        self.connections = 0
+
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((host, port))
+        self._server.listen(16)
+        self.port = self._server.getsockname()[1]
+        self._run = True
+
+
+    def start(self):
+        threading.Thread(target=self._accept, name='FakeTNS', daemon=True).start()
+        return self
+
+
+    def stop(self):
+        self._run = False
+        # shutdown wakes up accept, close alone wouldn't stop listening
+        try:
+            self._server.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._server.close()
+
+
+    def _accept(self):
+        while self._run:
+            try:
+                client, _ = self._server.accept()
+            except OSError:
+                break
+            self.connections += 1
+            threading.Thread(target=self._handle, args=(client,), daemon=True).start()
+
+
+    def _handle(self, client):
+        with client:
+            client.settimeout(10)
+            try:
+                data = client.recv(1024)
+            except OSError:
+                return
+            if len(data) >= 10 and data[0] == 0x01:
+                self._handle_update(client, data)
+                return
+            if len(data) < 6 or data[0] != 0x03:
+                return   # probe or garbage
+            number = str(int.from_bytes(data[2:6], 'little'))
+            self.queries.append((time.monotonic(), number))
+            if self.silent:
+                time.sleep(10)
+                return
+            if self.delay:
+                time.sleep(self.delay)
+            entry = self.entries.get(number)
+            try:
+                if entry:
+                    client.sendall(peer_reply_v1(number, *entry))
+                else:
+                    client.sendall(bytes([0x04, 0x00]))
+            except OSError:
+                pass
+
+
+    def _handle_update(self, client, data):
+        self.updates.append((time.monotonic(), int.from_bytes(data[2:6], 'little'),
+            int.from_bytes(data[6:8], 'little'), int.from_bytes(data[8:10], 'little')))
+        if self.silent:
+            time.sleep(10)
+            return
+        if self.delay:
+            time.sleep(self.delay)
+        if self.address is None:
+            return
+        try:
+            client.sendall(bytes([0x02, 0x04]) + socket.inet_aton(self.address))
+        except OSError:
+            pass
+
+# =====
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake i-Telex TNS")
+    parser.add_argument('--port', type=int, default=11811)
+    parser.add_argument('--delay', type=float, default=0, help="reply delay, s")
+    parser.add_argument('entries', nargs='*', help="number=name,host,port[,ext]")
+    args = parser.parse_args()
+
+    entries = {}
+    for entry in args.entries:
+        number, _, fields = entry.partition('=')
+        fields = fields.split(',')
+        entries[number] = (fields[0], fields[1], int(fields[2])) + tuple(fields[3:4])
+
+    tns = FakeTNS(entries, args.port, args.delay).start()
+    print("Fake TNS listening on port {} with {} entries".format(tns.port, len(entries)))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        tns.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Check txITelexPacket.PacketDecoder against the i-Telex packet layouts
+
+Every case is fed to the decoder in one chunk, byte by byte and in random
+chunk sizes; the decoded packets must be the same each time.
+
+How to use (from the piTelex directory):
+
+    python3 utils/i-Telex/packet_check.py
+"""
+
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from txITelexPacket import (PacketDecoder, Heartbeat, DirectDial, BaudotData, End,
+    Reject, Ack, Version, SelfTest, RemoteConfig, AsciiData, TelnetCommand, InvalidPacket)
+
+#######
+
+CASES = (
+    # (description, received bytes, expected packets)
+    ("Heartbeat", b'\x00\x00', [Heartbeat(b'\x00\x00')]),
+    ("Direct Dial", b'\x01\x01\x0b', [DirectDial(b'\x01\x01\x0b')]),
+    ("Baudot Data", b'\x02\x03\x1f\x03\x19', [BaudotData(b'\x02\x03\x1f\x03\x19')]),
+    ("Baudot Data, 50 bytes", b'\x02\x32' + bytes(50), [BaudotData(b'\x02\x32' + bytes(50))]),
+    ("End", b'\x03\x00', [End(b'\x03\x00')]),
+    ("Reject", b'\x04\x03occ', [Reject(b'\x04\x03occ')]),
+    ("Acknowledge", b'\x06\x01\x2a', [Ack(b'\x06\x01\x2a')]),
+    ("Version", b'\x07\x07\x01pi003a', [Version(b'\x07\x07\x01pi003a')]),
+    ("Self Test", b'\x08\x04\xde\xca\xfb\xad', [SelfTest(b'\x08\x04\xde\xca\xfb\xad')]),
+    ("Remote Config", b'\x09\x03\x01\x02\x03', [RemoteConfig(b'\x09\x03\x01\x02\x03')]),
+    ("Heartbeat with payload", b'\x00\x01\x00', [InvalidPacket(b'\x00\x01\x00')]),
+    ("Baudot Data, empty", b'\x02\x00', [InvalidPacket(b'\x02\x00')]),
+    ("Baudot Data, 51 bytes", b'\x02\x33' + bytes(51), [InvalidPacket(b'\x02\x33' + bytes(51))]),
+    ("Unknown type 0x05", b'\x05\x01\x00', [InvalidPacket(b'\x05\x01\x00')]),
+    ("Unknown type 0x10", b'\x10\x02ab', [InvalidPacket(b'\x10\x02ab')]),
+    ("Resync after invalid packet", b'\x05\x02\x00\x00\x06\x01\x05', [InvalidPacket(b'\x05\x02\x00\x00'), Ack(b'\x06\x01\x05')]),
+    ("Telnet command", b'\xff\xfb\x01', [TelnetCommand(b'\xff\xfb\x01')]),
+    ("ASCII data", b'HELLO\r\n', [AsciiData(b'HELLO\r\n')]),
+    ("ASCII data around Telnet command", b'AB\xff\xfd\x03CD', [AsciiData(b'AB'), TelnetCommand(b'\xff\xfd\x03'), AsciiData(b'CD')]),
+    ("Packet sequence",
+        b'\x07\x01\x01\x01\x01\x00\x02\x02\x1f\x01\x06\x01\x00\x03\x00',
+        [Version(b'\x07\x01\x01'), DirectDial(b'\x01\x01\x00'), BaudotData(b'\x02\x02\x1f\x01'), Ack(b'\x06\x01\x00'), End(b'\x03\x00')]),
+)
+
+# =====
+
+def decode(data:bytes, sizes) -> list:
+    decoder = PacketDecoder()
+    packets = []
+    pos = 0
+    for size in sizes:
+        packets.extend(decoder.feed(data[pos:pos + size]))
+        pos += size
+    packets.extend(decoder.feed(data[pos:]))
+    return packets, decoder.pending()
+
+
+def main():
+    random.seed(0)
+    failed = 0
+
+    for desc, data, expected in CASES:
+        splits = {
+            "one chunk": [len(data)],
+            "byte by byte": [1] * len(data),
+        }
+        for n in range(5):
+            splits["random " + str(n)] = [random.randint(1, 4) for _ in range(len(data))]
+
+        for split, sizes in splits.items():
+            packets, pending = decode(data, sizes)
+            # ASCII runs may be cut where the chunks end; compare joined
+            joined = []
+            for packet in packets:
+                if joined and isinstance(packet, AsciiData) and isinstance(joined[-1], AsciiData):
+                    joined[-1] = AsciiData(joined[-1].raw + packet.raw)
+                else:
+                    joined.append(packet)
+            if joined != expected or pending:
+                print("FAIL {} ({}): {!r}, {} bytes pending".format(desc, split, packets, pending))
+                failed += 1
+
+    # Field access
+    assert DirectDial(b'\x01\x01\x0b').extension == 11
+    assert Reject(b'\x04\x04nc\x00\x00').reason == 'nc'
+    assert Ack(b'\x06\x01\x2a').counter == 42
+    assert Version(b'\x07\x07\x01pi003a').version == 1
+    assert Version(b'\x07\x07\x01pi003a').version_string == 'pi003a'
+    assert BaudotData(b'\x02\x02\x1f\x01').payload == b'\x1f\x01'
+
+    # Incomplete packet is kept
+    decoder = PacketDecoder()
+    assert decoder.feed(b'\x02\x05\x01\x02') == []
+    assert decoder.pending() == 4
+    assert decoder.feed(b'\x03\x04\x05\x00') == [BaudotData(b'\x02\x05\x01\x02\x03\x04\x05')]
+    assert decoder.pending() == 1
+
+    print("{} cases, {} failed".format(len(CASES), failed))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
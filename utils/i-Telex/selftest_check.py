@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Check the TNS update and connection self-test of the i-Telex server module
+(TelexITelexSrv) against a fake TNS server (see fake_tns.py)
+
+The intervals are shortened to fractions of a second, so the whole sequence
+(update, self-tests, failures, update triggered, self-tests suspended and
+resumed) runs within a few seconds.
+
+How to use (from the piTelex directory):
+
+    python3 utils/i-Telex/selftest_check.py
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import txAsync
+import txDevITelexSrv
+from fake_tns import FakeTNS
+from checklib import check, wait_for, free_port, finish
+
+#######
+
+def main():
+    logging.basicConfig(level=logging.CRITICAL)
+
+    txAsync.COALESCE = 0.05
+    txDevITelexSrv.TNS_UPDATE_INTERVAL = 60
+    txDevITelexSrv.SELFTEST_INTERVAL = 0.1
+
+    tns = FakeTNS({}).start()
+    common = dict(tns_srv=['127.0.0.1'], tns_port=tns.port, tns_pin=4711)
+    srvs = []
+    try:
+        # Reachable: public port is the one listened on
+        port = free_port()
+        srvs.append(txDevITelexSrv.TelexITelexSrv(port=port, tns_dynip_number=12345, **common))
+        port_async = free_port()
+        srvs.append(txDevITelexSrv.TelexITelexSrv(port=port_async, tns_dynip_number=12346, asyncio=True, **common))
+        # Not reachable: public port not forwarded to the local one
+        srvs.append(txDevITelexSrv.TelexITelexSrv(local_port=free_port(), public_port=free_port(),
+            tns_dynip_number=12347, **common))
+        run(tns, srvs, port)
+    finally:
+        for srv in srvs:
+            srv.exit()
+        tns.stop()
+    finish()
+
+
+def run(tns, srvs, port):
+    srv, srv_async, srv_bad = srvs
+
+    # Shared scheduler
+    check("no thread per module", not any(t.name == 'iTelexTNSupd' for t in threading.enumerate()))
+    threads = set()
+    def note_thread(result):
+        threads.add(threading.current_thread().name)
+    for s in srvs:
+        s._selftest_job.add_listener(note_thread)
+
+    # TNS update on startup
+    check("TNS updated on startup", wait_for(lambda: len(tns.updates) >= 3, 2))
+    check("  with number, pin and port", any(u[1:] == (12345, 4711, port) for u in tns.updates))
+    check("  own IP address known", wait_for(lambda: srv.ip_address == '127.0.0.1', 1))
+
+    # Self-test
+    check("self-test successful", wait_for(lambda: srv._selftest_job.runs >= 3, 2)
+        and srv._selftest_job.result is True and srv.test_connection_fail == 0)
+    check("self-test successful (asyncio mode)", wait_for(lambda: srv_async._selftest_job.runs >= 3, 2)
+        and srv_async._selftest_job.result is True and srv_async.test_connection_fail == 0)
+    check("jobs run on the shared event loop", threads == {'txAsync'})
+    status = srv.tns_status()
+    print(status)
+    check("status cached", status['ip_address'] == '127.0.0.1' and status['tns_update']['runs'] == 1
+        and status['selftest']['time'] is not None)
+
+    # Failing self-test
+    updates = sum(1 for u in tns.updates if u[1] == 12347)
+    check("self-test fails 6x", wait_for(lambda: srv_bad.test_connection_fail >= 6, 3))
+    check("  TNS update triggered", wait_for(lambda: sum(1 for u in tns.updates if u[1] == 12347) > updates, 1))
+    check("self-test suspended after 12 fails", wait_for(lambda: srv_bad.test_connection_fail == 666, 3))
+    time.sleep(0.5)
+    check("  no connection tests while suspended",
+        srv_bad._selftest_job.result is None and srv_bad.test_connection_fail == 666)
+    srv_bad._tns_job.trigger()
+    check("  resumed after TNS update", wait_for(lambda: 0 < srv_bad.test_connection_fail < 666, 2))
+
+    # Sharing
+    job = txAsync.schedule(srv._tns_job.key, None, 1)
+    check("same job for same key", job is srv._tns_job)
+    job = txAsync.schedule(('selftest', port), srv_async.async_test_connection, 60)
+    check("bound method jobs not shared by instances", job is not srv._selftest_job)
+    txAsync.unschedule(job)
+
+    # Cancelled run
+    calls = []
+    async def cancelled_once():
+        calls.append(1)
+        if len(calls) == 1:
+            raise asyncio.CancelledError()
+    job = txAsync.schedule('cancelled_once', cancelled_once, 60, first=0)
+    wait_for(lambda: calls, 1)
+    job.trigger()
+    check("trigger works after a cancelled run", wait_for(lambda: len(calls) == 2, 1))
+    txAsync.unschedule(job)
+
+    # Exit
+    srv_bad._selftest_job.remove_listener(note_thread)
+    srv_bad.exit()
+    time.sleep(0.3)
+    runs = srv_bad._selftest_job.runs
+    time.sleep(0.5)
+    check("exit stops jobs", srv_bad._selftest_job.runs == runs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Check the TNS cache (txTNS.TNSCache) of the i-Telex client module against a
+fake TNS (see fake_tns.py)
+
+How to use (from the piTelex directory):
+
+    python3 utils/i-Telex/tns_check.py
+"""
+
+import logging
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import txTNS
+import txDevITelexClient
+from fake_tns import FakeTNS
+from checklib import check, finish
+
+ENTRIES = {
+    '234200': ('FabLab, Wuerzburg', '127.0.0.1', 2342),
+    '727272': ('DWD', 'dwd.example.org', 134, '11'),
+}
+
+def timed_get_user(number):
+    t = time.monotonic()
+    user = txDevITelexClient.TelexITelexClient.get_user(number)
+    return user, time.monotonic() - t
+
+#######
+
+def main():
+    logging.basicConfig(level=logging.CRITICAL)
+
+    tns = FakeTNS(ENTRIES, delay=0.2).start()
+    cache_file = os.path.join(tempfile.mkdtemp(), 'tns_cache.json')
+    client = txDevITelexClient.TelexITelexClient(
+        tns_srv=['127.0.0.1'], tns_port=tns.port, userlist=os.devnull,
+        tns_cache=cache_file, tns_cache_ttl=2, tns_cache_stale=60, tns_cache_negative_ttl=1,
+        tns_cache_ttl_dynamic=2)
+    Client = txDevITelexClient.TelexITelexClient
+
+    # Positive results
+    user, t = timed_get_user('234200')
+    check("first dial queries TNS", len(tns.queries) == 1 and user and user['Host'] == '127.0.0.1')
+    user, t = timed_get_user('234200')
+    check("redial served from cache, no query ({:.3f} s)".format(t), len(tns.queries) == 1 and user and t < 0.1)
+    user = Client.get_user('234200-12')
+    check("direct dial override doesn't change cache", user['ENum'] == '12' and Client.get_user('234200')['ENum'] is None)
+    user = Client.get_user('727272')
+    check("hostname and extension decoded", user['Host'] == 'dwd.example.org' and user['ENum'] == '11')
+
+    # Negative results
+    n = len(tns.queries)
+    check("unknown number not found", Client.get_user('99999') is None and len(tns.queries) == n + 1)
+    check("unknown number cached as not found", Client.get_user('99999') is None and len(tns.queries) == n + 1)
+    time.sleep(1.1)
+    Client.get_user('99999')
+    check("negative entry expires", len(tns.queries) == n + 2)
+
+    # Forced query
+    n = len(tns.queries)
+    Client.get_user('234200', tns_force=True)
+    check("tns_force bypasses cache", len(tns.queries) == n + 1)
+
+    # Stale-while-revalidate
+    time.sleep(2.1)
+    n = len(tns.queries)
+    user, t = timed_get_user('234200')
+    check("stale entry returned at once ({:.3f} s)".format(t), user and user['TNum'] == '234200' and t < 0.1)
+    time.sleep(0.5)
+    check("stale entry refreshed in background", len(tns.queries) == n + 1)
+    state, _ = Client._tns_cache.get('234200')
+    check("refreshed entry is fresh", state == txTNS.FRESH)
+
+    # Persistence
+    cache = txTNS.TNSCache(cache_file)
+    state, user = cache.get('234200')
+    check("cache file loaded", state == txTNS.FRESH and user['Name'] == 'FabLab, Wuerzburg')
+
+    # Dynamic IP entries
+    cache = txTNS.TNSCache(None, ttl=60, ttl_dynamic=0.5)
+    cache.put('1', {'Host': '127.0.0.1', 'Port': 1})
+    cache.put('2', {'Host': 'dwd.example.org', 'Port': 1})
+    time.sleep(0.6)
+    check("IP address entry refreshed after ttl_dynamic", cache.get('1')[0] == txTNS.STALE)
+    check("hostname entry still fresh", cache.get('2')[0] == txTNS.FRESH)
+
+    # Connect failure: cached address outdated
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    new_port = listener.getsockname()[1]
+    user = Client.get_user('234200-12')
+    ENTRIES['234200'] = ('FabLab, Wuerzburg', '127.0.0.1', new_port)
+    n = len(tns.queries)
+    retry = Client.requery_cached_user(user)
+    check("cached user queried again after connect failure",
+        len(tns.queries) == n + 1 and retry and retry['Port'] == new_port and retry['ENum'] == '12')
+    check("  cache updated", Client._tns_cache.get('234200')[1]['Port'] == new_port)
+    check("  no retry if address unchanged", Client.requery_cached_user(Client.get_user('234200')) is None)
+    check("  no retry for users not from cache", Client.requery_cached_user(dict(retry, Cached=None)) is None)
+    ENTRIES['234200'] = ('FabLab, Wuerzburg', '127.0.0.1', 2342)
+    Client.get_user('234200', tns_force=True)
+    ENTRIES['234200'] = ('FabLab, Wuerzburg', '127.0.0.1', new_port)
+    listener.settimeout(3)
+    thread = threading.Thread(target=client.thread_connect_as_client, args=(Client.get_user('234200'),))
+    thread.start()
+    try:
+        listener.accept()[0].close()
+        connected = True
+    except OSError:
+        connected = False
+    thread.join(10)
+    listener.close()
+    check("  dial connects to new address", connected)
+    ENTRIES['234200'] = ('FabLab, Wuerzburg', '127.0.0.1', 2342)
+
+    # TNS unreachable
+    tns.stop()
+    Client._tns_port = 1    # nothing listening
+    user, t = timed_get_user('234200')
+    check("cached number resolves without TNS", user and user['TNum'] == '234200')
+    check("uncached number fails without TNS", Client.get_user('11111') is None)
+    check("error is not cached as not found", Client._tns_cache.get('11111')[0] == txTNS.MISS)
+
+    client.exit()
+    finish()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Check parallel TNS queries (txTNS.first_answer, "tns_parallel") of the
+i-Telex client module against fake TNS servers (see fake_tns.py): one
+accepting connections but never answering, one slow and one fast
+
+How to use (from the piTelex directory):
+
+    python3 utils/i-Telex/tns_resolve_check.py
+"""
+
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import txTNS
+import txDevITelexClient
+from fake_tns import FakeTNS
+from checklib import check, free_port, finish
+
+ENTRIES = {
+    '234200': ('FabLab, Wuerzburg', '127.0.0.1', 2342),
+}
+
+def raises(f):
+    try:
+        f()
+    except Exception:
+        return True
+    return False
+
+
+def fail():
+    raise OSError("unreachable")
+
+#######
+
+def main():
+    logging.basicConfig(level=logging.CRITICAL)
+
+    # first_answer semantics
+    slow = lambda: time.sleep(0.5) or 'slow'
+    t = time.monotonic()
+    result = txTNS.first_answer([('a', slow), ('a', lambda: 'fast')], 2)
+    t = time.monotonic() - t
+    check("first answer wins ({:.3f} s)".format(t), result == 'fast' and t < 0.1)
+    check("positive answer beats \"not found\"", txTNS.first_answer([('a', lambda: None), ('b', slow)], 2) == 'slow')
+    check("\"not found\" if every key was not found", txTNS.first_answer([('a', lambda: None), ('a', fail), ('b', lambda: None)], 2) is None)
+    check("error if some key couldn't be asked", raises(lambda: txTNS.first_answer([('a', lambda: None), ('b', fail)], 2)))
+    t = time.monotonic()
+    check("error on deadline", raises(lambda: txTNS.first_answer([('a', lambda: time.sleep(5))], 0.3)))
+    check("...after the deadline ({:.3f} s)".format(time.monotonic() - t), time.monotonic() - t < 0.5)
+
+    # Client against fake TNS servers
+    port = free_port()
+    SILENT, SLOW, FAST = '127.0.0.1', '127.0.0.2', '127.0.0.3'
+    servers = [
+        FakeTNS(ENTRIES, port, host=SILENT, silent=True).start(),
+        FakeTNS(ENTRIES, port, host=SLOW, delay=0.5).start(),
+        FakeTNS(ENTRIES, port, host=FAST, delay=0.02).start(),
+    ]
+    txDevITelexClient.TelexITelexClient(tns_srv=[SILENT, SLOW, FAST], tns_port=port,
+        userlist=os.devnull, tns_cache='', tns_parallel=3, tns_timeout=2.0)
+    Client = txDevITelexClient.TelexITelexClient
+    Client.tns_servers().probe(wait=2)
+    Client.tns_servers().report_success(SILENT, 0.001)    # make it the best one
+
+    t = time.monotonic()
+    user = Client.get_user('0234200')
+    t = time.monotonic() - t
+    check("3 servers in parallel: fast one wins ({:.3f} s)".format(t), user and user['TNum'] == '234200' and t < 0.3)
+    check("leading zero variant not queried twice", len(servers[2].queries) == 1)
+    t = time.monotonic()
+    check("unknown number: \"not found\"", Client.get_user('99999') is None)
+    check("...as soon as all numbers have been answered ({:.3f} s)".format(time.monotonic() - t), time.monotonic() - t < 0.3)
+
+    Client._tns_parallel = 1
+    Client.tns_servers().report_success(SILENT, 0.001)
+    t = time.monotonic()
+    user = Client.get_user('234200')
+    t = time.monotonic() - t
+    check("1 server, not answering: fails at deadline ({:.3f} s)".format(t), user is None and 1.9 < t < 2.5)
+
+    for tns in servers:
+        tns.stop()
+    finish()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Check the TNS server health tracker (txTNS.TNSServers) against fake TNS
+servers (see fake_tns.py) on 127.0.0.1-3, one of them not running
+
+How to use (from the piTelex directory):
+
+    python3 utils/i-Telex/tns_servers_check.py
+"""
+
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import txTNS
+import txDevITelexClient
+import txDevITelexSrv
+from fake_tns import FakeTNS
+from checklib import check, free_port, finish
+
+ENTRIES = {
+    '234200': ('FabLab, Wuerzburg', '127.0.0.1', 2342),
+}
+
+#######
+
+def main():
+    logging.basicConfig(level=logging.CRITICAL)
+
+    port = free_port()
+    DEAD, UP1, UP2 = '127.0.0.2', '127.0.0.1', '127.0.0.3'
+    tns1 = FakeTNS(ENTRIES, port, host=UP1).start()
+    tns2 = FakeTNS(ENTRIES, port, host=UP2).start()
+
+    # Ranking
+    servers = txTNS.TNSServers([DEAD, UP1, UP2], port)
+    t = time.monotonic()
+    best = servers.best()
+    t = time.monotonic() - t
+    check("best() answers at once before first probe ({:.3f} s)".format(t), best == DEAD and t < 0.05)
+    check("first probe finishes within probe timeout", servers.probe(wait=2))
+    status = servers.status()
+    check("dead server detected", status[DEAD] is None and status[UP1] is not None and status[UP2] is not None)
+    check("dead server ranked last", servers.ranked()[-1] == DEAD and servers.best() != DEAD)
+
+    servers.report_success(UP1, 0.050)
+    servers.report_success(UP2, 0.010)
+    check("last good server is sticky", servers.best() == UP2)
+    servers.report_success(UP1, 0.050)
+    check("...also if slower", servers.best() == UP1)
+    servers.report_failure(UP1)
+    check("on failure, fastest other one used", servers.best() == UP2)
+
+    # Dialling with the first server down
+    txDevITelexClient.TelexITelexClient(tns_srv=[DEAD, UP1, UP2], tns_port=port, userlist=os.devnull, tns_cache='')
+    Client = txDevITelexClient.TelexITelexClient
+    t = time.monotonic()
+    user = Client.get_user('234200')
+    t = time.monotonic() - t
+    check("dial with first TNS down ({:.3f} s)".format(t), user and user['TNum'] == '234200' and t < 1.0)
+    Client._tns_cache = None
+    t = time.monotonic()
+    Client.get_user('234200')
+    t = time.monotonic() - t
+    check("redial ({:.3f} s)".format(t), t < 0.1)
+
+    # Failover when the server used goes down
+    used = Client.tns_servers().best()
+    (tns1 if used == UP1 else tns2).stop()
+    user = Client.get_user('234200')
+    other = UP2 if used == UP1 else UP1
+    check("failover to other server within the same query", user and Client.tns_servers().best() == other)
+
+    # Sharing
+    Srv = txDevITelexSrv.TelexITelexSrv
+    Srv._tns_addresses = [DEAD, UP1, UP2]
+    Srv._tns_port = port
+    check("tracker shared between i-Telex modules", Srv.tns_servers() is Client.tns_servers())
+
+    tns1.stop()
+    tns2.stop()
+    finish()
+
+
+if __name__ == '__main__':
+    main()